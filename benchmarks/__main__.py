@@ -0,0 +1,173 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from argparse import ArgumentParser, Namespace
+from dataclasses import fields
+from importlib.metadata import PackageNotFoundError, version
+from json import dumps, loads
+from pathlib import Path
+from platform import python_version
+from sys import exit  # pylint: disable=redefined-builtin
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, List, Optional
+
+from templtest.loader import LIBYAML
+
+from .inventory import generate_inventory, run_inventory_benchmark
+from .phases import PHASES, run_benchmark
+from .role import RoleParameters, generate_role
+
+
+def _parse_args(args: Optional[List[str]] = None) -> Namespace:
+    parser = ArgumentParser(prog="python -m benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate = subparsers.add_parser("generate", help="generate a synthetic role")
+    generate.add_argument("role_path", type=Path)
+    _add_parameters(generate)
+
+    run = subparsers.add_parser("run", help="time phases of a run")
+    _add_parameters(run)
+    run.add_argument(
+        "--role-path",
+        type=Path,
+        help="benchmark an existing role instead of a generated one",
+    )
+    run.add_argument("--repeat", type=int, default=5, metavar="N")
+    run.add_argument("--output", type=Path, metavar="FILE")
+
+    inventory = subparsers.add_parser(
+        "inventory", help="time loading of a large inventory file"
+    )
+    inventory.add_argument("--hosts", type=int, default=1000, metavar="N")
+    inventory.add_argument("--variables", type=int, default=20, metavar="N")
+    inventory.add_argument("--repeat", type=int, default=5, metavar="N")
+    inventory.add_argument("--output", type=Path, metavar="FILE")
+
+    compare = subparsers.add_parser("compare", help="compare results of two runs")
+    compare.add_argument("base", type=Path)
+    compare.add_argument("new", type=Path)
+    compare.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative slowdown of a phase median treated as a regression",
+    )
+    return parser.parse_args(args)
+
+
+def _add_parameters(parser: ArgumentParser) -> None:
+    for field in fields(RoleParameters):
+        parser.add_argument(
+            f"--{field.name.replace('_', '-')}",
+            type=int,
+            default=field.default,
+            metavar="N",
+        )
+
+
+def _get_parameters(args: Namespace) -> RoleParameters:
+    return RoleParameters(
+        **{field.name: getattr(args, field.name) for field in fields(RoleParameters)}
+    )
+
+
+def _get_version(package: str) -> str:
+    try:
+        return version(package)
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def _run(args: Namespace) -> Dict[str, Any]:
+    result: Dict[str, Any] = {
+        "versions": {
+            "python": python_version(),
+            **{
+                package: _get_version(package)
+                for package in ["templtest", "ansible-core", "jinja2"]
+            },
+            "libyaml": LIBYAML,
+        },
+        "repeat": args.repeat,
+    }
+    if args.role_path is not None:
+        result["role"] = str(args.role_path)
+        result["phases"] = run_benchmark(args.role_path, args.repeat)
+        return result
+
+    parameters = _get_parameters(args)
+    result["parameters"] = parameters.asdict()
+    with TemporaryDirectory() as tmp_path:
+        role_path = Path(tmp_path, "role")
+        generate_role(role_path, parameters)
+        result["phases"] = run_benchmark(role_path, args.repeat)
+    return result
+
+
+def _inventory(args: Namespace) -> Dict[str, Any]:
+    with TemporaryDirectory() as tmp_path:
+        path = Path(tmp_path, "inventory.yml")
+        generate_inventory(path, args.hosts, args.variables)
+        result = run_inventory_benchmark(path, args.repeat)
+    result["parameters"] = {"hosts": args.hosts, "variables": args.variables}
+    return result
+
+
+def _write_output(args: Namespace, result: Dict[str, Any]) -> None:
+    output = dumps(result, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        args.output.write_text(output + "\n", encoding="utf-8")
+
+
+def _compare(args: Namespace) -> int:
+    base = loads(args.base.read_text(encoding="utf-8"))
+    new = loads(args.new.read_text(encoding="utf-8"))
+    if base.get("parameters") != new.get("parameters"):
+        print("warning: results are measured with different parameters")
+
+    status = 0
+    print(f"{'phase':<16}{'base':>12}{'new':>12}{'change':>10}")
+    for phase in PHASES:
+        base_time = base["phases"][phase]["median"]
+        new_time = new["phases"][phase]["median"]
+        change = (new_time - base_time) / base_time if base_time > 0 else 0.0
+        mark = ""
+        if change > args.threshold:
+            mark = "  regression"
+            status = 1
+        print(f"{phase:<16}{base_time:>11.4f}s{new_time:>11.4f}s{change:>+10.1%}{mark}")
+    return status
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = _parse_args(argv)
+    if args.command == "generate":
+        generate_role(args.role_path, _get_parameters(args))
+    elif args.command == "run":
+        _write_output(args, _run(args))
+    elif args.command == "inventory":
+        _write_output(args, _inventory(args))
+    else:
+        status = _compare(args)
+        if status != 0:
+            exit(status)
+
+
+if __name__ == "__main__":
+    main()
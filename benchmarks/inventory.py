@@ -0,0 +1,85 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from functools import partial
+from json import dumps
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Tuple
+
+from yaml import load, safe_dump, SafeLoader
+
+from templtest.loader import LIBYAML, load_file, SafeLoader as FastSafeLoader
+
+
+def generate_inventory(path: Path, hosts: int, variables: int) -> None:
+    # Host variables of an inventory of a large site: every host has scalar
+    # variables of different types and a list of mappings.
+    document = {
+        "hosts": {
+            f"host{host:05}.example.com": {
+                **{f"var_{idx}": _value(host, idx) for idx in range(variables)},
+                "interfaces": [
+                    {"name": f"eth{idx}", "address": f"10.{idx}.{host % 256}.1"}
+                    for idx in range(2)
+                ],
+            }
+            for host in range(hosts)
+        }
+    }
+    path.write_text(safe_dump(document, sort_keys=False), encoding="utf-8")
+
+
+def _value(host: int, idx: int) -> Any:
+    kind = idx % 4
+    if kind == 0:
+        return f"value {host} {idx}"
+    if kind == 1:
+        return host * idx
+    if kind == 2:
+        return idx % 3 == 0
+    return host / (idx + 1)
+
+
+def run_inventory_benchmark(path: Path, repeat: int) -> Dict[str, Any]:
+    # Loading time of the file by the pure Python loader and by the loader
+    # used by templtest, which is the libyaml one if PyYAML is built with it,
+    # and loading time of the same variables converted to JSON.
+    data = path.read_text(encoding="utf-8")
+    result: Dict[str, Any] = {"size": len(data), "libyaml": LIBYAML}
+    documents = []
+    for name, loader in [("python", SafeLoader), ("templtest", FastSafeLoader)]:
+        document, result[name] = _measure(partial(load, data, Loader=loader), repeat)
+        documents.append(document)
+    json_path = path.with_suffix(".json")
+    json_path.write_text(dumps(documents[0]), encoding="utf-8")
+    document, result["json"] = _measure(lambda: load_file(json_path), repeat)
+    documents.append(document)
+    if any(document != documents[0] for document in documents):
+        raise AssertionError("loaders produced different documents")
+    for name in ["templtest", "json"]:
+        result[f"{name}_speedup"] = result["python"]["median"] / result[name]["median"]
+    return result
+
+
+def _measure(function: Callable[[], Any], repeat: int) -> Tuple[Any, Dict[str, Any]]:
+    runs: List[float] = []
+    for _ in range(repeat):
+        start = perf_counter()
+        value = function()
+        runs.append(perf_counter() - start)
+    return value, {"min": min(runs), "median": median(runs), "runs": runs}
@@ -0,0 +1,59 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+from statistics import median
+from typing import Any, Dict, List
+
+from templtest.discovery import discover_tests
+from templtest.template import AnsibleTemplateRenderer
+from templtest.test import Test
+from templtest.timing import Timer
+
+PHASES = ["discover_tests", "load_variables", "render", "compare"]
+
+
+def run_once(role_path: Path) -> Dict[str, float]:
+    # A run with a cold renderer and without the cache directory, as the
+    # first run of the command line tool. Rendering also loads test
+    # variables, so "render" includes a part of "load_variables" time.
+    timer = Timer()
+    renderer = AnsibleTemplateRenderer(role_path)
+    with timer.measure("discover_tests"):
+        testdefs = list(discover_tests(Path(role_path, "templates_tests")))
+    tests = [
+        Test(role_path, src_path, testdef, renderer) for testdef, src_path in testdefs
+    ]
+    for test in tests:
+        with timer.measure("load_variables"):
+            test.load_variables()
+        with timer.measure("render"):
+            actual = test.render()
+        with timer.measure("compare"):
+            test.compare(actual)
+    return {phase: timer.durations.get(phase, 0.0) for phase in PHASES}
+
+
+def run_benchmark(role_path: Path, repeat: int) -> Dict[str, Any]:
+    runs: List[Dict[str, float]] = [run_once(role_path) for _ in range(repeat)]
+    return {
+        phase: {
+            "min": min(run[phase] for run in runs),
+            "median": median(run[phase] for run in runs),
+            "runs": [run[phase] for run in runs],
+        }
+        for phase in PHASES
+    }
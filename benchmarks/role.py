@@ -0,0 +1,104 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List
+
+from yaml import safe_dump
+
+from templtest.template import AnsibleTemplateRenderer
+
+
+@dataclass(frozen=True)
+class RoleParameters:
+    templates: int = 20
+    tests_per_template: int = 5
+    # Number of variables in each of role defaults and vars.
+    variables: int = 100
+    # Length of the chain of templates included by every template.
+    include_depth: int = 0
+    # Number of lines rendered by every template.
+    output_lines: int = 100
+
+    def asdict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def generate_role(path: Path, parameters: RoleParameters) -> None:
+    # Expected results are rendered by templtest itself, so every test of
+    # the generated role passes.
+    Path(path, "defaults").mkdir(parents=True)
+    Path(path, "vars").mkdir()
+    Path(path, "templates", "includes").mkdir(parents=True)
+    Path(path, "templates_tests").mkdir()
+
+    _write_yaml(Path(path, "defaults", "main.yml"), _variables("default", parameters))
+    _write_yaml(Path(path, "vars", "main.yml"), _variables("var", parameters))
+    _write_yaml(Path(path, "templates_tests", "meta.yml"), {"version": "0.1"})
+
+    renderer = AnsibleTemplateRenderer(path)
+    for template_idx in range(parameters.templates):
+        name = f"template_{template_idx:04d}"
+        _write_templates(Path(path, "templates"), name, parameters)
+
+        tests_path = Path(path, "templates_tests", name)
+        tests_path.mkdir()
+        testdefs: List[Dict[str, Any]] = []
+        for case_idx in range(parameters.tests_per_template):
+            case = f"case_{case_idx:04d}"
+            inventory_path = Path(tests_path, f"{case}.yml")
+            _write_yaml(inventory_path, {"prefix": f"{name} {case}"})
+            expect = renderer.render(Path(f"{name}.j2"), inventory=inventory_path)
+            Path(tests_path, case).write_text(expect, encoding="utf-8")
+            testdefs.append(
+                {
+                    "name": f"{name} {case}",
+                    "template": f"{name}.j2",
+                    "variables": {"inventory": f"{case}.yml"},
+                    "expected_result": case,
+                }
+            )
+        _write_yaml(Path(tests_path, "test.yml"), {"tests": testdefs})
+
+
+def _variables(prefix: str, parameters: RoleParameters) -> Dict[str, Any]:
+    return {
+        f"{prefix}_{idx:05d}": f"{prefix} value {idx}"
+        for idx in range(parameters.variables)
+    }
+
+
+def _write_templates(path: Path, name: str, parameters: RoleParameters) -> None:
+    lines = [f"# {name}: {{{{ prefix }}}}"]
+    if parameters.include_depth > 0:
+        lines.append(f'{{% include "includes/{name}_1.j2" %}}')
+    lines.append(f"{{% for n in range({parameters.output_lines}) %}}")
+    lines.append("{{ prefix }} {{ n }}: {{ default_00000 }} {{ var_00000 }}")
+    lines.append("{% endfor %}")
+    Path(path, f"{name}.j2").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    for level in range(1, parameters.include_depth + 1):
+        lines = [f"# {name} include {level}: {{{{ prefix }}}}"]
+        if level < parameters.include_depth:
+            lines.append(f'{{% include "includes/{name}_{level + 1}.j2" %}}')
+        Path(path, "includes", f"{name}_{level}.j2").write_text(
+            "\n".join(lines) + "\n", encoding="utf-8"
+        )
+
+
+def _write_yaml(path: Path, document: Any) -> None:
+    path.write_text(safe_dump(document, sort_keys=False), encoding="utf-8")
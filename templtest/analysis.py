@@ -0,0 +1,211 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from hashlib import sha256
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Set, Tuple
+
+from jinja2 import Environment, TemplateSyntaxError
+from jinja2.meta import find_referenced_templates, find_undeclared_variables
+
+# Templates starting with this header may change Jinja syntax.
+_JINJA2_OVERRIDE = "#jinja2:"
+
+# Names, that give templates access to variables chosen at runtime.
+_DYNAMIC_NAMES = frozenset(["hostvars", "lookup", "q", "query", "vars"])
+
+# Strings containing any of these are templated by Ansible on access.
+_TEMPLATE_MARKERS = ("{{", "{%", "{#")
+
+# Names of variables, that a template or a variable value references. None
+# stands for any variable, as the source can't be analyzed.
+_Names = Optional[FrozenSet[str]]
+
+
+class _AnyName(Dict[str, Any]):
+    # Filters and tests of Ansible and its collections are not known to a
+    # plain environment, but the analysis must not reject them. Jinja only
+    # checks, that they exist, when it generates code, so the placeholder is
+    # never invoked.
+    def get(self, key: str, default: Any = None) -> Any:
+        del default
+        return super().get(key, _unknown)
+
+
+def _unknown(*args: Any, **kwargs: Any) -> None:
+    del args, kwargs
+
+
+def _create_environment() -> Environment:
+    environment = Environment()
+    environment.filters = _AnyName(environment.filters)
+    environment.tests = _AnyName(environment.tests)
+    return environment
+
+
+class TemplateDependencies:
+    # Finds templates used by a template with "include", "import" and
+    # "extends" statements. Templates referenced with non-constant names
+    # can't be found statically, so such templates depend on every template.
+    # Variables referenced by templates are found along with them.
+    templates: Path
+    _environment: Environment
+    _direct: Dict[Path, Optional[FrozenSet[Path]]]
+    _variables: Dict[Path, _Names]
+    _all: Optional[FrozenSet[Path]]
+
+    def __init__(self, templates: Path):
+        self.templates = templates
+        self._environment = _create_environment()
+        self._direct = {}
+        self._variables = {}
+        self._all = None
+
+    def get(self, template: Path) -> FrozenSet[Path]:
+        found: Set[Path] = set()
+        queue = [template]
+        while queue:
+            current = queue.pop()
+            if current in found:
+                continue
+            found.add(current)
+            direct = self._get_direct(current)
+            if direct is None:
+                return self._get_all()
+            queue.extend(direct)
+        return frozenset(found)
+
+    def variables(self, template: Path) -> _Names:
+        # Variables referenced by the template and the templates it uses.
+        names: Set[str] = set()
+        for current in self.get(template):
+            self._get_direct(current)
+            variables = self._variables[current]
+            if variables is None:
+                return None
+            names.update(variables)
+        return frozenset(names)
+
+    def _get_direct(self, template: Path) -> Optional[FrozenSet[Path]]:
+        try:
+            return self._direct[template]
+        except KeyError:
+            pass
+        direct, variables = self._parse(template)
+        self._direct[template] = direct
+        self._variables[template] = variables
+        return direct
+
+    def _parse(self, template: Path) -> Tuple[Optional[FrozenSet[Path]], _Names]:
+        try:
+            source = Path(self.templates, template).read_text(encoding="utf-8")
+            if source.startswith(_JINJA2_OVERRIDE):
+                return None, None
+            ast = self._environment.parse(source, name=template.as_posix())
+            variables = frozenset(find_undeclared_variables(ast))
+        except (OSError, UnicodeDecodeError, TemplateSyntaxError):
+            return None, None
+        names = list(find_referenced_templates(ast))
+        if None in names:
+            return None, variables
+        return frozenset(Path(name) for name in names if name is not None), variables
+
+    def _get_all(self) -> FrozenSet[Path]:
+        if self._all is None:
+            self._all = frozenset(
+                path.relative_to(self.templates)
+                for path in self.templates.glob("**/*")
+                if path.is_file()
+            )
+        return self._all
+
+
+class VariableUsage:
+    # Finds variables, that may affect a rendering of a template: variables
+    # referenced by the template and the templates it uses, and variables
+    # referenced by values of those, as Ansible templates the values on
+    # access. Renderings of a template with equal values of these variables
+    # are equal, whatever the other variables are.
+    _templates: TemplateDependencies
+    _environment: Environment
+    _values: Dict[str, _Names]
+
+    def __init__(self, templates: TemplateDependencies):
+        self._templates = templates
+        self._environment = _create_environment()
+        self._values = {}
+
+    def get(self, template: Path, variables: Mapping[str, Any]) -> Optional[List[str]]:
+        names = self._templates.variables(template)
+        if names is None:
+            return None
+        found: Set[str] = set()
+        queue = list(names)
+        while queue:
+            name = queue.pop()
+            if name in found:
+                continue
+            if name in _DYNAMIC_NAMES:
+                return None
+            found.add(name)
+            if name in variables:
+                referenced = self._find_referenced(variables[name])
+                if referenced is None:
+                    return None
+                queue.extend(referenced)
+        return sorted(found)
+
+    def digest(self, template: Path, variables: Mapping[str, Any]) -> Optional[str]:
+        # A digest of values of the used variables. Undefined variables are
+        # left out, so defining one changes the digest.
+        names = self.get(template, variables)
+        if names is None:
+            return None
+        used = [(name, variables[name]) for name in names if name in variables]
+        return sha256(repr(used).encode("utf-8")).hexdigest()
+
+    def _find_referenced(self, value: Any) -> Optional[Set[str]]:
+        names: Set[str] = set()
+        stack = [value]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                referenced = self._parse_value(item)
+                if referenced is None:
+                    return None
+                names.update(referenced)
+            elif isinstance(item, dict):
+                stack.extend(item.keys())
+                stack.extend(item.values())
+            elif isinstance(item, (list, tuple)):
+                stack.extend(item)
+        return names
+
+    def _parse_value(self, value: str) -> _Names:
+        if not any(marker in value for marker in _TEMPLATE_MARKERS):
+            return frozenset()
+        try:
+            return self._values[value]
+        except KeyError:
+            pass
+        names: _Names
+        try:
+            ast = self._environment.parse(value)
+            names = frozenset(find_undeclared_variables(ast))
+        except TemplateSyntaxError:
+            names = None
+        self._values[value] = names
+        return names
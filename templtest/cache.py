@@ -0,0 +1,96 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from dataclasses import dataclass
+from json import dumps, load
+from os import replace
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Any, Union
+
+
+CACHE_DIR = ".templtest_cache"
+
+# A file may be changed without changing its modification time within the
+# timestamp granularity, so the modification time, that is close to the
+# time of caching, is not trusted.
+RACY_INTERVAL_NS = 2_000_000_000
+
+_GITIGNORE = """\
+# Created by templtest automatically.
+*
+"""
+
+# See: https://bford.info/cachedir/
+_CACHEDIR_TAG = """\
+Signature: 8a477f597d28d172789f06886806bc55
+# This file is a cache directory tag created by templtest.
+"""
+
+
+@dataclass(frozen=True)
+class Cache:
+    path: Path
+
+    @classmethod
+    def for_role(cls, role: Path) -> "Cache":
+        return cls(Path(role, CACHE_DIR))
+
+    def makedir(self, name: Union[str, Path]) -> Path:
+        if not self.path.is_dir():
+            self.path.mkdir(parents=True, exist_ok=True)
+            _write_if_missing(Path(self.path, ".gitignore"), _GITIGNORE)
+            _write_if_missing(Path(self.path, "CACHEDIR.TAG"), _CACHEDIR_TAG)
+        directory = Path(self.path, name)
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return read_json(Path(self.path, f"{key}.json"), default)
+
+    def set(self, key: str, value: Any) -> None:
+        self.makedir(".")
+        write_json(Path(self.path, f"{key}.json"), value)
+
+
+def read_json(path: Path, default: Any = None) -> Any:
+    try:
+        with path.open(encoding="utf-8") as file:
+            return load(file)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path: Path, value: Any) -> None:
+    write_atomic(path, dumps(value, sort_keys=True).encode("utf-8"))
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    # The file is replaced atomically, so concurrent readers never see
+    # partially written content.
+    with NamedTemporaryFile(
+        "wb", dir=path.parent, prefix=f".{path.name}.", suffix=".tmp", delete=False
+    ) as file:
+        file.write(data)
+    replace(file.name, path)
+
+
+def _write_if_missing(path: Path, content: str) -> None:
+    try:
+        with path.open("x", encoding="utf-8") as file:
+            file.write(content)
+    except FileExistsError:
+        pass
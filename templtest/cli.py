@@ -14,42 +14,617 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from argparse import ArgumentParser, Namespace
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+from contextlib import closing
+from dataclasses import dataclass
+from os import cpu_count
+from os.path import relpath
 from pathlib import Path
 from sys import exit  # pylint: disable=redefined-builtin
-from typing import List, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 
-from .discovery import discover_tests
-from .exception import AssertError, TestDefinitionError
+from yaml import YAMLError
+
+from .cache import Cache, read_json, write_json
+from .dependency import DependencyIndex
+from .diff import ALGORITHMS, DiffOptions
+from .discovery import discover_tests, DiscoveryIndex, ErrorHandler, Walker
+from .exception import GitError, SelectionError, TestDefinitionError
+from .git import changed_files
+from .incremental import Incremental
+from .lastfailed import LastFailed
+from .runner import Result, run_tests
+from .selection import Expression, PathFilter
+from .shard import select_shard, Shard, TestDurations
+from .summary import format_error, Summary
+from .template import AnsibleTemplateRenderer
 from .test import Test
+from .timing import add_durations, Durations, format_durations
+from .watch import WatchedTests, create_watcher
+
+
+def _jobs(value: str) -> int:
+    if value == "auto":
+        return cpu_count() or 1
+    try:
+        jobs = int(value)
+    except ValueError as exc:
+        raise ArgumentTypeError(f"invalid number of jobs: '{value}'") from exc
+    if jobs < 1:
+        raise ArgumentTypeError(f"invalid number of jobs: '{value}'")
+    return jobs
+
+
+def _non_negative(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError as exc:
+        raise ArgumentTypeError(f"invalid number: '{value}'") from exc
+    if number < 0:
+        raise ArgumentTypeError(f"invalid number: '{value}'")
+    return number
+
+
+def _shard(value: str) -> Shard:
+    try:
+        return Shard.parse(value)
+    except ValueError as exc:
+        raise ArgumentTypeError(f"invalid shard: '{value}'") from exc
+
+
+def _expression(value: str) -> Expression:
+    try:
+        return Expression(value)
+    except SelectionError as exc:
+        raise ArgumentTypeError(f"invalid expression: {exc.args[0]}") from exc
 
 
 def _parse_args(args: Optional[List[str]] = None) -> Namespace:
     parser = ArgumentParser()
+    parser.add_argument(
+        "paths",
+        type=Path,
+        nargs="*",
+        metavar="PATH",
+        help="run only tests defined in test definition files or of templates "
+        "at the paths or in the directories",
+    )
     parser.add_argument("--role-path", type=Path, default=Path("."))
-    return parser.parse_args(args)
+    parser.add_argument(
+        "-k",
+        dest="keyword",
+        type=_expression,
+        metavar="EXPR",
+        help="run only tests, whose name, template path or test definition "
+        "path match the expression, e.g. 'nginx and not ssl'",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=_jobs,
+        default=1,
+        metavar="N",
+        help="number of worker processes or 'auto' to use all CPUs",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        metavar="PATH",
+        help="cache directory (default: ROLE_PATH/.templtest_cache)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="do not read or write the cache directory",
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="skip files and directories in templates_tests/ matching the "
+        "pattern by name or relative path (may be repeated)",
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=_non_negative,
+        metavar="N",
+        help="look for test definition files at most N directories deep",
+    )
+    parser.add_argument(
+        "--collect-only",
+        action="store_true",
+        help="list selected tests without running them",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="skip tests, whose inputs have not changed since they passed",
+    )
+    parser.add_argument(
+        "--incremental-import",
+        type=Path,
+        metavar="FILE",
+        help="load fingerprints of passed tests from FILE",
+    )
+    parser.add_argument(
+        "--incremental-export",
+        type=Path,
+        metavar="FILE",
+        help="save fingerprints of passed tests to FILE",
+    )
+    parser.add_argument(
+        "--changed-since",
+        metavar="REF",
+        help="run only tests affected by changes since the git REF",
+    )
+    parser.add_argument(
+        "--affected-by",
+        type=Path,
+        nargs="+",
+        metavar="PATH",
+        help="run only tests affected by changes of the files",
+    )
+    rerun = parser.add_mutually_exclusive_group()
+    rerun.add_argument(
+        "--last-failed",
+        action="store_true",
+        help="run only the tests failed last time (all if none failed)",
+    )
+    rerun.add_argument(
+        "--failed-first",
+        action="store_true",
+        help="run the tests failed last time before the others",
+    )
+    parser.add_argument(
+        "--shard",
+        type=_shard,
+        metavar="INDEX/COUNT",
+        help="run only the INDEX-th of COUNT parts of the tests (from 1)",
+    )
+    parser.add_argument(
+        "--shard-balance",
+        action="store_true",
+        help="split tests into shards of equal duration using the durations "
+        "loaded with --durations-import instead of hashing test names",
+    )
+    parser.add_argument(
+        "--durations-import",
+        type=Path,
+        metavar="FILE",
+        help="load recorded durations of tests from FILE",
+    )
+    parser.add_argument(
+        "--durations-export",
+        type=Path,
+        metavar="FILE",
+        help="save recorded durations of tests to FILE",
+    )
+    parser.add_argument(
+        "--maxfail",
+        type=_non_negative,
+        default=1,
+        metavar="N",
+        help="stop after N failed tests and test definition errors, 0 for no "
+        "limit (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--keep-going",
+        action="store_const",
+        dest="maxfail",
+        const=0,
+        help="run all the tests regardless of failures, same as --maxfail=0",
+    )
+    parser.add_argument(
+        "--diff-context",
+        type=_non_negative,
+        default=DiffOptions.context,
+        metavar="N",
+        help="number of context lines in diffs (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--diff-max-lines",
+        type=_non_negative,
+        default=DiffOptions.max_lines,
+        metavar="N",
+        help="maximum number of diff lines of a test, 0 for unlimited "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--diff-max-hunks",
+        type=_non_negative,
+        default=DiffOptions.max_hunks,
+        metavar="N",
+        help="maximum number of diff hunks of a test, 0 for unlimited "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--diff-algorithm",
+        choices=["auto", *ALGORITHMS],
+        default=DiffOptions.algorithm,
+        help="diff algorithm, 'auto' uses patience for large texts "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--durations",
+        type=_non_negative,
+        metavar="N",
+        help="print N slowest tests and templates (0 for all)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="watch role files and run tests affected by changes",
+    )
+    namespace = parser.parse_args(args)
+    # Every machine must split the tests by the same durations, so the local
+    # cache is not used for balancing.
+    if namespace.shard_balance and namespace.shard is None:
+        parser.error("--shard-balance requires --shard")
+    if namespace.shard_balance and namespace.durations_import is None:
+        parser.error("--shard-balance requires --durations-import")
+    return namespace
+
+
+@dataclass
+class _Records:
+    # Outcomes of the previous runs kept in the cache.
+    incremental: Optional[Incremental]
+    durations: TestDurations
+    last_failed: LastFailed
+    discovery: Optional[DiscoveryIndex]
+
+
+def _get_cache(args: Namespace) -> Optional[Cache]:
+    if args.no_cache:
+        return None
+    if args.cache_dir is not None:
+        cache = Cache(args.cache_dir)
+    else:
+        cache = Cache.for_role(args.role_path)
+    # Like a read-only role directory, an unusable cache must not fail the
+    # run, so the tests are run without it.
+    try:
+        cache.makedir(".")
+    except OSError as exc:
+        _warn_cache_disabled(cache, exc)
+        return None
+    return cache
+
+
+def _warn_cache_disabled(cache: Cache, exc: OSError) -> None:
+    print(f"warning: cache disabled, cannot write {cache.path}: {exc}")
+
+
+def _load_incremental(args: Namespace, cache: Optional[Cache]) -> Incremental:
+    fingerprints = {}
+    if cache is not None:
+        fingerprints.update(cache.get("incremental", {}))
+    if args.incremental_import is not None:
+        fingerprints.update(read_json(args.incremental_import, {}))
+    return Incremental(args.role_path, fingerprints)
+
+
+def _load_durations(args: Namespace, cache: Optional[Cache]) -> TestDurations:
+    durations = {}
+    if cache is not None:
+        durations.update(cache.get("durations", {}))
+    if args.durations_import is not None:
+        durations.update(read_json(args.durations_import, {}))
+    return durations
+
+
+def _load_records(args: Namespace, cache: Optional[Cache]) -> _Records:
+    incremental = None
+    if args.incremental:
+        incremental = _load_incremental(args, cache)
+    last_failed = LastFailed()
+    discovery = None
+    if cache is not None:
+        last_failed = LastFailed(cache.get("lastfailed"))
+        discovery = DiscoveryIndex(cache.get("discovery"))
+    return _Records(incremental, _load_durations(args, cache), last_failed, discovery)
+
+
+def _save_records(args: Namespace, cache: Optional[Cache], records: _Records) -> None:
+    if records.incremental is not None and args.incremental_export is not None:
+        write_json(args.incremental_export, records.incremental.fingerprints)
+    if records.durations and args.durations_export is not None:
+        write_json(args.durations_export, records.durations)
+    if cache is None:
+        return
+    try:
+        _save_cached_records(cache, records)
+    except OSError as exc:
+        _warn_cache_disabled(cache, exc)
+
+
+def _save_cached_records(cache: Cache, records: _Records) -> None:
+    if records.incremental is not None:
+        cache.set("incremental", records.incremental.fingerprints)
+    if records.durations:
+        cache.set("durations", records.durations)
+    if records.last_failed.failed or cache.get("lastfailed"):
+        cache.set("lastfailed", records.last_failed.failed)
+    if records.discovery is not None and records.discovery.modified:
+        cache.set("discovery", records.discovery.document)
+
+
+def _select_affected(args: Namespace, tests: Iterable[Test]) -> Iterable[Test]:
+    if args.changed_since is None and args.affected_by is None:
+        return tests
+    index = DependencyIndex(args.role_path)
+    changed: Set[Path] = set()
+    if args.changed_since is not None:
+        changed.update(changed_files(args.changed_since, args.role_path))
+    if args.affected_by is not None:
+        changed.update(index.relative(path) for path in args.affected_by)
+    return (test for test in tests if index.is_affected(test, changed))
+
+
+def _print_error(exc: BaseException) -> None:
+    print(format_error(exc), end="")
+
+
+def _error_handler(summary: Summary) -> ErrorHandler:
+    # Reports invalid test definition files and stops the discovery only if
+    # the limit of failures is reached.
+    def handle(exc: TestDefinitionError) -> None:
+        _print_error(exc)
+        print()
+        summary.add_error(exc)
+        if summary.exhausted:
+            raise exc
+
+    return handle
+
+
+def _keep_going(args: Namespace) -> bool:
+    return args.maxfail != 1
+
+
+def _get_diff_options(args: Namespace) -> DiffOptions:
+    return DiffOptions(
+        context=args.diff_context,
+        max_lines=args.diff_max_lines,
+        max_hunks=args.diff_max_hunks,
+        algorithm=args.diff_algorithm,
+    )
+
+
+def _print_slowest(kind: str, rows: List[Tuple[str, Durations]], count: int) -> None:
+    # Zero count prints all the rows.
+    rows = sorted(rows, key=lambda row: sum(row[1].values()), reverse=True)
+    print(f"slowest {kind}:" if count == 0 else f"slowest {count} {kind}:")
+    for label, durations in rows[: count or None]:
+        total = sum(durations.values())
+        print(f"{total:.4f}s {label}: {format_durations(durations)}")
+
+
+def _print_durations(results: List[Result], count: int) -> None:
+    by_template: Dict[Path, List[Durations]] = {}
+    for result in results:
+        by_template.setdefault(result.test.template, []).append(result.durations)
+    print()
+    _print_slowest(
+        "tests",
+        [
+            (f"[{result.test.src_path}] {result.test.name}", result.durations)
+            for result in results
+        ],
+        count,
+    )
+    _print_slowest(
+        "templates",
+        [
+            (f"{template} ({len(durations)} tests)", add_durations(durations))
+            for template, durations in by_template.items()
+        ],
+        count,
+    )
+
+
+def _report(
+    args: Namespace,
+    tests: Iterable[Test],
+    records: _Records,
+    summary: Summary,
+) -> int:
+    incremental = records.incremental
+    skip = None if incremental is None else incremental.is_unchanged
+    results: List[Result] = []
+    try:
+        with closing(
+            run_tests(
+                tests,
+                jobs=args.jobs,
+                skip=skip,
+                diff_options=_get_diff_options(args),
+                durations=records.durations,
+            )
+        ) as run:
+            for result in run:
+                print(f"[{result.test.src_path}] {result.test.name} ... ", end="")
+                if incremental is not None:
+                    incremental.record(result.test, result.error is None)
+                records.last_failed.record(result.test, result.error is None)
+                if not result.cached:
+                    results.append(result)
+                    total = sum(result.durations.values())
+                    records.durations[result.test.key] = total
+                summary.add_result(result)
+                if result.error is not None:
+                    print("fail")
+                    print(result.error.args[0])
+                else:
+                    print("ok (cached)" if result.cached else "ok")
+                if summary.exhausted:
+                    break
+    except TestDefinitionError as exc:
+        # The error handler has already reported the error, which exhausted
+        # the limit of failures.
+        if exc not in summary.errors:
+            _print_error(exc)
+            summary.add_error(exc)
+            if _keep_going(args):
+                print()
+    if args.durations is not None:
+        _print_durations(results, args.durations)
+    if _keep_going(args):
+        print()
+        print("\n".join(summary.format()))
+    elif summary.deduplicated:
+        print()
+        print(summary.format_deduplicated())
+    return 0 if summary.success else 1
+
+
+def _get_walker(args: Namespace) -> Walker:
+    return Walker(tuple(args.exclude), args.max_depth)
+
+
+def _get_path_filter(args: Namespace) -> Optional[PathFilter]:
+    if not args.paths:
+        return None
+    return PathFilter(Path(relpath(path, args.role_path)) for path in args.paths)
+
+
+def _is_selected(
+    args: Namespace, path_filter: Optional[PathFilter], test: Test
+) -> bool:
+    if path_filter is not None and not path_filter.matches(test):
+        return False
+    return args.keyword is None or args.keyword.matches(test)
+
+
+def _discover(
+    args: Namespace,
+    renderer: AnsibleTemplateRenderer,
+    records: _Records,
+    summary: Summary,
+) -> Iterable[Test]:
+    # Test definition files, that can't define selected tests, are not parsed.
+    file_filters: List[Callable[[Path], bool]] = []
+    if args.last_failed and records.last_failed.failed:
+        file_filters.append(records.last_failed.has_file)
+    path_filter = _get_path_filter(args)
+    if path_filter is not None:
+        file_filters.append(path_filter.select_file)
+    tests: Iterable[Test] = (
+        Test(args.role_path, src_path, testdef, renderer)
+        for testdef, src_path in discover_tests(
+            Path(args.role_path, "templates_tests"),
+            _error_handler(summary) if _keep_going(args) else None,
+            (lambda path: all(select(path) for select in file_filters))
+            if file_filters
+            else None,
+            records.discovery,
+            args.jobs,
+            _get_walker(args),
+        )
+    )
+    return (test for test in tests if _is_selected(args, path_filter, test))
+
+
+def _collect(tests: Iterable[Test], summary: Summary) -> int:
+    count = 0
+    try:
+        for test in tests:
+            print(f"[{test.src_path}] {test.name}")
+            count += 1
+    except TestDefinitionError as exc:
+        # Unless the error handler has already reported the error.
+        if exc not in summary.errors:
+            _print_error(exc)
+            return 1
+    print()
+    print(f"{count} tests collected")
+    return 0 if summary.success else 1
+
+
+def _run(args: Namespace, cache: Optional[Cache], records: _Records) -> int:
+    renderer = AnsibleTemplateRenderer(args.role_path, cache)
+    summary = Summary(args.maxfail)
+    try:
+        tests = _discover(args, renderer, records, summary)
+        tests = _select_affected(args, tests)
+    except (GitError, SelectionError) as exc:
+        _print_error(exc)
+        return 1
+    # Without failed tests recorded all the tests are run.
+    if args.last_failed and records.last_failed.failed:
+        tests = records.last_failed.select(tests)
+    elif args.failed_first:
+        tests = records.last_failed.failed_first(tests)
+    if args.shard is not None:
+        tests = select_shard(
+            tests,
+            args.shard,
+            read_json(args.durations_import, {}) if args.shard_balance else None,
+        )
+    if args.collect_only:
+        return _collect(tests, summary)
+    return _report(args, tests, records, summary)
+
+
+def _watch(args: Namespace, cache: Optional[Cache], records: _Records) -> int:
+    # The renderer is kept between runs, so compiled templates and role
+    # variables are reused until they change.
+    try:
+        path_filter = _get_path_filter(args)
+    except SelectionError as exc:
+        _print_error(exc)
+        return 1
+    renderer = AnsibleTemplateRenderer(args.role_path, cache)
+    watched = WatchedTests(args.role_path, renderer, _get_walker(args))
+    watcher = create_watcher([path for path in watched.paths if path.is_dir()])
+    try:
+        changed: Optional[Set[Path]] = None
+        while True:
+            summary = Summary(args.maxfail)
+            on_error = _error_handler(summary) if _keep_going(args) else None
+            try:
+                if changed is None:
+                    tests = watched.load(on_error)
+                else:
+                    tests = watched.update(changed, on_error)
+                if records.incremental is not None:
+                    records.incremental.refresh()
+                tests = [
+                    test for test in tests if _is_selected(args, path_filter, test)
+                ]
+                if tests or summary.errors:
+                    _report(args, tests, records, summary)
+            except TestDefinitionError as exc:
+                if exc not in summary.errors:
+                    _print_error(exc)
+                    print()
+            except (OSError, YAMLError, ValueError) as exc:
+                # A file may be saved halfway through editing, so the error
+                # is reported and the role is loaded again after the next
+                # change.
+                _print_error(exc)
+                print()
+                renderer.reset_role_variables()
+            print("waiting for changes...")
+            changed = watcher.wait()
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        watcher.close()
 
 
 def main(argv: Optional[List[str]] = None) -> None:
     args = _parse_args(argv)
     tests_path = Path(args.role_path, "templates_tests")
     if tests_path.is_dir():
+        cache = _get_cache(args)
+        records = _load_records(args, cache)
         try:
-            for testdef, src_path in discover_tests(tests_path):
-                test = Test(args.role_path, src_path, testdef)
-                print(f"[{src_path}] {testdef.name} ... ", end="")
-                try:
-                    test.run()
-                except AssertError as exc:
-                    print("fail")
-                    print(exc.args[0])
-                    exit(1)
-                else:
-                    print("ok")
-        except TestDefinitionError as exc:
-            exception: Optional[BaseException] = exc
-            print("TestDefinitionError", end="")
-            while exception is not None:
-                print(f": {exception.args[0]}", end="")
-                exception = exception.__cause__
-            exit(1)
+            if args.watch:
+                status = _watch(args, cache, records)
+            else:
+                status = _run(args, cache, records)
+        finally:
+            _save_records(args, cache, records)
+        if status != 0:
+            exit(status)
@@ -0,0 +1,239 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from codecs import getincrementaldecoder, IncrementalDecoder
+from collections import deque
+from contextlib import contextmanager
+from mmap import ACCESS_READ, mmap
+from os import fstat
+from pathlib import Path
+from types import TracebackType
+from typing import BinaryIO, Deque, Iterator, List, Optional, Tuple, Type, Union
+
+from .diff import DiffOptions, iter_hunks, truncation_summary, unified_diff
+from .timing import Timer
+
+Buffer = Union[bytes, mmap]
+
+# Expected results of this size or larger are compared with the rendered
+# text as it is generated.
+STREAM_THRESHOLD = 1024 * 1024
+
+# Number of lines kept after the first difference of streamed texts.
+STREAM_WINDOW = 100
+
+_BLOCK_SIZE = 64 * 1024
+
+
+@contextmanager
+def map_file(path: Path) -> Iterator[Buffer]:
+    # Empty files can't be mapped.
+    with path.open("rb") as file:
+        if fstat(file.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap(file.fileno(), 0, access=ACCESS_READ) as data:
+            yield data
+
+
+def is_match(expect: Buffer, actual: str) -> bool:
+    actual_data = actual.encode("utf-8")
+    if len(expect) != len(actual_data):
+        return False
+    with memoryview(expect) as view:
+        return view == actual_data
+
+
+def compare(
+    expect_path: Path,
+    actual: str,
+    labels: Tuple[str, str],
+    timer: Optional[Timer] = None,
+    options: Optional[DiffOptions] = None,
+) -> str:
+    # Returns the unified diff of the expected result and the rendered text
+    # or an empty string, if they are equal. Identical texts are detected
+    # with a single buffer comparison, the texts are split into lines only
+    # if they differ. Line endings are not compared.
+    timer = Timer() if timer is None else timer
+    with timer.measure("read_expected"), map_file(expect_path) as expect:
+        with timer.measure("compare"):
+            if is_match(expect, actual):
+                return ""
+            expect_text = str(expect[:], encoding="utf-8")
+            return unified_diff(
+                expect_text.splitlines(), actual.splitlines(), labels, options
+            )
+
+
+class StreamComparator:  # pylint: disable=too-many-instance-attributes
+    # Compares the text written chunk by chunk with the expected file line by
+    # line, so neither of them is kept in memory as a whole. Only a few
+    # lines before the first difference and a bounded window after it are
+    # kept to build the diff, the rest of the text is not needed.
+    _expect: "_LineReader"
+    _actual: "_LineSplitter"
+    _labels: Tuple[str, str]
+    _timer: Timer
+    _options: DiffOptions
+    _before: Deque[str]
+    _equal: int
+    # Expected and actual lines starting with the first difference.
+    _windows: Optional[Tuple[List[str], List[str]]]
+
+    def __init__(
+        self,
+        expect_path: Path,
+        labels: Tuple[str, str],
+        timer: Optional[Timer] = None,
+        options: Optional[DiffOptions] = None,
+    ):
+        self._timer = Timer() if timer is None else timer
+        with self._timer.measure("read_expected"):
+            self._expect = _LineReader(expect_path)
+        self._actual = _LineSplitter()
+        self._labels = labels
+        self._options = DiffOptions() if options is None else options
+        self._before = deque(maxlen=self._options.context)
+        self._equal = 0
+        self._windows = None
+
+    def __enter__(self) -> "StreamComparator":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self._expect.close()
+
+    def write(self, text: str) -> bool:
+        # Returns False, when the rest of the text is not needed.
+        with self._timer.measure("compare"):
+            return all(self._add(line) for line in self._actual.feed(text))
+
+    def finish(self) -> str:
+        # Returns the unified diff or an empty string, if the texts are equal.
+        with self._timer.measure("compare"):
+            for line in self._actual.close():
+                self._add(line)
+            if self._windows is None:
+                expect_line = self._next_expected()
+                if expect_line is None:
+                    return ""
+                self._windows = ([expect_line], [])
+            expect_window, actual_window = self._windows
+            while len(expect_window) < STREAM_WINDOW:
+                expect_line = self._next_expected()
+                if expect_line is None:
+                    break
+                expect_window.append(expect_line)
+            return self._diff(expect_window, actual_window)
+
+    def _add(self, line: str) -> bool:
+        if self._windows is None:
+            expect_line = self._next_expected()
+            if expect_line == line:
+                self._before.append(line)
+                self._equal += 1
+                return True
+            self._windows = ([] if expect_line is None else [expect_line], [])
+        actual_window = self._windows[1]
+        if len(actual_window) < STREAM_WINDOW:
+            actual_window.append(line)
+        return len(actual_window) < STREAM_WINDOW
+
+    def _next_expected(self) -> Optional[str]:
+        with self._timer.measure("read_expected"):
+            return self._expect.next()
+
+    def _diff(self, expect_window: List[str], actual_window: List[str]) -> str:
+        # Only the first hunk is reported. Line numbers of the windows are
+        # shifted to the line numbers of the texts.
+        hunk: List[str] = next(
+            iter_hunks(
+                [*self._before, *expect_window],
+                [*self._before, *actual_window],
+                self._options,
+                offset=self._equal - len(self._before),
+            ),
+            [],
+        )
+        max_lines = self._options.max_lines
+        lines = [f"--- {self._labels[0]}", f"+++ {self._labels[1]}"]
+        if max_lines and len(hunk) > max_lines:
+            lines.extend(hunk[:max_lines])
+            lines.append(truncation_summary(len(hunk) - max_lines, 0))
+        else:
+            lines.extend(hunk)
+        return "\n".join(lines)
+
+
+class _LineSplitter:
+    # Splits a text written chunk by chunk into lines the same way as
+    # str.splitlines() does.
+    _buffer: str
+
+    def __init__(self) -> None:
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        pieces = (self._buffer + text).splitlines(keepends=True)
+        self._buffer = ""
+        # "\r" may be followed by "\n" in the next chunk.
+        if pieces and (
+            pieces[-1].splitlines()[0] == pieces[-1] or pieces[-1].endswith("\r")
+        ):
+            self._buffer = pieces.pop()
+        return [piece.splitlines()[0] for piece in pieces]
+
+    def close(self) -> List[str]:
+        lines = self._buffer.splitlines()
+        self._buffer = ""
+        return lines
+
+
+class _LineReader:
+    # Reads lines of a UTF-8 file block by block.
+    _file: BinaryIO
+    _decoder: IncrementalDecoder
+    _lines: Deque[str]
+    _splitter: _LineSplitter
+    _eof: bool
+
+    def __init__(self, path: Path):
+        self._file = path.open("rb")
+        self._decoder = getincrementaldecoder("utf-8")()
+        self._lines = deque()
+        self._splitter = _LineSplitter()
+        self._eof = False
+
+    def next(self) -> Optional[str]:
+        while not self._lines and not self._eof:
+            data = self._file.read(_BLOCK_SIZE)
+            if data:
+                text = self._decoder.decode(data)
+                self._lines.extend(self._splitter.feed(text))
+            else:
+                self._eof = True
+                self._splitter.feed(self._decoder.decode(b"", final=True))
+                self._lines.extend(self._splitter.close())
+        return self._lines.popleft() if self._lines else None
+
+    def close(self) -> None:
+        self._file.close()
@@ -0,0 +1,72 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from os.path import relpath
+from pathlib import Path
+from typing import AbstractSet, List, Optional
+
+from .analysis import TemplateDependencies, VariableUsage
+from .loader import ROLE_VAR_FILE_NAMES
+from .test import Test
+
+
+class DependencyIndex:
+    # Maps tests to the files they depend on. Paths are relative to the role
+    # directory.
+    _role_path: Path
+    _templates: TemplateDependencies
+    _usage: VariableUsage
+    _role_files: List[Path]
+
+    def __init__(self, role_path: Path):
+        self._role_path = role_path
+        self._templates = TemplateDependencies(Path(role_path, "templates"))
+        self._usage = VariableUsage(self._templates)
+        # Every file name that may hold role variables is a dependency, so
+        # adding a file with higher priority is a change too.
+        self._role_files = [
+            Path(directory, filename)
+            for directory in ["defaults", "vars"]
+            for filename in ROLE_VAR_FILE_NAMES
+        ]
+
+    def get(self, test: Test) -> List[Path]:
+        paths = self.get_templates(test)
+        paths.extend(self._role_files)
+        paths.extend(self.relative(path) for path in test.input_paths)
+        return paths
+
+    def get_templates(self, test: Test) -> List[Path]:
+        return [
+            Path("templates", template)
+            for template in sorted(self._templates.get(test.template))
+        ]
+
+    def get_variables(self, test: Test) -> Optional[str]:
+        # A digest of the variables used by the template of the test, if they
+        # can be found. Role and test variable files affect the test only
+        # through them.
+        return self._usage.digest(test.template, test.load_variables())
+
+    def is_affected(self, test: Test, changed: AbstractSet[Path]) -> bool:
+        # A changed directory affects every file in it.
+        paths = [self.relative(test.definition_path), *self.get(test)]
+        return any(
+            path in changed or not changed.isdisjoint(path.parents) for path in paths
+        )
+
+    def relative(self, path: Path) -> Path:
+        return Path(relpath(path, self._role_path))
@@ -0,0 +1,318 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from bisect import bisect_left
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Operations turning one sequence into another in the format of
+# SequenceMatcher.get_opcodes().
+Opcode = Tuple[str, int, int, int, int]
+
+# Matching blocks (old index, new index, size) ordered by the indices.
+_Block = Tuple[int, int, int]
+
+# Inputs with more lines in total are compared with the patience algorithm
+# by the "auto" algorithm.
+AUTO_PATIENCE_THRESHOLD = 2000
+
+# Regions without unique lines are compared with difflib, if the product of
+# their lengths is not larger than this. Larger regions are replaced as a
+# whole.
+_FALLBACK_LIMIT = 1000000
+
+
+@dataclass(frozen=True)
+class DiffOptions:
+    context: int = 3
+    # Zero means unlimited.
+    max_lines: int = 1000
+    max_hunks: int = 50
+    algorithm: str = "auto"
+
+
+def difflib_opcodes(old: Sequence[str], new: Sequence[str]) -> List[Opcode]:
+    return SequenceMatcher(None, old, new).get_opcodes()
+
+
+def patience_opcodes(old: Sequence[str], new: Sequence[str]) -> List[Opcode]:
+    # Lines occurring once in both sequences are matched first and split the
+    # sequences into regions compared in turn. It is faster than difflib on
+    # large inputs and aligns the diff on distinctive lines.
+    blocks: List[_Block] = []
+    regions = [(0, len(old), 0, len(new))]
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+        size = 0
+        while (
+            alo + size < ahi and blo + size < bhi and old[alo + size] == new[blo + size]
+        ):
+            size += 1
+        if size:
+            blocks.append((alo, blo, size))
+            alo, blo = alo + size, blo + size
+        size = 0
+        while (
+            alo < ahi - size
+            and blo < bhi - size
+            and old[ahi - size - 1] == new[bhi - size - 1]
+        ):
+            size += 1
+        if size:
+            blocks.append((ahi - size, bhi - size, size))
+            ahi, bhi = ahi - size, bhi - size
+        if alo == ahi or blo == bhi:
+            continue
+        anchors = _unique_anchors(old, new, (alo, ahi, blo, bhi))
+        if not anchors:
+            blocks.extend(_fallback_blocks(old, new, (alo, ahi, blo, bhi)))
+            continue
+        for i, j in anchors:
+            regions.append((alo, i, blo, j))
+            blocks.append((i, j, 1))
+            alo, blo = i + 1, j + 1
+        regions.append((alo, ahi, blo, bhi))
+    return _opcodes(sorted(blocks), len(old), len(new))
+
+
+ALGORITHMS: Dict[str, Callable[[Sequence[str], Sequence[str]], List[Opcode]]] = {
+    "difflib": difflib_opcodes,
+    "patience": patience_opcodes,
+}
+
+
+def iter_hunks(
+    old: Sequence[str], new: Sequence[str], options: DiffOptions, offset: int = 0
+) -> Iterator[List[str]]:
+    # Hunks of the unified diff. Offset is added to the line numbers.
+    for group in _group(_get_opcodes(old, new, options.algorithm), options.context):
+        yield _format_hunk(old, new, group, offset)
+
+
+def unified_diff(
+    old: Sequence[str],
+    new: Sequence[str],
+    labels: Tuple[str, str],
+    options: Optional[DiffOptions] = None,
+) -> str:
+    # Hunks and lines exceeding the limits are summarized at the end.
+    options = DiffOptions() if options is None else options
+    lines: List[str] = []
+    hunks = 0
+    omitted_lines = 0
+    omitted_hunks = 0
+    for group in _group(_get_opcodes(old, new, options.algorithm), options.context):
+        size = _hunk_size(group)
+        room = options.max_lines - len(lines) if options.max_lines else size
+        if omitted_lines or room <= 0 or 0 < options.max_hunks <= hunks:
+            omitted_hunks += 1
+            omitted_lines += size
+            continue
+        hunk = _format_hunk(old, new, group, 0)[:room]
+        omitted_lines += size - len(hunk)
+        lines.extend(hunk)
+        hunks += 1
+    if not lines:
+        return ""
+    fromfile, tofile = labels
+    lines = [f"--- {fromfile}", f"+++ {tofile}", *lines]
+    if omitted_lines:
+        lines.append(truncation_summary(omitted_lines, omitted_hunks))
+    return "\n".join(lines)
+
+
+def truncation_summary(lines: int, hunks: int) -> str:
+    summary = f"[diff truncated: {lines} more lines"
+    if hunks:
+        summary += f" in {hunks} more hunks"
+    return summary + "]"
+
+
+def _get_opcodes(
+    old: Sequence[str], new: Sequence[str], algorithm: str
+) -> List[Opcode]:
+    if algorithm == "auto":
+        if len(old) + len(new) > AUTO_PATIENCE_THRESHOLD:
+            algorithm = "patience"
+        else:
+            algorithm = "difflib"
+    return ALGORITHMS[algorithm](old, new)
+
+
+def _unique_anchors(
+    old: Sequence[str], new: Sequence[str], region: Tuple[int, int, int, int]
+) -> List[Tuple[int, int]]:
+    # Pairs of lines unique in both regions, that keep their order in both of
+    # them, i.e. the longest increasing subsequence of the new indices.
+    alo, ahi, blo, bhi = region
+    counts: Dict[str, List[int]] = {}
+    for i in range(alo, ahi):
+        entry = counts.setdefault(old[i], [0, 0, i, -1])
+        entry[0] += 1
+    for j in range(blo, bhi):
+        if new[j] in counts:
+            entry = counts[new[j]]
+            entry[1] += 1
+            entry[3] = j
+    pairs = sorted(
+        (entry[2], entry[3]) for entry in counts.values() if entry[:2] == [1, 1]
+    )
+    return _longest_increasing(pairs)
+
+
+def _longest_increasing(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    # Patience sorting of the second items of the pairs.
+    tails: List[int] = []
+    tail_indices: List[int] = []
+    previous = [-1] * len(pairs)
+    for index, (_, j) in enumerate(pairs):
+        pile = bisect_left(tails, j)
+        if pile > 0:
+            previous[index] = tail_indices[pile - 1]
+        if pile == len(tails):
+            tails.append(j)
+            tail_indices.append(index)
+        else:
+            tails[pile] = j
+            tail_indices[pile] = index
+    result = []
+    index = tail_indices[-1] if tail_indices else -1
+    while index >= 0:
+        result.append(pairs[index])
+        index = previous[index]
+    result.reverse()
+    return result
+
+
+def _fallback_blocks(
+    old: Sequence[str], new: Sequence[str], region: Tuple[int, int, int, int]
+) -> List[_Block]:
+    alo, ahi, blo, bhi = region
+    if (ahi - alo) * (bhi - blo) > _FALLBACK_LIMIT:
+        return []
+    matcher = SequenceMatcher(None, old[alo:ahi], new[blo:bhi], autojunk=False)
+    return [
+        (alo + i, blo + j, size) for i, j, size in matcher.get_matching_blocks() if size
+    ]
+
+
+def _opcodes(blocks: List[_Block], old_size: int, new_size: int) -> List[Opcode]:
+    opcodes: List[Opcode] = []
+    i = j = 0
+    for block_i, block_j, size in [*blocks, (old_size, new_size, 0)]:
+        if i < block_i and j < block_j:
+            opcodes.append(("replace", i, block_i, j, block_j))
+        elif i < block_i:
+            opcodes.append(("delete", i, block_i, j, block_j))
+        elif j < block_j:
+            opcodes.append(("insert", i, block_i, j, block_j))
+        if size:
+            # Adjacent matching blocks are merged.
+            if opcodes and opcodes[-1][0] == "equal" and opcodes[-1][2] == block_i:
+                _, start_i, _, start_j, _ = opcodes.pop()
+                opcodes.append(
+                    ("equal", start_i, block_i + size, start_j, block_j + size)
+                )
+            else:
+                opcodes.append(
+                    ("equal", block_i, block_i + size, block_j, block_j + size)
+                )
+        i, j = block_i + size, block_j + size
+    return opcodes
+
+
+def _group(opcodes: List[Opcode], context: int) -> Iterator[List[Opcode]]:
+    # Splits opcodes into hunks with up to context equal lines around the
+    # changes, as SequenceMatcher.get_grouped_opcodes() does.
+    if not opcodes:
+        opcodes = [("equal", 0, 1, 0, 1)]
+    opcodes = list(opcodes)
+    tag, old_start, old_stop, new_start, new_stop = opcodes[0]
+    if tag == "equal":
+        opcodes[0] = (
+            tag,
+            max(old_start, old_stop - context),
+            old_stop,
+            max(new_start, new_stop - context),
+            new_stop,
+        )
+    tag, old_start, old_stop, new_start, new_stop = opcodes[-1]
+    if tag == "equal":
+        opcodes[-1] = (
+            tag,
+            old_start,
+            min(old_stop, old_start + context),
+            new_start,
+            min(new_stop, new_start + context),
+        )
+
+    group: List[Opcode] = []
+    for tag, old_start, old_stop, new_start, new_stop in opcodes:
+        if tag == "equal" and old_stop - old_start > 2 * context:
+            group.append(
+                (
+                    tag,
+                    old_start,
+                    min(old_stop, old_start + context),
+                    new_start,
+                    min(new_stop, new_start + context),
+                )
+            )
+            yield group
+            group = []
+            old_start, new_start = max(old_start, old_stop - context), max(
+                new_start, new_stop - context
+            )
+        group.append((tag, old_start, old_stop, new_start, new_stop))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+
+def _format_range(start: int, stop: int) -> str:
+    # Line numbers start from one. An empty range refers to the line before.
+    length = stop - start
+    if length == 1:
+        return f"{start + 1}"
+    if length == 0:
+        return f"{start},0"
+    return f"{start + 1},{length}"
+
+
+def _format_hunk(
+    old: Sequence[str], new: Sequence[str], group: List[Opcode], offset: int
+) -> List[str]:
+    old_range = _format_range(group[0][1] + offset, group[-1][2] + offset)
+    new_range = _format_range(group[0][3] + offset, group[-1][4] + offset)
+    lines = [f"@@ -{old_range} +{new_range} @@"]
+    for tag, old_start, old_stop, new_start, new_stop in group:
+        if tag == "equal":
+            lines.extend(f" {line}" for line in old[old_start:old_stop])
+            continue
+        if tag in ("replace", "delete"):
+            lines.extend(f"-{line}" for line in old[old_start:old_stop])
+        if tag in ("replace", "insert"):
+            lines.extend(f"+{line}" for line in new[new_start:new_stop])
+    return lines
+
+
+def _hunk_size(group: List[Opcode]) -> int:
+    size = 1
+    for tag, old_start, old_stop, new_start, new_stop in group:
+        size += old_stop - old_start
+        if tag != "equal":
+            size += new_stop - new_start
+    return size
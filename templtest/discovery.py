@@ -14,18 +14,41 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import re
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from dataclasses import dataclass
+from fnmatch import fnmatch, fnmatchcase, translate
+from functools import partial
+from os import scandir, stat_result
 from pathlib import Path
-from typing import Any, Iterator, Optional, Tuple
+from time import time_ns
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 
 from packaging.version import InvalidVersion, Version
-from yaml import safe_load, YAMLError
+from yaml import YAMLError
 
+from .cache import RACY_INTERVAL_NS
 from .exception import TestDefinitionError
+from .loader import safe_load
 
 
 SUPPORTED_SPEC_VERSION = "0.1"
 
+TEST_FILE_PATTERN = "test*.yml"
+
+_TEST_FILE_NAME = re.compile(translate(TEST_FILE_PATTERN))
+
+# Receives errors of test definition files, so the discovery may go on.
+ErrorHandler = Callable[[TestDefinitionError], None]
+
+# Version of the discovery index format and validation rules. Indexes of
+# other versions are discarded.
+INDEX_VERSION = 2
+
+# Parsing in worker processes doesn't pay off for a few files.
+_PARALLEL_MIN_FILES = 16
+
 
 @dataclass
 class Meta:
@@ -230,14 +253,61 @@ def _iter_testdefs(document: Any) -> Iterator[TestDefinition]:
         raise TestDefinitionError(msg)
 
 
-def _find(base_path: Path, pattern: str) -> Iterator[Path]:
-    for path in base_path.glob(pattern):
-        yield path.relative_to(base_path)
-
-
-def discover_tests(
-    base_path: Path = Path("templates_tests"),
-) -> Iterator[Tuple[TestDefinition, Path]]:
+@dataclass(frozen=True)
+class Walker:
+    # Finds test definition files. Files and directories matching any of the
+    # exclude patterns by name or by path relative to the base directory are
+    # skipped, so excluded directories are never listed. Files directly in
+    # the base directory have zero depth. Paths are yielded sorted, files of
+    # a directory before its subdirectories.
+    exclude: Sequence[str] = ()
+    max_depth: Optional[int] = None
+
+    def find(self, base_path: Path) -> Iterator[Path]:
+        yield from self._walk(base_path, "", 0)
+
+    def matches(self, path: Path) -> bool:
+        # Checks if the file at the path relative to the base directory is
+        # found by the walker.
+        parts = path.parts
+        if self.max_depth is not None and len(parts) - 1 > self.max_depth:
+            return False
+        for idx, name in enumerate(parts):
+            if self._is_excluded(name, "/".join(parts[: idx + 1])):
+                return False
+        return is_test_file(path)
+
+    def _walk(self, directory: Path, prefix: str, depth: int) -> Iterator[Path]:
+        files = []
+        subdirectories = []
+        with scandir(directory) as entries:
+            for entry in entries:
+                if self.exclude and self._is_excluded(entry.name, prefix + entry.name):
+                    continue
+                # Symlinked directories are not followed, like by Path.glob().
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.name)
+                elif _TEST_FILE_NAME.match(entry.name) and entry.is_file():
+                    files.append(entry.name)
+        for name in sorted(files):
+            yield Path(prefix + name)
+        if self.max_depth is not None and depth >= self.max_depth:
+            return
+        for name in sorted(subdirectories):
+            yield from self._walk(Path(directory, name), f"{prefix}{name}/", depth + 1)
+
+    def _is_excluded(self, name: str, path: str) -> bool:
+        return any(
+            fnmatchcase(name, pattern) or fnmatchcase(path, pattern)
+            for pattern in self.exclude
+        )
+
+
+def is_test_file(path: Path) -> bool:
+    return fnmatch(path.name, TEST_FILE_PATTERN)
+
+
+def _check_meta(base_path: Path = Path("templates_tests")) -> None:
     try:
         meta = Meta.load(base_path)
     except TestDefinitionError as exc:
@@ -248,17 +318,176 @@ def discover_tests(
         msg = "unsupported testing speification version"
         raise TestDefinitionError(msg)
 
-    for path in _find(base_path, "**/test*.yml"):
-        data = base_path.joinpath(path).read_text(encoding="utf-8")
-        try:
-            document = safe_load(data)
-        except YAMLError as exc:
-            msg = f"test definition file '{path}' is badly formatted"
-            raise TestDefinitionError(msg) from exc
 
-        try:
-            for testdef in _iter_testdefs(document):
-                yield (testdef, path)
-        except TestDefinitionError as exc:
-            msg = f"invalid definition file '{path}'"
-            raise TestDefinitionError(msg) from exc
+def load_tests(base_path: Path, path: Path) -> Iterator[Tuple[TestDefinition, Path]]:
+    data = base_path.joinpath(path).read_text(encoding="utf-8")
+    try:
+        document = safe_load(data)
+    except YAMLError as exc:
+        msg = f"test definition file '{path}' is badly formatted"
+        raise TestDefinitionError(msg) from exc
+
+    try:
+        for testdef in _iter_testdefs(document):
+            yield (testdef, path)
+    except TestDefinitionError as exc:
+        msg = f"invalid definition file '{path}'"
+        raise TestDefinitionError(msg) from exc
+
+
+class DiscoveryIndex:
+    # Validated test definitions of test definition files by their paths.
+    # Definitions of a file are used while its modification time and size
+    # stay the same, unless the file was modified shortly before caching.
+    files: Dict[str, Any]
+    modified: bool
+
+    def __init__(self, document: Any = None):
+        self.files = {}
+        self.modified = False
+        if isinstance(document, dict) and document.get("version") == INDEX_VERSION:
+            self.files = document.get("files", {})
+
+    @property
+    def document(self) -> Dict[str, Any]:
+        return {"version": INDEX_VERSION, "files": self.files}
+
+    def get(self, path: Path, stat: stat_result) -> Optional[List[TestDefinition]]:
+        entry = self.files.get(path.as_posix())
+        if (
+            entry is None
+            or entry["stat"] != [stat.st_mtime_ns, stat.st_size]
+            or entry["cached"] - stat.st_mtime_ns < RACY_INTERVAL_NS
+        ):
+            return None
+        return [_load_testdef(document) for document in entry["tests"]]
+
+    def set(
+        self, path: Path, stat: stat_result, testdefs: List[TestDefinition]
+    ) -> None:
+        self.files[path.as_posix()] = {
+            "stat": [stat.st_mtime_ns, stat.st_size],
+            "cached": time_ns(),
+            "tests": [_dump_testdef(testdef) for testdef in testdefs],
+        }
+        self.modified = True
+
+    def prune(self, paths: List[Path]) -> None:
+        # Forgets files except the existing ones.
+        existing = {path.as_posix() for path in paths}
+        if not existing.issuperset(self.files):
+            self.files = {
+                path: entry for path, entry in self.files.items() if path in existing
+            }
+            self.modified = True
+
+
+def _dump_testdef(testdef: TestDefinition) -> Dict[str, Any]:
+    variables = None
+    if testdef.variables is not None:
+        variables = {
+            "inventory": _dump_path(testdef.variables.inventory),
+            "extra": _dump_path(testdef.variables.extra),
+        }
+    return {
+        "name": testdef.name,
+        "template": testdef.template.as_posix(),
+        "variables": variables,
+        "expected_result": testdef.expected_result.as_posix(),
+    }
+
+
+def _load_testdef(document: Dict[str, Any]) -> TestDefinition:
+    variables = None
+    if document["variables"] is not None:
+        variables = Variables(
+            _load_path(document["variables"]["inventory"]),
+            _load_path(document["variables"]["extra"]),
+        )
+    return TestDefinition(
+        document["name"],
+        Path(document["template"]),
+        variables,
+        Path(document["expected_result"]),
+    )
+
+
+def _dump_path(path: Optional[Path]) -> Optional[str]:
+    return None if path is None else path.as_posix()
+
+
+def _load_path(path: Optional[str]) -> Optional[Path]:
+    return None if path is None else Path(path)
+
+
+def _parse_file(base_path: Path, path: Path) -> Optional[List[TestDefinition]]:
+    # Invalid files are parsed again by the caller, since causes of the
+    # exceptions are lost when they are passed between processes.
+    try:
+        return [testdef for testdef, _ in load_tests(base_path, path)]
+    except TestDefinitionError:
+        return None
+
+
+def _load_files(
+    base_path: Path, paths: List[Path], index: DiscoveryIndex, jobs: int
+) -> Iterator[Tuple[Path, Optional[List[TestDefinition]]]]:
+    # Yields test definitions of the files in the order of the paths or None
+    # for invalid files.
+    stats = [base_path.joinpath(path).stat() for path in paths]
+    indexed = [index.get(path, stat) for path, stat in zip(paths, stats)]
+    changed = [path for path, testdefs in zip(paths, indexed) if testdefs is None]
+    with ExitStack() as stack:
+        parsed: Iterator[Optional[List[TestDefinition]]]
+        if jobs > 1 and len(changed) >= _PARALLEL_MIN_FILES:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=jobs))
+            parsed = executor.map(
+                partial(_parse_file, base_path),
+                changed,
+                chunksize=max(1, len(changed) // (jobs * 4)),
+            )
+        else:
+            parsed = map(partial(_parse_file, base_path), changed)
+        for path, stat, testdefs in zip(paths, stats, indexed):
+            if testdefs is None:
+                testdefs = next(parsed, None)
+                if testdefs is not None:
+                    index.set(path, stat, testdefs)
+            yield path, testdefs
+
+
+def discover_tests(  # pylint: disable=too-many-arguments
+    base_path: Path = Path("templates_tests"),
+    on_error: Optional[ErrorHandler] = None,
+    select_file: Optional[Callable[[Path], bool]] = None,
+    index: Optional[DiscoveryIndex] = None,
+    jobs: int = 1,
+    walker: Walker = Walker(),
+) -> Iterator[Tuple[TestDefinition, Path]]:
+    # With the error handler an invalid test definition file is reported to
+    # it and the discovery continues with the next file. Tests defined in the
+    # file before the invalid definition are yielded anyway. Test definition
+    # files not matching the select_file predicate are not parsed. Files
+    # found unchanged in the index are not read at all. Other files are
+    # parsed in the jobs worker processes, if there are many of them.
+    _check_meta(base_path)
+    paths = list(walker.find(base_path))
+    if index is not None:
+        index.prune(paths)
+    if select_file is not None:
+        paths = [path for path in paths if select_file(path)]
+    loaded: Iterator[Tuple[Path, Optional[List[TestDefinition]]]]
+    if index is None and jobs == 1:
+        loaded = ((path, None) for path in paths)
+    else:
+        loaded = _load_files(base_path, paths, index or DiscoveryIndex(), jobs)
+    for path, testdefs in loaded:
+        if testdefs is not None:
+            yield from ((testdef, path) for testdef in testdefs)
+        elif on_error is None:
+            yield from load_tests(base_path, path)
+        else:
+            try:
+                yield from load_tests(base_path, path)
+            except TestDefinitionError as exc:
+                on_error(exc)
@@ -27,3 +27,11 @@ class TestDefinitionError(GenericError):
 
 class AssertError(GenericError):
     pass
+
+
+class GitError(GenericError):
+    pass
+
+
+class SelectionError(GenericError):
+    pass
@@ -0,0 +1,45 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+from subprocess import CalledProcessError, run
+from typing import List, Set
+
+from .exception import GitError
+
+
+def changed_files(ref: str, path: Path) -> Set[Path]:
+    # Files under the path, that are changed since the ref (including
+    # uncommitted and untracked ones). Paths are relative to the path.
+    changed = _git(["diff", "--name-only", "--relative", "-z", ref, "--"], path)
+    untracked = _git(["ls-files", "--others", "--exclude-standard", "-z"], path)
+    return {Path(name) for name in changed + untracked}
+
+
+def _git(args: List[str], cwd: Path) -> List[str]:
+    try:
+        process = run(
+            ["git", *args],
+            cwd=cwd,
+            capture_output=True,
+            check=True,
+            encoding="utf-8",
+        )
+    except FileNotFoundError as exc:
+        raise GitError("git is not found") from exc
+    except CalledProcessError as exc:
+        raise GitError(exc.stderr.strip()) from exc
+    return [name for name in process.stdout.split("\0") if name]
@@ -0,0 +1,108 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from hashlib import sha256
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Dict, Optional
+
+from .dependency import DependencyIndex
+from .test import Test
+
+
+class Fingerprinter:
+    # A fingerprint of a test covers the content of every file, that may
+    # affect the test outcome, and versions of the tools used for rendering.
+    _role_path: Path
+    _dependencies: DependencyIndex
+    _digests: Dict[Path, str]
+    _versions: str
+
+    def __init__(self, role_path: Path):
+        self._role_path = role_path
+        self._dependencies = DependencyIndex(role_path)
+        self._digests = {}
+        self._versions = " ".join(
+            f"{package}=={_get_version(package)}"
+            for package in ["templtest", "ansible-core", "jinja2"]
+        )
+
+    def fingerprint(self, test: Test) -> str:
+        # Paths are relative to the role, so fingerprints may be shared
+        # between different checkouts of the role.
+        fingerprint = sha256(self._versions.encode("utf-8"))
+        variables = self._dependencies.get_variables(test)
+        if variables is None:
+            paths = self._dependencies.get(test)
+        else:
+            # Changes of unused variables don't change the fingerprint.
+            paths = self._dependencies.get_templates(test)
+            paths.append(self._dependencies.relative(test.expected_path))
+            fingerprint.update(f"\0variables\0{variables}".encode("utf-8"))
+        for path in paths:
+            digest = self._digest(Path(self._role_path, path))
+            fingerprint.update(f"\0{path.as_posix()}\0{digest}".encode("utf-8"))
+        return fingerprint.hexdigest()
+
+    def _digest(self, path: Path) -> str:
+        try:
+            return self._digests[path]
+        except KeyError:
+            pass
+        try:
+            digest = sha256(path.read_bytes()).hexdigest()
+        except OSError:
+            digest = "-"
+        self._digests[path] = digest
+        return digest
+
+
+class Incremental:
+    # Keeps fingerprints of passed tests. A test with the same fingerprint
+    # as in the last passed run doesn't need to be run again.
+    fingerprints: Dict[str, str]
+    _role_path: Path
+    _fingerprinter: Fingerprinter
+    _current: Dict[str, str]
+
+    def __init__(self, role_path: Path, fingerprints: Optional[Dict[str, str]]):
+        self.fingerprints = {} if fingerprints is None else fingerprints
+        self._role_path = role_path
+        self._fingerprinter = Fingerprinter(role_path)
+        self._current = {}
+
+    def refresh(self) -> None:
+        # Forgets digests of files, that may be changed since they were read.
+        self._fingerprinter = Fingerprinter(self._role_path)
+
+    def is_unchanged(self, test: Test) -> bool:
+        fingerprint = self._fingerprinter.fingerprint(test)
+        self._current[test.key] = fingerprint
+        return self.fingerprints.get(test.key) == fingerprint
+
+    def record(self, test: Test, passed: bool) -> None:
+        fingerprint = self._current.pop(test.key, None)
+        if passed and fingerprint is not None:
+            self.fingerprints[test.key] = fingerprint
+        else:
+            self.fingerprints.pop(test.key, None)
+
+
+def _get_version(package: str) -> str:
+    try:
+        return version(package)
+    except PackageNotFoundError:
+        return "unknown"
@@ -0,0 +1,61 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .test import Test
+
+
+class LastFailed:
+    # Names of the tests failed in the last runs by the paths of their test
+    # definition files. A test is forgotten once it passes.
+    failed: Dict[str, List[str]]
+
+    def __init__(self, failed: Optional[Dict[str, List[str]]] = None):
+        self.failed = {} if failed is None else failed
+
+    def has_file(self, src_path: Path) -> bool:
+        return src_path.as_posix() in self.failed
+
+    def is_failed(self, test: Test) -> bool:
+        return test.name in self.failed.get(test.src_path.as_posix(), [])
+
+    def record(self, test: Test, passed: bool) -> None:
+        src_path = test.src_path.as_posix()
+        names = set(self.failed.get(src_path, []))
+        if passed:
+            names.discard(test.name)
+        else:
+            names.add(test.name)
+        if names:
+            self.failed[src_path] = sorted(names)
+        else:
+            self.failed.pop(src_path, None)
+
+    def select(self, tests: Iterable[Test]) -> Iterator[Test]:
+        return (test for test in tests if self.is_failed(test))
+
+    def failed_first(self, tests: Iterable[Test]) -> Iterator[Test]:
+        # Failed tests are yielded as soon as they are discovered, the others
+        # are kept until all the tests are discovered.
+        others = []
+        for test in tests:
+            if self.is_failed(test):
+                yield test
+            else:
+                others.append(test)
+        yield from others
@@ -0,0 +1,68 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from json import loads
+from pathlib import Path
+from typing import Any, Union
+
+from yaml import load
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML is built without libyaml.
+    from yaml import SafeLoader  # type: ignore[assignment]
+
+
+# The libyaml based loader is several times faster and produces the same
+# documents, since only parsing is done in C, while construction of values
+# is shared with the pure Python loader.
+LIBYAML = SafeLoader.__name__ == "CSafeLoader"
+
+# Names of files with role variables in "defaults/" and "vars/" directories
+# in the order of priority.
+ROLE_VAR_FILE_NAMES = ["main.yml", "main.yaml", "main", "main.json"]
+
+# Extensions of MessagePack files. Loading them requires msgpack package,
+# which is not installed with templtest.
+MSGPACK_SUFFIXES = [".msgpack", ".mpk"]
+
+
+def safe_load(data: Union[str, bytes]) -> Any:
+    return load(data, Loader=SafeLoader)
+
+
+def load_file(path: Path) -> Any:
+    return load_data(path, path.read_bytes())
+
+
+def load_data(path: Path, data: bytes) -> Any:
+    # The format is chosen by the extension of the file: JSON, MessagePack
+    # or YAML, which is a superset of JSON, for any other extension.
+    if path.suffix == ".json":
+        return loads(data)
+    if path.suffix in MSGPACK_SUFFIXES:
+        return _load_msgpack(path, data)
+    return safe_load(data)
+
+
+def _load_msgpack(path: Path, data: bytes) -> Any:
+    try:
+        # pylint: disable-next=import-outside-toplevel
+        from msgpack import unpackb
+    except ImportError as exc:
+        msg = f"msgpack package is required to load '{path}'"
+        raise ModuleNotFoundError(msg) from exc
+    return unpackb(data, raw=False)
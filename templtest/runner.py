@@ -0,0 +1,185 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import (
+    Callable,
+    Deque,
+    Generator,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from .diff import DiffOptions
+from .exception import AssertError, TestDefinitionError
+from .test import Test
+from .timing import Durations, Timer
+
+
+# Failure of a test, if any, time spent in the phases of its run and whether
+# its rendering was reused.
+_Outcome = Tuple[Optional[AssertError], Durations, bool]
+
+# Number of tests submitted to the pool ahead of the reported one per worker.
+_PREFETCH = 2
+
+
+@dataclass
+class Result:
+    test: Test
+    error: Optional[AssertError]
+    cached: bool = False
+    durations: Durations = field(default_factory=dict)
+    # The text rendered for a preceding test with the same inputs was reused.
+    deduplicated: bool = False
+
+
+def run_tests(
+    tests: Iterable[Test],
+    jobs: int = 1,
+    skip: Optional[Callable[[Test], bool]] = None,
+    diff_options: Optional[DiffOptions] = None,
+    durations: Optional[Mapping[str, float]] = None,
+) -> Generator[Result, None, None]:
+    # Results are yielded in the order of the input tests regardless of the
+    # order of completion. Closing the generator cancels tests that have not
+    # been started by the pool workers yet. Tests matching the skip predicate
+    # are reported as cached passes without running. Durations of previous
+    # runs make parallel runs start the slowest tests first.
+    if skip is None:
+        skip = _never
+    run = partial(_run_test, diff_options=diff_options)
+    if jobs == 1:
+        yield from _run_serial(tests, skip, run)
+    elif durations:
+        yield from _run_scheduled(tests, jobs, skip, run, durations)
+    else:
+        yield from _run_parallel(tests, jobs, skip, run)
+
+
+def schedule(tests: Sequence[Test], durations: Mapping[str, float]) -> List[int]:
+    # Indexes of the tests, the slowest first. Tests without recorded
+    # durations keep their order after the others. The compilation time of a
+    # template is a part of the duration of the test, that compiled it.
+    return sorted(
+        range(len(tests)), key=lambda idx: -durations.get(tests[idx].key, 0.0)
+    )
+
+
+def _run_serial(
+    tests: Iterable[Test],
+    skip: Callable[[Test], bool],
+    run: Callable[[Test], _Outcome],
+) -> Generator[Result, None, None]:
+    for test in tests:
+        if skip(test):
+            yield Result(test, None, cached=True)
+        else:
+            yield _create_result(test, run(test))
+
+
+def _run_parallel(
+    tests: Iterable[Test],
+    jobs: int,
+    skip: Callable[[Test], bool],
+    run: Callable[[Test], _Outcome],
+) -> Generator[Result, None, None]:
+    pending: Deque[Tuple[Test, "Optional[Future[_Outcome]]"]] = deque()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        try:
+            try:
+                for test in tests:
+                    if skip(test):
+                        pending.append((test, None))
+                    else:
+                        pending.append((test, executor.submit(run, test)))
+                    if len(pending) > jobs * _PREFETCH:
+                        yield _collect(*pending.popleft())
+            except TestDefinitionError:
+                # Report the tests discovered before the invalid definition.
+                while pending:
+                    yield _collect(*pending.popleft())
+                raise
+            while pending:
+                yield _collect(*pending.popleft())
+        finally:
+            for _, future in pending:
+                if future is not None:
+                    future.cancel()
+
+
+def _run_scheduled(
+    tests: Iterable[Test],
+    jobs: int,
+    skip: Callable[[Test], bool],
+    run: Callable[[Test], _Outcome],
+    durations: Mapping[str, float],
+) -> Generator[Result, None, None]:
+    # All the tests are discovered and submitted to the pool at once, so the
+    # order of submission does not depend on the order of discovery.
+    discovered: List[Test] = []
+    error: Optional[TestDefinitionError] = None
+    try:
+        discovered.extend(tests)
+    except TestDefinitionError as exc:
+        # Run the tests discovered before the invalid definition.
+        error = exc
+    futures: "List[Optional[Future[_Outcome]]]" = [None] * len(discovered)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        try:
+            for idx in schedule(discovered, durations):
+                if not skip(discovered[idx]):
+                    futures[idx] = executor.submit(run, discovered[idx])
+            for idx, test in enumerate(discovered):
+                future, futures[idx] = futures[idx], None
+                yield _collect(test, future)
+        finally:
+            for future in futures:
+                if future is not None:
+                    future.cancel()
+    if error is not None:
+        raise error
+
+
+def _never(_: Test) -> bool:
+    return False
+
+
+def _collect(test: Test, future: "Optional[Future[_Outcome]]") -> Result:
+    if future is None:
+        return Result(test, None, cached=True)
+    return _create_result(test, future.result())
+
+
+def _create_result(test: Test, outcome: _Outcome) -> Result:
+    error, durations, deduplicated = outcome
+    return Result(test, error, durations=durations, deduplicated=deduplicated)
+
+
+def _run_test(test: Test, diff_options: Optional[DiffOptions]) -> _Outcome:
+    timer = Timer()
+    try:
+        test.run(timer, diff_options)
+    except AssertError as exc:
+        return exc, timer.durations, timer.deduplicated
+    return None, timer.durations, timer.deduplicated
@@ -0,0 +1,160 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Sequence
+
+from .exception import SelectionError
+from .test import Test
+
+
+# Matches lowercased test name, template path and test definition path.
+Matcher = Callable[[Sequence[str]], bool]
+
+_TOKEN = re.compile(r"\(|\)|[^\s()]+")
+
+_KEYWORDS = {"and", "or", "not", "(", ")"}
+
+
+@dataclass(frozen=True)
+class Expression:
+    # Words of the expression are case-insensitive substrings of the test
+    # name, the template path or the test definition path, combined with
+    # "and", "or", "not" and parentheses.
+    text: str
+    _matcher: Matcher = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "_matcher", _Parser(self.text).parse())
+
+    def matches(self, test: Test) -> bool:
+        values = [test.name, test.template.as_posix(), test.src_path.as_posix()]
+        return self._matcher([value.lower() for value in values])
+
+
+class _Parser:
+    # Recursive descent parser of the grammar:
+    #   expr := and_expr ("or" and_expr)*
+    #   and_expr := not_expr ("and" not_expr)*
+    #   not_expr := "not" not_expr | "(" expr ")" | word
+    _tokens: List[str]
+    _pos: int
+
+    def __init__(self, text: str):
+        self._tokens = _TOKEN.findall(text)
+        self._pos = 0
+
+    def parse(self) -> Matcher:
+        matcher = self._expr()
+        token = self._peek()
+        if token is not None:
+            raise SelectionError(f"unexpected '{token}' in expression")
+        return matcher
+
+    def _peek(self) -> Optional[str]:
+        if self._pos == len(self._tokens):
+            return None
+        return self._tokens[self._pos]
+
+    def _accept(self, token: str) -> bool:
+        if self._peek() != token:
+            return False
+        self._pos += 1
+        return True
+
+    def _expr(self) -> Matcher:
+        matcher = self._and_expr()
+        while self._accept("or"):
+            matcher = _either(matcher, self._and_expr())
+        return matcher
+
+    def _and_expr(self) -> Matcher:
+        matcher = self._not_expr()
+        while self._accept("and"):
+            matcher = _both(matcher, self._not_expr())
+        return matcher
+
+    def _not_expr(self) -> Matcher:
+        if self._accept("not"):
+            return _negate(self._not_expr())
+        if self._accept("("):
+            matcher = self._expr()
+            if not self._accept(")"):
+                raise SelectionError("missing ')' in expression")
+            return matcher
+        token = self._peek()
+        if token is None:
+            raise SelectionError("unexpected end of expression")
+        if token in _KEYWORDS:
+            raise SelectionError(f"unexpected '{token}' in expression")
+        self._pos += 1
+        return _word(token.lower())
+
+
+def _either(left: Matcher, right: Matcher) -> Matcher:
+    return lambda values: left(values) or right(values)
+
+
+def _both(left: Matcher, right: Matcher) -> Matcher:
+    return lambda values: left(values) and right(values)
+
+
+def _negate(matcher: Matcher) -> Matcher:
+    return lambda values: not matcher(values)
+
+
+def _word(word: str) -> Matcher:
+    return lambda values: any(word in value for value in values)
+
+
+class PathFilter:
+    # Selects tests by paths relative to the role: test definition files,
+    # templates and directories containing them.
+    _definition_paths: List[Path]
+    _template_paths: List[Path]
+
+    def __init__(self, paths: Iterable[Path]):
+        self._definition_paths = []
+        self._template_paths = []
+        for path in paths:
+            if not path.parts:
+                # The role directory itself.
+                self._definition_paths.append(path)
+            elif path.parts[0] == "templates_tests":
+                self._definition_paths.append(Path(*path.parts[1:]))
+            elif path.parts[0] == "templates":
+                self._template_paths.append(Path(*path.parts[1:]))
+            else:
+                msg = f"path is not in templates or templates_tests directory: {path}"
+                raise SelectionError(msg)
+
+    def select_file(self, src_path: Path) -> bool:
+        # Checks if the test definition file may define selected tests. Any
+        # file may define tests of the selected templates.
+        return bool(self._template_paths) or _contains(self._definition_paths, src_path)
+
+    def matches(self, test: Test) -> bool:
+        return _contains(self._definition_paths, test.src_path) or _contains(
+            self._template_paths, test.template
+        )
+
+
+def _contains(directories: Iterable[Path], path: Path) -> bool:
+    return any(
+        path == directory or directory in path.parents for directory in directories
+    )
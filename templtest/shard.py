@@ -0,0 +1,95 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from dataclasses import dataclass
+from hashlib import sha1
+from heapq import heapify, heapreplace
+from statistics import median
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple
+
+from .test import Test
+
+
+# Total time of the last run of a test by the test key.
+TestDurations = Dict[str, float]
+
+# Estimated duration of a test, if no tests have recorded durations.
+_DEFAULT_DURATION = 1.0
+
+
+@dataclass(frozen=True)
+class Shard:
+    # Shard indexes start with 1.
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, value: str) -> "Shard":
+        index, sep, count = value.partition("/")
+        if not sep:
+            raise ValueError(f"invalid shard: '{value}'")
+        shard = cls(int(index), int(count))
+        if not 1 <= shard.index <= shard.count:
+            raise ValueError(f"invalid shard: '{value}'")
+        return shard
+
+
+def hash_shard(test: Test, count: int) -> int:
+    # The hash does not depend on the order of the tests or on the Python
+    # hash seed, so every machine assigns a test to the same shard.
+    digest = sha1(test.key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def balance_shards(
+    tests: Iterable[Test], count: int, durations: Mapping[str, float]
+) -> List[List[Test]]:
+    # Longest processing time first: every test goes to the shard with the
+    # smallest total duration. Tests without recorded durations are assumed
+    # to take the median time. Tests of a shard keep the input order.
+    items = list(tests)
+    known = [durations[test.key] for test in items if test.key in durations]
+    default = median(known) if known else _DEFAULT_DURATION
+    order = sorted(
+        range(len(items)),
+        key=lambda idx: (-durations.get(items[idx].key, default), items[idx].key),
+    )
+    loads: List[Tuple[float, int]] = [(0.0, shard) for shard in range(count)]
+    heapify(loads)
+    assigned: List[Set[int]] = [set() for _ in range(count)]
+    for idx in order:
+        load, shard = loads[0]
+        assigned[shard].add(idx)
+        heapreplace(loads, (load + durations.get(items[idx].key, default), shard))
+    return [
+        [test for idx, test in enumerate(items) if idx in indexes]
+        for indexes in assigned
+    ]
+
+
+def select_shard(
+    tests: Iterable[Test],
+    shard: Shard,
+    durations: Optional[Mapping[str, float]] = None,
+) -> Iterator[Test]:
+    # Without durations tests are assigned by the hash lazily, otherwise all
+    # the tests are discovered before the first one is yielded.
+    if durations is None:
+        yield from (
+            test for test in tests if hash_shard(test, shard.count) == shard.index
+        )
+    else:
+        yield from balance_shards(tests, shard.count, durations)[shard.index - 1]
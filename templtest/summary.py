@@ -0,0 +1,109 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from time import perf_counter
+from typing import List, Optional
+
+from .exception import TestDefinitionError
+from .runner import Result
+from .test import Test
+
+
+def format_error(exc: BaseException) -> str:
+    # Error messages of the exception and its causes.
+    messages = [type(exc).__name__]
+    exception: Optional[BaseException] = exc
+    while exception is not None:
+        messages.append(_format_message(exception))
+        exception = exception.__cause__
+    return ": ".join(messages)
+
+
+def _format_message(exc: BaseException) -> str:
+    # Errors like OSError and YAMLError don't keep the message in the first
+    # argument.
+    if len(exc.args) == 1:
+        return str(exc.args[0])
+    return str(exc)
+
+
+class Summary:
+    # Outcome of a test run. The run is stopped, once the number of failed
+    # tests and test definition errors reaches maxfail. Zero means no limit.
+    maxfail: int
+    passed: int
+    cached: int
+    # Number of tests, that reused the text rendered for another test.
+    deduplicated: int
+    failed: List[Test]
+    errors: List[TestDefinitionError]
+
+    def __init__(self, maxfail: int = 0):
+        self.maxfail = maxfail
+        self.passed = 0
+        self.cached = 0
+        self.deduplicated = 0
+        self.failed = []
+        self.errors = []
+        self._start = perf_counter()
+
+    @property
+    def success(self) -> bool:
+        return not self.failed and not self.errors
+
+    @property
+    def exhausted(self) -> bool:
+        failures = len(self.failed) + len(self.errors)
+        return self.maxfail != 0 and failures >= self.maxfail
+
+    def add_result(self, result: Result) -> None:
+        if result.deduplicated:
+            self.deduplicated += 1
+        if result.error is not None:
+            self.failed.append(result.test)
+        elif result.cached:
+            self.cached += 1
+        else:
+            self.passed += 1
+
+    def add_error(self, exc: TestDefinitionError) -> None:
+        self.errors.append(exc)
+
+    def format_deduplicated(self) -> Optional[str]:
+        if self.deduplicated == 0:
+            return None
+        renders = "render" if self.deduplicated == 1 else "renders"
+        return f"{self.deduplicated} {renders} saved by deduplication"
+
+    def format(self) -> List[str]:
+        lines = [f"FAILED [{test.src_path}] {test.name}" for test in self.failed]
+        lines.extend(f"ERROR {format_error(exc)}" for exc in self.errors)
+        counts = [
+            f"{count} {label}"
+            for count, label in [
+                (len(self.failed), "failed"),
+                (self.passed, "passed"),
+                (self.cached, "cached"),
+                (len(self.errors), "error" if len(self.errors) == 1 else "errors"),
+            ]
+            if count != 0
+        ]
+        elapsed = perf_counter() - self._start
+        lines.append(f"{', '.join(counts) or 'no tests ran'} in {elapsed:.2f}s")
+        deduplicated = self.format_deduplicated()
+        if deduplicated is not None:
+            lines.append(deduplicated)
+        return lines
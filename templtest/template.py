@@ -14,87 +14,563 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from hashlib import sha1, sha256
+from importlib.metadata import version
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import (
+    Any,
+    Callable,
+    ChainMap,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    MutableMapping,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
 
 from ansible.parsing.dataloader import DataLoader
+from ansible.release import __version__ as ansible_version
 from ansible.template import Templar
-from jinja2 import Environment, FileSystemLoader
-from yaml import safe_load
+from jinja2 import (
+    BytecodeCache,
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    Template,
+)
+from jinja2.bccache import Bucket
+from jinja2.nodes import Template as TemplateNode
+from jinja2.utils import LRUCache
+
+from .analysis import TemplateDependencies, VariableUsage
+from .cache import Cache
+from .loader import load_file, ROLE_VAR_FILE_NAMES
+from .timing import Timer
+from .varcache import VariablesCache
 
 
 TemplateVars = Dict[str, Any]
 
+# Default limit of compiled templates kept by a renderer.
+TEMPLATE_CACHE_SIZE = 400
+
+# Default limit of rendered texts kept by a renderer for reuse.
+RENDER_CACHE_SIZE = 100
+
+# Number of characters passed to the writer of a streamed rendering at once.
+_STREAM_BATCH_SIZE = 64 * 1024
+
 
 class BaseTemplateRenderer:
     templates: Path
     defaults: Path
     vars: Path
 
-    def __init__(self, role: Path):
+    # Role defaults and vars are loaded once and are shared by all tests.
+    _role_variables: Optional[Tuple[TemplateVars, TemplateVars]]
+    _cache: Optional[Cache]
+    _variables_cache: Optional[VariablesCache]
+
+    def __init__(self, role: Path, cache: Optional[Cache] = None):
         self.templates = Path(role, "templates")
         self.defaults = Path(role, "defaults")
         self.vars = Path(role, "vars")
+        self._role_variables = None
+        self._cache = cache
+        self._variables_cache = None if cache is None else VariablesCache(cache)
 
     def render(
         self,
         template: Path,
         inventory: Optional[Path] = None,
         extra: Optional[Path] = None,
+        timer: Optional[Timer] = None,
     ) -> str:
         raise NotImplementedError()
 
+    def stream(  # pylint: disable=too-many-arguments
+        self,
+        template: Path,
+        write: Callable[[str], bool],
+        inventory: Optional[Path] = None,
+        extra: Optional[Path] = None,
+        timer: Optional[Timer] = None,
+    ) -> Optional[str]:
+        # Passes the rendered text to write chunk by chunk, until it returns
+        # False. The text, that can't be rendered chunk by chunk, is returned
+        # as a whole instead.
+        del write
+        return self.render(template, inventory, extra, timer)
+
     def load_variables(
         self, inventory: Optional[Path], extra: Optional[Path]
-    ) -> TemplateVars:
-        variables: TemplateVars = {}
-        if self.defaults.is_dir():
-            variables.update(_load_var_dir(self.defaults))
-        if inventory is not None:
-            variables.update(_yaml_load(inventory))
-        if self.vars.is_dir():
-            variables.update(_load_var_dir(self.vars))
+    ) -> ChainMap[str, Any]:
+        defaults, role_vars = self._load_role_variables()
+
+        # Layers are ordered from the greatest precedence to the least one.
+        # The topmost empty layer takes all the writes, so the shared role
+        # variables are never modified.
+        layers: List[TemplateVars] = [{}]
         if extra is not None:
-            variables.update(_yaml_load(extra))
-        return variables
+            layers.append(self._load_var_file(extra))
+        layers.append(role_vars)
+        if inventory is not None:
+            layers.append(self._load_var_file(inventory))
+        layers.append(defaults)
+        return ChainMap(*layers)
+
+    def reset_role_variables(self) -> None:
+        # Role defaults and vars are loaded again on the next rendering.
+        self._role_variables = None
+
+    def _load_role_variables(self) -> Tuple[TemplateVars, TemplateVars]:
+        if self._role_variables is None:
+            defaults: TemplateVars = {}
+            if self.defaults.is_dir():
+                defaults = self._load_var_dir(self.defaults)
+            role_vars: TemplateVars = {}
+            if self.vars.is_dir():
+                role_vars = self._load_var_dir(self.vars)
+            self._role_variables = (defaults, role_vars)
+        return self._role_variables
+
+    def _load_var_dir(self, directory: Path) -> TemplateVars:
+        path = _find_var_file(directory)
+        if path is None:
+            return {}
+        return self._load_var_file(path)
+
+    def _load_var_file(self, path: Path) -> TemplateVars:
+        if not path.is_file():
+            return {}
+        if self._variables_cache is None:
+            return load_file(path) or {}
+        return self._variables_cache.load(path) or {}
 
 
 class Jinja2TemplateRenderer(BaseTemplateRenderer):
+    _environment: Optional[Environment]
+
+    def __init__(self, role: Path, cache: Optional[Cache] = None):
+        super().__init__(role, cache)
+        self._environment = None
+
     def render(
         self,
         template: Path,
         inventory: Optional[Path] = None,
         extra: Optional[Path] = None,
+        timer: Optional[Timer] = None,
     ) -> str:
-        loader = FileSystemLoader(searchpath=str(self.templates))
-        environment = Environment(
-            loader=loader,
-            keep_trailing_newline=True,
-            lstrip_blocks=True,
-            trim_blocks=True,
-        )
-        renderer = environment.get_template(str(template))
-        variables = self.load_variables(inventory, extra)
-        return renderer.render(**variables)
+        timer = Timer() if timer is None else timer
+        with timer.measure("compile"):
+            renderer = self._get_environment().get_template(str(template))
+        with timer.measure("load_variables"):
+            variables = self.load_variables(inventory, extra)
+        with timer.measure("render"):
+            return renderer.render(**variables)
+
+    def _get_environment(self) -> Environment:
+        if self._environment is None:
+            loader = FileSystemLoader(searchpath=str(self.templates))
+            self._environment = Environment(
+                loader=loader,
+                keep_trailing_newline=True,
+                lstrip_blocks=True,
+                trim_blocks=True,
+                bytecode_cache=_create_bytecode_cache(
+                    self._cache, f"jinja2-{version('jinja2')}"
+                ),
+            )
+        return self._environment
 
 
 class AnsibleTemplateRenderer(BaseTemplateRenderer):
+    # The templar (and the Jinja environment with loaded filter and test
+    # plugins) is created on the first rendering and is reused afterwards.
+    # Only the variables are swapped between renderings.
+    _templar: Optional[Templar]
+    _globals: Dict[str, Any]
+    _template_cache_size: int
+    _sources: LRUCache
+    # Texts rendered from the same template with the same variable files are
+    # reused by tests, that differ only in the expected result.
+    _renders: LRUCache
+    _digests: LRUCache
+    _usage: VariableUsage
+
+    def __init__(
+        self,
+        role: Path,
+        cache: Optional[Cache] = None,
+        template_cache_size: int = TEMPLATE_CACHE_SIZE,
+    ):
+        super().__init__(role, cache)
+        self._templar = None
+        self._globals = {}
+        self._template_cache_size = template_cache_size
+        self._sources = LRUCache(template_cache_size)
+        self._renders = LRUCache(RENDER_CACHE_SIZE)
+        self._digests = LRUCache(template_cache_size)
+        self._usage = VariableUsage(TemplateDependencies(self.templates))
+
+    def __reduce__(self) -> Tuple[Callable[..., "AnsibleTemplateRenderer"], Any]:
+        # Tests sent to a worker process share a renderer of the worker.
+        return (
+            _get_shared_renderer,
+            (self.templates.parent, self._cache, self._template_cache_size),
+        )
+
     def render(
         self,
         template: Path,
         inventory: Optional[Path] = None,
         extra: Optional[Path] = None,
+        timer: Optional[Timer] = None,
     ) -> str:
-        loader = _create_dataloader(self.templates)
-        variables = self.load_variables(inventory, extra)
-        templar = _create_templar(loader, variables)
-        template_fullpath = Path(self.templates, template)
-        template_text = template_fullpath.read_text(encoding="utf-8")
-        return templar.template(
-            variable=template_text,
-            convert_data=False,
-            fail_on_undefined=False,
+        timer = Timer() if timer is None else timer
+        rendering = self._find_rendering(template, inventory, extra, timer)
+        if rendering.text is None:
+            rendering.text = self._render(template, rendering.variables, timer, None)
+            self._store_rendering(rendering)
+        return rendering.text
+
+    def stream(  # pylint: disable=too-many-arguments
+        self,
+        template: Path,
+        write: Callable[[str], bool],
+        inventory: Optional[Path] = None,
+        extra: Optional[Path] = None,
+        timer: Optional[Timer] = None,
+    ) -> Optional[str]:
+        timer = Timer() if timer is None else timer
+        rendering = self._find_rendering(template, inventory, extra, timer)
+        if rendering.text is not None:
+            return rendering.text
+        stream = _Stream(write)
+        text = self._render(template, rendering.variables, timer, stream)
+        if not stream.complete:
+            # Ansible returns the template source on undefined variable errors
+            # and doesn't render the text without Jinja syntax at all.
+            rendering.text = text
+            self._store_rendering(rendering)
+            return text
+        # Ansible appends the trailing newlines to the output held back.
+        write(text)
+        return None
+
+    def reset_role_variables(self) -> None:
+        super().reset_role_variables()
+        self.reset_renders()
+
+    def reset_renders(self) -> None:
+        # Templates and variable files may have changed since the texts were
+        # rendered.
+        self._renders.clear()
+        self._usage = VariableUsage(TemplateDependencies(self.templates))
+
+    def _find_rendering(
+        self,
+        template: Path,
+        inventory: Optional[Path],
+        extra: Optional[Path],
+        timer: Timer,
+    ) -> "_Rendering":
+        # The template source and the contents of the variable files define
+        # the rendered text along with the role variables, that are shared by
+        # all renderings. So the text is looked up by them first, and the
+        # variables are loaded only for new variable files. Then the text is
+        # looked up by values of the variables used by the template.
+        source = self._read_template(template)
+        rendering = _Rendering(
+            [(template, source, self._digest(inventory), self._digest(extra))]
         )
+        rendering.text = self._renders.get(rendering.keys[0])
+        if rendering.text is None:
+            with timer.measure("load_variables"):
+                rendering.variables = self.load_variables(inventory, extra)
+                digest = self._usage.digest(template, rendering.variables)
+            if digest is not None:
+                rendering.keys.append((template, source, digest))
+                rendering.text = self._renders.get(rendering.keys[1])
+        if rendering.text is not None:
+            timer.deduplicated = True
+            self._store_rendering(rendering)
+        return rendering
+
+    def _store_rendering(self, rendering: "_Rendering") -> None:
+        for key in rendering.keys:
+            self._renders[key] = rendering.text
+
+    def _digest(self, path: Optional[Path]) -> Optional[str]:
+        if path is None or not path.is_file():
+            return None
+        stat = path.stat()
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        digest = self._digests.get(key)
+        if digest is None:
+            digest = sha256(path.read_bytes()).hexdigest()
+            self._digests[key] = digest
+        return digest
+
+    def _render(
+        self,
+        template: Path,
+        variables: ChainMap[str, Any],
+        timer: Timer,
+        stream: Optional["_Stream"],
+    ) -> str:
+        with timer.measure("setup"):
+            templar = self._get_templar()
+        template_text = self._read_template(template)
+
+        # Reset the state, that may be changed by the previous rendering.
+        templar.environment.globals.clear()
+        templar.environment.globals.update(self._globals)
+        templar.available_variables = variables
+        # Compilation is measured by the environment within the rendering.
+        templar.environment.timer = timer
+        templar.environment.stream = stream
+        templar.environment.template_source = template_text
+        try:
+            with timer.measure("render"):
+                return templar.template(
+                    variable=template_text,
+                    convert_data=False,
+                    fail_on_undefined=False,
+                )
+        finally:
+            templar.environment.timer = None
+            templar.environment.stream = None
+            templar.environment.template_source = None
+            templar.available_variables = {}
+
+    def _get_templar(self) -> Templar:
+        if self._templar is None:
+            loader = _create_dataloader(self.templates)
+            self._templar = _create_templar(loader, {})
+            _enable_template_cache(self._templar.environment, self._template_cache_size)
+            self._templar.environment.bytecode_cache = _create_bytecode_cache(
+                self._cache,
+                f"jinja2-{version('jinja2')}-ansible-core-{ansible_version}",
+            )
+            self._globals = dict(self._templar.environment.globals)
+        return self._templar
+
+    def _read_template(self, template: Path) -> str:
+        # The same source string object is returned while the template file
+        # is not modified, so the compiled template is looked up in constant
+        # time.
+        path = Path(self.templates, template)
+        stat = path.stat()
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        source = self._sources.get(key)
+        if source is None:
+            source = path.read_text(encoding="utf-8")
+            self._sources[key] = source
+        return source
+
+
+@dataclass
+class _Rendering:
+    # Keys of a rendering in the memo of rendered texts, the variables of the
+    # rendering and its text, once it is found or rendered.
+    keys: List[Tuple[Any, ...]]
+    variables: ChainMap[str, Any] = field(default_factory=ChainMap)
+    text: Optional[str] = None
+
+
+_shared_renderers: Dict[Tuple[Any, ...], AnsibleTemplateRenderer] = {}
+
+
+def _get_shared_renderer(*args: Any) -> AnsibleTemplateRenderer:
+    try:
+        return _shared_renderers[args]
+    except KeyError:
+        renderer = AnsibleTemplateRenderer(*args)
+        _shared_renderers[args] = renderer
+        return renderer
+
+
+class _Stream:
+    # Passes chunks of the outermost template to write instead of joining
+    # them. Trailing newlines are held back and are returned by the render
+    # function, as Ansible counts them to restore the newlines, that Jinja
+    # strips.
+    write: Callable[[str], bool]
+    started: bool
+    complete: bool
+
+    def __init__(self, write: Callable[[str], bool]):
+        self.write = write
+        self.started = False
+        self.complete = False
+
+    def wrap(self, template: Template) -> Template:
+        # The compiled template is shared, so its copy is changed.
+        self.started = True
+        streaming = object.__new__(type(template))
+        streaming.__dict__.update(template.__dict__)
+        render_func = template.root_render_func
+
+        def root_render_func(context: Any) -> Iterator[str]:
+            return self._generate(render_func(context))
+
+        streaming.root_render_func = root_render_func  # type: ignore
+        return streaming
+
+    def _generate(self, chunks: Iterator[Any]) -> Iterator[str]:
+        # Small chunks are joined to reduce the overhead of writing them.
+        batch: List[str] = []
+        size = 0
+        for chunk in chunks:
+            text = str(chunk)
+            batch.append(text)
+            size += len(text)
+            if size < _STREAM_BATCH_SIZE:
+                continue
+            data = "".join(batch)
+            stripped = data.rstrip("\n")
+            batch = [data[len(stripped) :]]
+            size = len(batch[0])
+            if stripped and not self.write(stripped):
+                # Rendering of the rest of the template is skipped.
+                batch = []
+                break
+        self.complete = True
+        yield "".join(batch)
+
+
+class _CachingEnvironment(Environment):
+    # Compiled templates keyed by their source. Templar compiles every
+    # template string with from_string(), so the cache is applied there.
+    # Included and imported templates are cached by the environment itself.
+    compiled_templates: LRUCache
+    timer: Optional[Timer]
+    # Overlays share the stream with the environment, so only the outermost
+    # template is streamed.
+    stream: Optional[_Stream]
+    # Source of the rendered template file. Bytecode of other template
+    # strings (e.g. values of variables) is not stored in the bytecode cache.
+    template_source: Optional[str]
+
+    def overlay(self, *args: Any, **kwargs: Any) -> "_CachingEnvironment":
+        # Jinja stores bytecode by template name and source only, so templates
+        # compiled with other settings of an overlay must not be stored.
+        kwargs["bytecode_cache"] = None
+        return super().overlay(*args, **kwargs)
+
+    def from_string(  # pylint: disable=redefined-builtin
+        self,
+        source: Union[str, TemplateNode],
+        globals: Optional[MutableMapping[str, Any]] = None,
+        template_class: Optional[Type[Template]] = None,
+    ) -> Template:
+        template = self._get_compiled(source, globals, template_class)
+        if self.stream is not None and not self.stream.started:
+            return self.stream.wrap(template)
+        return template
+
+    def _get_compiled(  # pylint: disable=redefined-builtin
+        self,
+        source: Union[str, TemplateNode],
+        globals: Optional[MutableMapping[str, Any]],
+        template_class: Optional[Type[Template]],
+    ) -> Template:
+        # Overlays are created for templates with a Jinja override header.
+        # They have different settings and must not share compiled templates.
+        if (
+            self.overlayed
+            or globals is not None
+            or template_class is not None
+            or not isinstance(source, str)
+        ):
+            with self._measure_compile():
+                return super().from_string(source, globals, template_class)
+        compiled = self.compiled_templates.get(source)
+        if compiled is None:
+            with self._measure_compile():
+                compiled = self._compile_string(source)
+            self.compiled_templates[source] = compiled
+        return compiled
+
+    def _load_template(  # pylint: disable=redefined-builtin
+        self, name: str, globals: Optional[MutableMapping[str, Any]]
+    ) -> Template:
+        with self._measure_compile():
+            return super()._load_template(name, globals)
+
+    def _measure_compile(self) -> ContextManager[None]:
+        if self.timer is None:
+            return nullcontext()
+        return self.timer.measure("compile")
+
+    def _compile_string(self, source: str) -> Template:
+        if self.bytecode_cache is None or source != self.template_source:
+            return super().from_string(source)
+        # Template strings have no name, so their bytecode is stored under
+        # the source hash.
+        name = sha1(source.encode("utf-8")).hexdigest()
+        bucket = self.bytecode_cache.get_bucket(self, name, None, source)
+        code = bucket.code
+        if code is None:
+            code = self.compile(source)
+            bucket.code = code
+            self.bytecode_cache.set_bucket(bucket)
+        return self.template_class.from_code(self, code, self.make_globals(None))
+
+
+_caching_environment_classes: Dict[type, type] = {}
+
+
+def _caching_environment_class(cls: type) -> type:
+    try:
+        return _caching_environment_classes[cls]
+    except KeyError:
+        caching_cls = type(f"Caching{cls.__name__}", (_CachingEnvironment, cls), {})
+        _caching_environment_classes[cls] = caching_cls
+        return caching_cls
+
+
+def _enable_template_cache(environment: Environment, size: int) -> None:
+    # Ansible chooses the environment class itself, so caching is enabled by
+    # switching the class of the created environment.
+    environment.__class__ = _caching_environment_class(type(environment))
+    environment.cache = LRUCache(size)  # type: ignore[assignment]
+    environment.compiled_templates = LRUCache(size)  # type: ignore[attr-defined]
+    environment.timer = None  # type: ignore[attr-defined]
+    environment.stream = None  # type: ignore[attr-defined]
+    environment.template_source = None  # type: ignore[attr-defined]
+
+
+def _create_bytecode_cache(
+    cache: Optional[Cache], name: str
+) -> Optional[BytecodeCache]:
+    # Bytecode is stored per Jinja and Ansible versions. Jinja checks the
+    # source checksum and the Python version itself.
+    if cache is None:
+        return None
+    try:
+        directory = cache.makedir(Path("bytecode", name))
+    except OSError:
+        return None
+    return _BytecodeCache(str(directory))
+
+
+class _BytecodeCache(FileSystemBytecodeCache):
+    # The cache is an optimization, so failed writes are ignored and the
+    # template is compiled again next time.
+    def dump_bytecode(self, bucket: Bucket) -> None:
+        try:
+            super().dump_bytecode(bucket)
+        except OSError:
+            pass
 
 
 def _create_dataloader(basedir: Path) -> DataLoader:
@@ -111,16 +587,9 @@ def _create_templar(loader: DataLoader, variables: TemplateVars) -> Templar:
     return templar
 
 
-def _load_var_dir(directory: Path) -> TemplateVars:
-    for filename in ["main.yml", "main.yaml", "main"]:
+def _find_var_file(directory: Path) -> Optional[Path]:
+    for filename in ROLE_VAR_FILE_NAMES:
         path = Path(directory, filename)
         if path.is_file():
-            return _yaml_load(path)
-    return {}
-
-
-def _yaml_load(path: Path) -> TemplateVars:
-    if path.is_file():
-        data = path.read_text()
-        return safe_load(data)
-    return {}
+            return path
+    return None
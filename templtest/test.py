@@ -14,13 +14,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from difflib import unified_diff
 from pathlib import Path
-from typing import Optional
+from typing import Any, ChainMap, List, Optional, Tuple
 
+from .compare import compare, STREAM_THRESHOLD, StreamComparator
+from .diff import DiffOptions
 from .discovery import TestDefinition, Variables
 from .exception import AssertError
 from .template import AnsibleTemplateRenderer
+from .timing import Timer
 
 
 class Test:
@@ -33,18 +35,62 @@ class Test:
     # See: https://github.com/pytest-dev/pytest/issues/1879
     __test__ = False
 
-    def __init__(self, role_path: Path, src_path: Path, testdef: TestDefinition):
+    def __init__(
+        self,
+        role_path: Path,
+        src_path: Path,
+        testdef: TestDefinition,
+        renderer: Optional[AnsibleTemplateRenderer] = None,
+    ):
         self._role_path = role_path
         self._test_definition_src_path = src_path
         self._test_definition = testdef
-        self._renderer = AnsibleTemplateRenderer(self._role_path)
+        if renderer is None:
+            renderer = AnsibleTemplateRenderer(self._role_path)
+        self._renderer = renderer
+
+    @property
+    def name(self) -> str:
+        return self._test_definition.name
+
+    @property
+    def src_path(self) -> Path:
+        return self._test_definition_src_path
+
+    @property
+    def key(self) -> str:
+        return f"{self._test_definition_src_path.as_posix()}::{self.name}"
+
+    @property
+    def template(self) -> Path:
+        return self._test_definition.template
+
+    @property
+    def input_paths(self) -> List[Path]:
+        # Test files (except the template and role variables) that affect
+        # the outcome of the test.
+        paths = [self.expected_path]
+        if self._inventory_path is not None:
+            paths.append(self._inventory_path)
+        if self._extra_path is not None:
+            paths.append(self._extra_path)
+        return paths
+
+    @property
+    def expected_path(self) -> Path:
+        return self._base_path.joinpath(self._test_definition.expected_result)
+
+    @property
+    def definition_path(self) -> Path:
+        if self._test_definition_src_path.is_absolute():
+            return self._test_definition_src_path
+        return self._role_path.joinpath(
+            "templates_tests", self._test_definition_src_path
+        )
 
     @property
     def _base_path(self) -> Path:
-        parent_path = self._test_definition_src_path.parent
-        if parent_path.is_absolute():
-            return parent_path
-        return self._role_path.joinpath("templates_tests", parent_path)
+        return self.definition_path.parent
 
     @property
     def _inventory_path(self) -> Optional[Path]:
@@ -64,28 +110,68 @@ class Test:
         assert isinstance(self._test_definition.variables.extra, Path)
         return self._base_path.joinpath(self._test_definition.variables.extra)
 
-    def run(self) -> None:
-        actual = self._renderer.render(
+    @property
+    def _diff_labels(self) -> Tuple[str, str]:
+        fromfile_path = self.expected_path.relative_to(self._role_path)
+        tofile_path = Path("templates", self._test_definition.template)
+        return str(fromfile_path), f"render({tofile_path})"
+
+    def run(
+        self, timer: Optional[Timer] = None, diff_options: Optional[DiffOptions] = None
+    ) -> None:
+        timer = Timer() if timer is None else timer
+        if self.expected_path.stat().st_size >= STREAM_THRESHOLD:
+            self.run_streaming(timer, diff_options)
+        else:
+            self.compare(self.render(timer), timer, diff_options)
+
+    def run_streaming(
+        self, timer: Optional[Timer] = None, diff_options: Optional[DiffOptions] = None
+    ) -> None:
+        # Large texts are compared as they are rendered. Rendering stops
+        # shortly after the first difference.
+        timer = Timer() if timer is None else timer
+        labels = self._diff_labels
+        with StreamComparator(
+            self.expected_path, labels, timer, diff_options
+        ) as stream:
+            actual = self._renderer.stream(
+                template=self._test_definition.template,
+                write=stream.write,
+                inventory=self._inventory_path,
+                extra=self._extra_path,
+                timer=timer,
+            )
+            if actual is None:
+                result = stream.finish()
+            else:
+                result = compare(
+                    self.expected_path, actual, labels, timer, diff_options
+                )
+        if result:
+            raise AssertError(result)
+
+    def load_variables(self) -> ChainMap[str, Any]:
+        return self._renderer.load_variables(
+            inventory=self._inventory_path, extra=self._extra_path
+        )
+
+    def render(self, timer: Optional[Timer] = None) -> str:
+        return self._renderer.render(
             template=self._test_definition.template,
             inventory=self._inventory_path,
             extra=self._extra_path,
+            timer=timer,
         )
 
-        expect_path = self._base_path.joinpath(
-            self._test_definition.expected_result,
-        )
-        expect = expect_path.read_text()
-
-        fromfile_path = expect_path.relative_to(self._role_path)
-        tofile_path = Path("templates", self._test_definition.template)
-        diff = "\n".join(
-            unified_diff(
-                a=expect.splitlines(),
-                b=actual.splitlines(),
-                fromfile=str(fromfile_path),
-                tofile=f"render({tofile_path})",
-                lineterm="",
-            ),
+    def compare(
+        self,
+        actual: str,
+        timer: Optional[Timer] = None,
+        diff_options: Optional[DiffOptions] = None,
+    ) -> None:
+        result = compare(
+            self.expected_path, actual, self._diff_labels, timer, diff_options
         )
-        if diff:
-            raise AssertError(diff)
+        if result:
+            raise AssertError(result)
@@ -0,0 +1,68 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, Iterable, Iterator
+
+# Phases of a test run in the order of execution.
+PHASES = ["load_variables", "setup", "compile", "render", "read_expected", "compare"]
+
+Durations = Dict[str, float]
+
+
+class Timer:
+    # Accumulates time spent in phases of test runs. Time of a nested phase
+    # (e.g. compilation of an included template) is not counted in the
+    # enclosing one.
+    durations: Durations
+    # Whether the text rendered for another test with the same inputs was
+    # reused instead of rendering the template.
+    deduplicated: bool
+    _nested: float
+
+    def __init__(self) -> None:
+        self.durations = {}
+        self.deduplicated = False
+        self._nested = 0.0
+
+    @contextmanager
+    def measure(self, phase: str) -> Iterator[None]:
+        outer = self._nested
+        self._nested = 0.0
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.durations[phase] = (
+                self.durations.get(phase, 0.0) + elapsed - self._nested
+            )
+            self._nested = outer + elapsed
+
+
+def add_durations(durations: Iterable[Durations]) -> Durations:
+    total: Durations = {}
+    for item in durations:
+        for phase, duration in item.items():
+            total[phase] = total.get(phase, 0.0) + duration
+    return total
+
+
+def format_durations(durations: Durations) -> str:
+    phases = [phase for phase in PHASES if phase in durations]
+    phases.extend(sorted(phase for phase in durations if phase not in PHASES))
+    return ", ".join(f"{phase} {durations[phase]:.4f}s" for phase in phases)
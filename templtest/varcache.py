@@ -0,0 +1,106 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import marshal
+from hashlib import sha256
+from pathlib import Path
+from time import time_ns
+from typing import Any, Dict, Optional
+
+from .cache import Cache, RACY_INTERVAL_NS, write_atomic
+from .loader import load_data
+
+
+# Version of the entry format. Entries of other versions are ignored.
+_FORMAT = 2
+
+# Types of the entry fields besides the document.
+_FIELDS = {"stat": list, "cached": int, "digest": str}
+
+
+class VariablesCache:
+    # Parsed documents of variable files kept between runs. An entry is
+    # stored with marshal in a file named after the absolute path of the
+    # file. It is used without reading the file while the size and the
+    # modification time of the file are the same, otherwise while the
+    # content hash is the same. Unlike pickle, marshal never runs code while
+    # loading, but it supports only plain Python types, so documents with
+    # other values (e.g. YAML dates) are not cached.
+    _cache: Cache
+
+    def __init__(self, cache: Cache):
+        self._cache = cache
+
+    def load(self, path: Path) -> Any:
+        stat = path.stat()
+        file_stat = [stat.st_size, stat.st_mtime_ns]
+        entry_path = self._entry_path(path)
+        entry = _read_entry(entry_path)
+        if (
+            entry is not None
+            and entry["stat"] == file_stat
+            and entry["cached"] - stat.st_mtime_ns >= RACY_INTERVAL_NS
+        ):
+            return entry["document"]
+
+        data = path.read_bytes()
+        digest = sha256(data).hexdigest()
+        if entry is not None and entry["digest"] == digest:
+            document = entry["document"]
+        else:
+            document = load_data(path, data)
+        self._write_entry(
+            entry_path,
+            {
+                "format": _FORMAT,
+                "stat": file_stat,
+                "cached": time_ns(),
+                "digest": digest,
+                "document": document,
+            },
+        )
+        return document
+
+    def _write_entry(self, path: Path, entry: Dict[str, Any]) -> None:
+        # Entries that can't be written are parsed again next time.
+        try:
+            data = marshal.dumps(entry)
+        except ValueError:
+            return
+        try:
+            self._cache.makedir(path.parent.name)
+            write_atomic(path, data)
+        except OSError:
+            pass
+
+    def _entry_path(self, path: Path) -> Path:
+        name = sha256(str(path.resolve()).encode("utf-8")).hexdigest()
+        return Path(self._cache.path, "variables", f"{name}.marshal")
+
+
+def _read_entry(path: Path) -> Optional[Dict[str, Any]]:
+    # Missing and broken entries are parsed again.
+    try:
+        entry = marshal.loads(path.read_bytes())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(entry, dict) or entry.get("format") != _FORMAT:
+        return None
+    if "document" not in entry or not all(
+        isinstance(entry.get(key), type_) for key, type_ in _FIELDS.items()
+    ):
+        return None
+    return entry
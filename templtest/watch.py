@@ -0,0 +1,315 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+from ctypes import CDLL, get_errno
+from ctypes.util import find_library
+from errno import ENOENT, ENOTDIR
+from pathlib import Path
+from select import select
+from struct import Struct
+from time import monotonic, sleep
+from typing import AbstractSet, Dict, List, Optional, Set, Tuple
+
+from .dependency import DependencyIndex
+from .discovery import discover_tests, ErrorHandler, load_tests, Walker
+from .exception import TestDefinitionError
+from .template import AnsibleTemplateRenderer
+from .test import Test
+
+# Role directories, which changes may affect test results.
+WATCHED_DIRS = ["templates", "defaults", "vars", "templates_tests"]
+
+# Interval between scans of the polling watcher in seconds.
+POLL_INTERVAL = 0.5
+
+# Editors often write a file with several system calls. Events coming within
+# this period after a change are reported together.
+_SETTLE_TIME = 0.1
+
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_CLOEXEC = 0o2000000
+_IN_MASK = (
+    _IN_ATTRIB
+    | _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+)
+
+# struct inotify_event without the trailing name.
+_INOTIFY_EVENT = Struct("iIII")
+_INOTIFY_BUFFER_SIZE = 64 * 1024
+
+
+class Watcher:
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        # Blocks until files are changed and returns the changed paths. A
+        # changed directory means, that any file in it may be changed. An
+        # empty set is returned on timeout.
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        pass
+
+
+class PollingWatcher(Watcher):
+    _paths: List[Path]
+    _interval: float
+    _snapshot: Dict[Path, Tuple[int, int]]
+
+    def __init__(self, paths: List[Path], interval: float = POLL_INTERVAL):
+        self._paths = paths
+        self._interval = interval
+        self._snapshot = self._scan()
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = {
+                path
+                for path in snapshot.keys() | self._snapshot.keys()
+                if snapshot.get(path) != self._snapshot.get(path)
+            }
+            self._snapshot = snapshot
+            if changed:
+                return changed
+            if deadline is not None and monotonic() >= deadline:
+                return set()
+            sleep(self._interval)
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        snapshot = {}
+        for root in self._paths:
+            for directory, _, filenames in os.walk(root):
+                for filename in filenames:
+                    path = Path(directory, filename)
+                    try:
+                        stat = path.stat()
+                    except FileNotFoundError:
+                        continue
+                    snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+
+class InotifyWatcher(Watcher):
+    # Linux inotify API used with ctypes. Every directory of the watched trees
+    # gets its own watch, new directories are added as they appear.
+    _libc: CDLL
+    _fd: int
+    _paths: List[Path]
+    _watches: Dict[int, Path]
+
+    def __init__(self, paths: List[Path]):
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(_IN_CLOEXEC)
+        if self._fd < 0:
+            _raise_errno()
+        self._paths = paths
+        self._watches = {}
+        try:
+            for path in paths:
+                self._add_tree(path)
+        except OSError:
+            self.close()
+            raise
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        changed = self._read(timeout)
+        while changed:
+            settled = self._read(_SETTLE_TIME)
+            if not settled:
+                break
+            changed.update(settled)
+        return changed
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _add_tree(self, path: Path) -> None:
+        for directory, _, _ in os.walk(path):
+            self._add(Path(directory))
+
+    def _add(self, path: Path) -> None:
+        watch = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _IN_MASK)
+        if watch < 0:
+            # The directory may be removed before it is watched.
+            if get_errno() in (ENOENT, ENOTDIR):
+                return
+            _raise_errno()
+        self._watches[watch] = path
+
+    def _read(self, timeout: Optional[float]) -> Set[Path]:
+        ready, _, _ = select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        data = os.read(self._fd, _INOTIFY_BUFFER_SIZE)
+        changed: Set[Path] = set()
+        offset = 0
+        while offset < len(data):
+            watch, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                # Events are lost, so anything may be changed.
+                changed.update(self._paths)
+                continue
+            directory = self._watches.get(watch)
+            if directory is None:
+                continue
+            if mask & _IN_IGNORED:
+                del self._watches[watch]
+                continue
+            path = Path(directory, name)
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                self._add_tree(path)
+            changed.add(path)
+        return changed
+
+
+def create_watcher(paths: List[Path]) -> Watcher:
+    try:
+        return InotifyWatcher(paths)
+    except (AttributeError, OSError):
+        return PollingWatcher(paths)
+
+
+class WatchedTests:
+    # Tests of a role kept between runs of the watch mode. Only changed test
+    # definition files are loaded again.
+    role_path: Path
+    _renderer: AnsibleTemplateRenderer
+    _walker: Walker
+    _tests: Dict[Path, List[Test]]
+
+    def __init__(
+        self,
+        role_path: Path,
+        renderer: AnsibleTemplateRenderer,
+        walker: Walker = Walker(),
+    ):
+        self.role_path = role_path
+        self._renderer = renderer
+        self._walker = walker
+        self._tests = {}
+
+    @property
+    def base_path(self) -> Path:
+        return Path(self.role_path, "templates_tests")
+
+    @property
+    def paths(self) -> List[Path]:
+        return [Path(self.role_path, directory) for directory in WATCHED_DIRS]
+
+    @property
+    def tests(self) -> List[Test]:
+        return [test for tests in self._tests.values() for test in tests]
+
+    def load(self, on_error: Optional[ErrorHandler] = None) -> List[Test]:
+        self._tests = {}
+        self._renderer.reset_role_variables()
+        for testdef, src_path in discover_tests(
+            self.base_path, on_error, walker=self._walker
+        ):
+            self._tests.setdefault(src_path, []).append(
+                Test(self.role_path, src_path, testdef, self._renderer)
+            )
+        return self.tests
+
+    def update(
+        self, changed: AbstractSet[Path], on_error: Optional[ErrorHandler] = None
+    ) -> List[Test]:
+        # Returns tests affected by the changed paths.
+        index = DependencyIndex(self.role_path)
+        changed = {index.relative(path) for path in changed}
+        if _is_changed(Path("templates_tests", "meta.yml"), changed):
+            return self.load(on_error)
+        if _touches(Path("defaults"), changed) or _touches(Path("vars"), changed):
+            self._renderer.reset_role_variables()
+        else:
+            self._renderer.reset_renders()
+
+        src_paths = [
+            src_path
+            for src_path in self._tests
+            if _is_changed(Path("templates_tests", src_path), changed)
+        ]
+        src_paths.extend(
+            path.relative_to("templates_tests")
+            for path in sorted(changed)
+            if Path("templates_tests") in path.parents
+            and self._walker.matches(path.relative_to("templates_tests"))
+            and path.relative_to("templates_tests") not in self._tests
+        )
+        self._reload(src_paths, on_error)
+        return [
+            test
+            for test in self.tests
+            if test.src_path in src_paths or index.is_affected(test, changed)
+        ]
+
+    def _reload(self, src_paths: List[Path], on_error: Optional[ErrorHandler]) -> None:
+        error: Optional[TestDefinitionError] = None
+        for src_path in src_paths:
+            # Tests of an invalid file are not run until the file is fixed.
+            self._tests.pop(src_path, None)
+            if not Path(self.base_path, src_path).is_file():
+                continue
+            try:
+                self._tests[src_path] = [
+                    Test(self.role_path, src_path, testdef, self._renderer)
+                    for testdef, _ in load_tests(self.base_path, src_path)
+                ]
+            except TestDefinitionError as exc:
+                if on_error is not None:
+                    on_error(exc)
+                else:
+                    error = error or exc
+        if error is not None:
+            raise error
+
+
+def _is_changed(path: Path, changed: AbstractSet[Path]) -> bool:
+    return path in changed or not changed.isdisjoint(path.parents)
+
+
+def _touches(directory: Path, changed: AbstractSet[Path]) -> bool:
+    # Checks if anything in the directory is changed.
+    return _is_changed(directory, changed) or any(
+        directory in path.parents for path in changed
+    )
+
+
+def _load_libc() -> CDLL:
+    return CDLL(find_library("c") or "libc.so.6", use_errno=True)
+
+
+def _raise_errno() -> None:
+    errno = get_errno()
+    raise OSError(errno, os.strerror(errno))
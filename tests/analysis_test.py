@@ -0,0 +1,74 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+
+from templtest.analysis import TemplateDependencies, VariableUsage
+
+
+class TestTemplateDependencies:
+    def test_variables(self, resources):
+        templates_path = Path(resources, "roles", "with_include", "templates")
+
+        actual = TemplateDependencies(templates_path).variables(Path("foo.j2"))
+        expect = {"foo"}
+        assert expect == actual
+
+    def test_ansible_filter(self, resources):
+        templates_path = Path(resources, "roles", "ansible_filter", "templates")
+
+        actual = TemplateDependencies(templates_path).variables(Path("foo.j2"))
+        assert actual is not None
+
+    def test_syntax_error(self, tmp_path):
+        Path(tmp_path, "foo.j2").write_text("{{ foo", encoding="utf-8")
+
+        actual = TemplateDependencies(tmp_path).variables(Path("foo.j2"))
+        assert actual is None
+
+
+class TestVariableUsage:
+    def test_get(self, tmp_path):
+        Path(tmp_path, "foo.j2").write_text(
+            "{% set local = 1 %}{{ foo }} {{ local }}", encoding="utf-8"
+        )
+        usage = VariableUsage(TemplateDependencies(tmp_path))
+        variables = {
+            "foo": {"key": "{{ bar }}", "{{ baz }}": ["{{ qux }}"]},
+            "bar": "{# comment #}",
+            "unused": "{{ other }}",
+        }
+
+        actual = usage.get(Path("foo.j2"), variables)
+        expect = ["bar", "baz", "foo", "qux"]
+        assert expect == actual
+
+    def test_dynamic(self, tmp_path):
+        Path(tmp_path, "foo.j2").write_text("{{ foo }}", encoding="utf-8")
+        usage = VariableUsage(TemplateDependencies(tmp_path))
+
+        assert usage.get(Path("foo.j2"), {"foo": "{{ vars['bar'] }}"}) is None
+        assert usage.get(Path("foo.j2"), {"foo": "{{ lookup('env', 'X') }}"}) is None
+        assert usage.get(Path("foo.j2"), {"foo": "{{ bar"}) is None
+
+    def test_digest(self, tmp_path):
+        Path(tmp_path, "foo.j2").write_text("{{ foo }}", encoding="utf-8")
+        usage = VariableUsage(TemplateDependencies(tmp_path))
+
+        expect = usage.digest(Path("foo.j2"), {"foo": 1, "bar": 1})
+        assert expect == usage.digest(Path("foo.j2"), {"foo": 1, "bar": 2})
+        assert expect != usage.digest(Path("foo.j2"), {"foo": "1"})
+        assert expect != usage.digest(Path("foo.j2"), {})
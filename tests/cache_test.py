@@ -0,0 +1,41 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+
+from templtest.cache import Cache
+
+
+class TestCache:
+    def test_for_role(self):
+        role_path = Path("/", "home", "user", "ansible", "role")
+
+        actual = Cache.for_role(role_path)
+        expect = Cache(Path(role_path, ".templtest_cache"))
+        assert expect == actual
+
+    def test_makedir(self, tmp_path):
+        cache = Cache(Path(tmp_path, "cache"))
+
+        actual = cache.makedir(Path("foo", "bar"))
+        expect = Path(tmp_path, "cache", "foo", "bar")
+        assert expect == actual
+        assert actual.is_dir()
+
+        assert Path(tmp_path, "cache", ".gitignore").is_file()
+        assert Path(tmp_path, "cache", "CACHEDIR.TAG").is_file()
+
+        assert actual == cache.makedir(Path("foo", "bar"))
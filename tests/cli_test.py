@@ -14,20 +14,151 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from argparse import Namespace
-from contextlib import redirect_stdout, ExitStack
+from argparse import ArgumentTypeError, Namespace
+from contextlib import redirect_stderr, redirect_stdout, ExitStack
 from io import StringIO
 from pathlib import Path
 from textwrap import dedent
 
 from pytest import raises
 
-from templtest.cli import _parse_args, main
+from templtest.cache import write_json
+from templtest.cli import _jobs, _parse_args, main
+from templtest.selection import Expression
+from templtest.shard import Shard
+
+
+def _namespace(**kwargs):
+    defaults = {
+        "paths": [],
+        "role_path": Path("."),
+        "keyword": None,
+        "jobs": 1,
+        "cache_dir": None,
+        "no_cache": False,
+        "exclude": [],
+        "max_depth": None,
+        "collect_only": False,
+        "incremental": False,
+        "incremental_import": None,
+        "incremental_export": None,
+        "changed_since": None,
+        "affected_by": None,
+        "last_failed": False,
+        "failed_first": False,
+        "shard": None,
+        "shard_balance": False,
+        "durations_import": None,
+        "durations_export": None,
+        "maxfail": 1,
+        "diff_context": 3,
+        "diff_max_lines": 1000,
+        "diff_max_hunks": 50,
+        "diff_algorithm": "auto",
+        "durations": None,
+        "watch": False,
+    }
+    return Namespace(**{**defaults, **kwargs})
 
 
 def test_parse_args():
-    assert Namespace(role_path=Path(".")) == _parse_args([])
-    assert Namespace(role_path=Path("test")) == _parse_args(["--role-path=test"])
+    assert _namespace() == _parse_args([])
+    assert _namespace(role_path=Path("test")) == _parse_args(["--role-path=test"])
+    assert _namespace(jobs=4) == _parse_args(["--jobs=4"])
+    assert _namespace(paths=[Path("a"), Path("b")]) == _parse_args(["a", "b"])
+    assert _namespace(keyword=Expression("foo")) == _parse_args(["-k", "foo"])
+    assert _namespace(cache_dir=Path("cache")) == _parse_args(["--cache-dir=cache"])
+    assert _namespace(no_cache=True) == _parse_args(["--no-cache"])
+    assert _namespace(exclude=["a", "b"]) == _parse_args(["--exclude=a", "--exclude=b"])
+    assert _namespace(max_depth=0) == _parse_args(["--max-depth=0"])
+    assert _namespace(collect_only=True) == _parse_args(["--collect-only"])
+    assert _namespace(last_failed=True) == _parse_args(["--last-failed"])
+    assert _namespace(failed_first=True) == _parse_args(["--failed-first"])
+    assert _namespace(shard=Shard(2, 3)) == _parse_args(["--shard=2/3"])
+    assert _namespace(
+        shard=Shard(1, 2), shard_balance=True, durations_import=Path("d.json")
+    ) == _parse_args(["--shard=1/2", "--shard-balance", "--durations-import=d.json"])
+    assert _namespace(maxfail=3) == _parse_args(["--maxfail=3"])
+    assert _namespace(maxfail=0) == _parse_args(["--keep-going"])
+    assert _namespace(diff_context=0) == _parse_args(["--diff-context=0"])
+    assert _namespace(diff_max_lines=0) == _parse_args(["--diff-max-lines=0"])
+    assert _namespace(diff_max_hunks=1) == _parse_args(["--diff-max-hunks=1"])
+    assert _namespace(diff_algorithm="patience") == _parse_args(
+        ["--diff-algorithm=patience"]
+    )
+    assert _namespace(durations=5) == _parse_args(["--durations=5"])
+    assert _namespace(watch=True) == _parse_args(["--watch"])
+
+
+def test_parse_invalid_shard():
+    for value in ["0/2", "3/2", "1", "a/b"]:
+        with raises(SystemExit), redirect_stderr(StringIO()):
+            _parse_args([f"--shard={value}"])
+
+
+def test_parse_invalid_durations():
+    with raises(SystemExit), redirect_stderr(StringIO()):
+        _parse_args(["--durations=-1"])
+
+
+def test_parse_shard_balance():
+    for argv in [["--shard-balance"], ["--shard=1/2", "--shard-balance"]]:
+        with raises(SystemExit), redirect_stderr(StringIO()):
+            _parse_args(argv)
+
+
+class TestJobs:
+    def test_number(self):
+        assert 8 == _jobs("8")
+
+    def test_auto(self):
+        assert _jobs("auto") >= 1
+
+    def test_invalid(self):
+        with raises(ArgumentTypeError):
+            _jobs("0")
+        with raises(ArgumentTypeError):
+            _jobs("many")
+
+
+class TestMainCache:
+    def test_cache(self, resources, tmp_path):
+        role_path = Path(resources, "roles", "with_defaults")
+
+        with redirect_stdout(StringIO()):
+            main(argv=[f"--role-path={role_path}"])
+        assert Path(role_path, ".templtest_cache").is_dir()
+
+        cache_path = Path(tmp_path, "cache")
+        with redirect_stdout(StringIO()):
+            main(argv=[f"--role-path={role_path}", f"--cache-dir={cache_path}"])
+        assert cache_path.is_dir()
+
+    def test_no_cache(self, resources):
+        role_path = Path(resources, "roles", "with_defaults")
+
+        with redirect_stdout(StringIO()):
+            main(argv=[f"--role-path={role_path}", "--no-cache"])
+        assert not Path(role_path, ".templtest_cache").exists()
+
+    def test_cache_not_writable(self, resources):
+        role_path = Path(resources, "roles", "with_defaults")
+        cache_path = Path(role_path, ".templtest_cache")
+        cache_path.touch()
+
+        with redirect_stdout(StringIO()) as stdout:
+            main(argv=[f"--role-path={role_path}"])
+
+        lines = stdout.getvalue().splitlines()
+        assert lines[0].startswith(
+            f"warning: cache disabled, cannot write {cache_path}"
+        )
+        expect = [
+            '[test.yml] test variable definition in role "defaults/" ... ok',
+            "[test.yml] test variable definition in inventory ... ok",
+        ]
+        assert expect == lines[1:]
+        assert cache_path.is_file()
 
 
 class TestMain:
@@ -46,6 +177,272 @@ class TestMain:
         )
         assert expect == actual
 
+    def test_success_parallel(self, resources):
+        role_path = Path(resources, "roles", "with_defaults")
+
+        with redirect_stdout(StringIO()) as stdout:
+            main(argv=[f"--role-path={role_path}", "--jobs=2"])
+
+        actual = stdout.getvalue()
+        expect = dedent(
+            """\
+            [test.yml] test variable definition in role "defaults/" ... ok
+            [test.yml] test variable definition in inventory ... ok
+            """
+        )
+        assert expect == actual
+
+    def test_incremental(self, resources):
+        role_path = Path(resources, "roles", "with_defaults")
+        argv = [f"--role-path={role_path}", "--incremental"]
+
+        with redirect_stdout(StringIO()):
+            main(argv=argv)
+
+        with redirect_stdout(StringIO()) as stdout:
+            main(argv=argv)
+        actual = stdout.getvalue()
+        expect = dedent(
+            """\
+            [test.yml] test variable definition in role "defaults/" ... ok (cached)
+            [test.yml] test variable definition in inventory ... ok (cached)
+            """
+        )
+        assert expect == actual
+
+        Path(role_path, "defaults", "main.yml").write_text(
+            "foo: changed\n", encoding="utf-8"
+        )
+        with ExitStack() as stack:
+            stdout = stack.enter_context(redirect_stdout(StringIO()))
+            stack.enter_context(raises(SystemExit))
+
+            main(argv=argv)
+
+        actual = stdout.getvalue()
+        assert actual.startswith(
+            '[test.yml] test variable definition in role "defaults/" ... fail\n'
+        )
+
+    def test_incremental_export_import(self, resources, tmp_path):
+        role_path = Path(resources, "roles", "with_defaults")
+        fingerprints_path = Path(tmp_path, "fingerprints.json")
+        argv = [f"--role-path={role_path}", "--incremental", "--no-cache"]
+
+        with redirect_stdout(StringIO()):
+            main(argv=argv + [f"--incremental-export={fingerprints_path}"])
+
+        with redirect_stdout(StringIO()) as stdout:
+            main(argv=argv + [f"--incremental-import={fingerprints_path}"])
+        actual = stdout.getvalue()
+        expect = dedent(
+            """\
+            [test.yml] test variable definition in role "defaults/" ... ok (cached)
+            [test.yml] test variable definition in inventory ... ok (cached)
+            """
+        )
+        assert expect == actual
+
+    def test_affected_by(self, resources):
+        role_path = Path(resources, "roles", "with_include")
+        changed_path = Path(role_path, "templates", "bar.j2")
+
+        with redirect_stdout(StringIO()) as stdout:
+            main(argv=[f"--role-path={role_path}", f"--affected-by={changed_path}"])
+
+        actual = stdout.getvalue()
+        expect = "[test.yml] test included template ... ok\n"
+        assert expect == actual
+
+    def test_durations(self, resources):
+        role_path = Path(resources, "roles", "with_include")
+
+        with redirect_stdout(StringIO()) as stdout:
+            main(argv=[f"--role-path={role_path}", "--durations=1"])
+
+        lines = stdout.getvalue().splitlines()
+        assert 7 == len(lines)
+        assert "" == lines[2]
+        assert "slowest 1 tests:" == lines[3]
+        assert "] test " in lines[4]
+        assert "slowest 1 templates:" == lines[5]
+        assert ".j2 (1 tests): load_variables " in lines[6]
+
+    def test_shard(self, resources):
+        role_path = Path(resources, "roles", "with_include")
+        lines = []
+
+        for index in [1, 2]:
+            with redirect_stdout(StringIO()) as stdout:
+                main(argv=[f"--role-path={role_path}", f"--shard={index}/2"])
+            lines.extend(stdout.getvalue().splitlines())
+
+        actual = sorted(lines)
+        expect = [
+            "[test.yml] test included template ... ok",
+            "[test.yml] test template without includes ... ok",
+        ]
+        assert expect == actual
+
+    def test_shard_balance(self, resources, tmp_path):
+        role_path = Path(resources, "roles", "with_include")
+        durations_path = Path(tmp_path, "durations.json")
+
+        with redirect_stdout(StringIO()):
+            main(
+                argv=[
+                    f"--role-path={role_path}",
+                    f"--durations-export={durations_path}",
+                ]
+            )
+        assert durations_path.is_file()
+        assert Path(role_path, ".templtest_cache", "durations.json").is_file()
+
+        lines = []
+        for index, slowest in [
+            (1, "test included template"),
+            (2, "test template without includes"),
+        ]:
+            # Durations in the local caches of the machines differ.
+            write_json(
+                Path(role_path, ".templtest_cache", "durations.json"),
+                {f"test.yml::{slowest}": 100.0},
+            )
+            with redirect_stdout(StringIO()) as stdout:
+                main(
+                    argv=[
+                        f"--role-path={role_path}",
+                        f"--durations-import={durations_path}",
+                        f"--shard={index}/2",
+                        "--shard-balance",
+                    ]
+                )
+            lines.append(stdout.getvalue().splitlines())
+
+        assert [1, 1] == [len(shard_lines) for shard_lines in lines]
+        assert lines[0] != lines[1]
+
+    def test_collect_only(self, resources):
+        role_path = Path(resources, "roles", "with_include")
+        argv = [f"--role-path={role_path}", "--collect-only"]
+        expect = dedent(
+            """\
+            [test.yml] test included template
+            [test.yml] test template without includes
+
+            2 tests collected
+            """
+        )
+
+        with redirect_stdout(StringIO()) as stdout:
+            main(argv=argv)
+        assert expect == stdout.getvalue()
+        assert Path(role_path, ".templtest_cache", "discovery.json").is_file()
+
+        with redirect_stdout(StringIO()) as stdout:
+            main(argv=argv)
+        assert expect == stdout.getvalue()
+
+    def test_keyword(self, resources):
+        role_path = Path(resources, "roles", "with_include")
+
+        with redirect_stdout(StringIO()) as stdout:
+            main(argv=[f"--role-path={role_path}", "-k", "not included and baz"])
+
+        actual = stdout.getvalue()
+        expect = "[test.yml] test template without includes ... ok\n"
+        assert expect == actual
+
+    def test_paths(self, resources):
+        role_path = Path(resources, "roles", "with_include")
+
+        with redirect_stdout(StringIO()) as stdout:
+            main(
+                argv=[
+                    f"--role-path={role_path}",
+                    str(Path(role_path, "templates", "foo.j2")),
+                ]
+            )
+
+        actual = stdout.getvalue()
+        expect = "[test.yml] test included template ... ok\n"
+        assert expect == actual
+
+    def test_invalid_path(self, resources):
+        role_path = Path(resources, "roles", "with_include")
+
+        with ExitStack() as stack:
+            stdout = stack.enter_context(redirect_stdout(StringIO()))
+            stack.enter_context(raises(SystemExit))
+
+            main(argv=[f"--role-path={role_path}", str(Path(role_path, "defaults"))])
+
+        actual = stdout.getvalue()
+        expect = (
+            "SelectionError: path is not in templates or templates_tests "
+            "directory: defaults"
+        )
+        assert expect == actual
+
+    def test_watch(self, resources, monkeypatch):
+        role_path = Path(resources, "roles", "with_include")
+        changes = [{Path(role_path, "templates", "bar.j2")}]
+
+        class Watcher:
+            def wait(self):
+                if not changes:
+                    raise KeyboardInterrupt()
+                return changes.pop()
+
+            def close(self):
+                pass
+
+        monkeypatch.setattr("templtest.cli.create_watcher", lambda paths: Watcher())
+        with redirect_stdout(StringIO()) as stdout:
+            main(argv=[f"--role-path={role_path}", "--watch"])
+
+        actual = stdout.getvalue()
+        expect = dedent(
+            """\
+            [test.yml] test included template ... ok
+            [test.yml] test template without includes ... ok
+            waiting for changes...
+            [test.yml] test included template ... ok
+            waiting for changes...
+            """
+        )
+        assert expect == actual
+
+    def test_watch_error(self, resources, monkeypatch):
+        role_path = Path(resources, "roles", "with_defaults")
+        defaults_path = Path(role_path, "defaults", "main.yml")
+        defaults = defaults_path.read_text(encoding="utf-8")
+        edits = [defaults, "foo: [bar\n"]
+
+        class Watcher:
+            def wait(self):
+                if not edits:
+                    raise KeyboardInterrupt()
+                defaults_path.write_text(edits.pop(), encoding="utf-8")
+                return {defaults_path}
+
+            def close(self):
+                pass
+
+        monkeypatch.setattr("templtest.cli.create_watcher", lambda paths: Watcher())
+        with redirect_stdout(StringIO()) as stdout:
+            main(argv=[f"--role-path={role_path}", "--watch"])
+
+        actual = stdout.getvalue().splitlines()
+        expect = [
+            '[test.yml] test variable definition in role "defaults/" ... ok',
+            "[test.yml] test variable definition in inventory ... ok",
+            "waiting for changes...",
+        ]
+        assert expect == actual[:3]
+        assert actual[3].startswith("ParserError: while parsing a flow sequence")
+        assert expect == actual[-3:]
+
     def test_faiure(self, resources):
         role_path = Path(resources, "roles", "test_failure")
 
@@ -70,6 +467,85 @@ class TestMain:
 
         assert 1 == excinfo.value.code
 
+    def test_keep_going(self, resources):
+        role_path = Path(resources, "roles", "keep_going")
+
+        with ExitStack() as stack:
+            stdout = stack.enter_context(redirect_stdout(StringIO()))
+            excinfo = stack.enter_context(raises(SystemExit))
+
+            main(argv=[f"--role-path={role_path}", "--keep-going"])
+
+        lines = stdout.getvalue().splitlines()
+        assert "[test.yml] this test fails ... fail" in lines
+        assert "[test.yml] this test passes ... ok" in lines
+        error = (
+            "TestDefinitionError: invalid definition file 'test-invalid.yml': "
+            "invalid test definition #0: invalid variables attribute: "
+            "invalid inventory attribute: path is empty string"
+        )
+        assert error in lines
+        assert [
+            "",
+            "FAILED [test.yml] this test fails",
+            f"ERROR {error}",
+        ] == lines[-5:-2]
+        assert lines[-2].startswith("1 failed, 1 passed, 1 error in ")
+        assert "1 render saved by deduplication" == lines[-1]
+
+        assert 1 == excinfo.value.code
+
+    def test_maxfail(self, resources):
+        role_path = Path(resources, "roles", "keep_going")
+
+        with ExitStack() as stack:
+            stdout = stack.enter_context(redirect_stdout(StringIO()))
+            stack.enter_context(raises(SystemExit))
+
+            main(argv=[f"--role-path={role_path}", "--maxfail=2"])
+
+        lines = stdout.getvalue().splitlines()
+        assert "[test.yml] this test fails ... fail" in lines
+        assert lines[-1].startswith("1 failed, ")
+        assert "1 error in " in lines[-1]
+
+    def test_last_failed(self, resources):
+        role_path = Path(resources, "roles", "keep_going")
+        Path(role_path, "templates_tests", "test-invalid.yml").unlink()
+        argv = [f"--role-path={role_path}", "--keep-going"]
+
+        with redirect_stdout(StringIO()), raises(SystemExit):
+            main(argv=argv)
+
+        with ExitStack() as stack:
+            stdout = stack.enter_context(redirect_stdout(StringIO()))
+            stack.enter_context(raises(SystemExit))
+
+            main(argv=argv + ["--failed-first"])
+
+        lines = stdout.getvalue().splitlines()
+        assert "[test.yml] this test fails ... fail" == lines[0]
+        assert "[test.yml] this test passes ... ok" in lines
+
+        with ExitStack() as stack:
+            stdout = stack.enter_context(redirect_stdout(StringIO()))
+            stack.enter_context(raises(SystemExit))
+
+            main(argv=argv + ["--last-failed"])
+
+        lines = stdout.getvalue().splitlines()
+        assert "[test.yml] this test fails ... fail" == lines[0]
+        assert "[test.yml] this test passes ... ok" not in lines
+
+        Path(role_path, "templates_tests", "baz").write_text("bar\n", encoding="utf-8")
+        with redirect_stdout(StringIO()) as stdout:
+            main(argv=argv + ["--last-failed"])
+        assert stdout.getvalue().startswith("[test.yml] this test fails ... ok\n")
+
+        with redirect_stdout(StringIO()) as stdout:
+            main(argv=argv + ["--last-failed"])
+        assert 2 == stdout.getvalue().count(" ... ok\n")
+
     def test_invalid_test_definition(self, resources):
         role_path = Path(resources, "roles", "invalid_path_in_test_definition")
 
@@ -0,0 +1,133 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+from textwrap import dedent
+
+from templtest.compare import (
+    compare,
+    is_match,
+    map_file,
+    STREAM_WINDOW,
+    StreamComparator,
+)
+
+
+def test_map_file(tmp_path):
+    path = Path(tmp_path, "foo")
+    path.write_bytes(b"foo\n")
+    with map_file(path) as data:
+        assert b"foo\n" == data[:]
+
+
+def test_map_empty_file(tmp_path):
+    path = Path(tmp_path, "foo")
+    path.write_bytes(b"")
+    with map_file(path) as data:
+        assert b"" == data[:]
+
+
+def test_is_match():
+    assert is_match(b"foo\n", "foo\n")
+    assert is_match("ф\n".encode("utf-8"), "ф\n")
+    assert not is_match(b"foo\n", "foo")
+    assert not is_match(b"foo\n", "bar\n")
+
+
+class TestCompare:
+    def test_match(self, tmp_path):
+        path = Path(tmp_path, "foo")
+        path.write_bytes(b"foo\nbar\n")
+
+        assert "" == compare(path, "foo\nbar\n", ("foo", "bar"))
+
+    def test_line_endings(self, tmp_path):
+        path = Path(tmp_path, "foo")
+        path.write_bytes(b"foo\r\nbar")
+
+        assert "" == compare(path, "foo\nbar\n", ("foo", "bar"))
+
+    def test_mismatch(self, tmp_path):
+        path = Path(tmp_path, "foo")
+        path.write_bytes(b"foo\nbaz\n")
+
+        actual = compare(path, "foo\nbar\n", ("foo", "bar"))
+        expect = dedent(
+            """\
+            --- foo
+            +++ bar
+            @@ -1,2 +1,2 @@
+             foo
+            -baz
+            +bar"""
+        )
+        assert expect == actual
+
+
+class TestStreamComparator:
+    def test_match(self, tmp_path):
+        path = Path(tmp_path, "foo")
+        path.write_bytes(b"foo\r\nbar\nbaz\n")
+
+        with StreamComparator(path, ("foo", "bar")) as stream:
+            for chunk in ["fo", "o\r", "\nbar", "\n", "baz"]:
+                assert stream.write(chunk)
+            assert "" == stream.finish()
+
+    def test_mismatch(self, tmp_path):
+        path = Path(tmp_path, "foo")
+        lines = [f"line {idx}" for idx in range(10)]
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+        lines[6] = "changed"
+        with StreamComparator(path, ("foo", "bar")) as stream:
+            for line in lines:
+                stream.write(line + "\n")
+            actual = stream.finish()
+        expect = dedent(
+            """\
+            --- foo
+            +++ bar
+            @@ -4,7 +4,7 @@
+             line 3
+             line 4
+             line 5
+            -line 6
+            +changed
+             line 7
+             line 8
+             line 9"""
+        )
+        assert expect == actual
+
+    def test_shorter(self, tmp_path):
+        path = Path(tmp_path, "foo")
+        path.write_bytes(b"foo\nbar\n")
+
+        with StreamComparator(path, ("foo", "bar")) as stream:
+            stream.write("foo\n")
+            actual = stream.finish()
+        expect = "--- foo\n+++ bar\n@@ -1,2 +1 @@\n foo\n-bar"
+        assert expect == actual
+
+    def test_stop(self, tmp_path):
+        path = Path(tmp_path, "foo")
+        path.write_bytes(b"foo\n")
+
+        with StreamComparator(path, ("foo", "bar")) as stream:
+            results = [stream.write("bar\n") for _ in range(STREAM_WINDOW + 1)]
+            stream.finish()
+        assert not results[STREAM_WINDOW - 1]
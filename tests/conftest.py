@@ -21,8 +21,12 @@ from shutil import copytree
 # See: https://github.com/python/mypy/issues/6189
 import sys
 
+from jinja2 import Environment
 from pytest import fixture
 
+from templtest.discovery import TestDefinition, Variables
+from templtest.test import Test
+
 if sys.version_info >= (3, 9):
     from importlib.resources import files
 else:
@@ -34,3 +38,46 @@ def resources(tmp_path):
     src_path = Path(files(__package__), "data")
     dest_path = Path(tmp_path, "data")
     return copytree(src_path, dest_path)
+
+
+@fixture
+def create_test():
+    # Creates a test without a test definition file.
+    def create(  # pylint: disable=too-many-arguments
+        name="test",
+        role_path=Path("role"),
+        src_path="test.yml",
+        template="foo.j2",
+        expected_result="foo",
+        inventory=None,
+        renderer=None,
+    ):
+        variables = None
+        if inventory is not None:
+            variables = Variables(inventory=Path(inventory), extra=None)
+        return Test(
+            role_path=role_path,
+            src_path=Path(src_path),
+            testdef=TestDefinition(
+                name=name,
+                template=Path(template),
+                variables=variables,
+                expected_result=Path(expected_result),
+            ),
+            renderer=renderer,
+        )
+
+    return create
+
+
+@fixture
+def parsed_templates(monkeypatch):
+    parsed = []
+    parse = Environment._parse  # pylint: disable=protected-access
+
+    def counting_parse(self, source, name, filename):
+        parsed.append(name)
+        return parse(self, source, name, filename)
+
+    monkeypatch.setattr(Environment, "_parse", counting_parse)
+    return parsed
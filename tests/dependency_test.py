@@ -0,0 +1,123 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+
+from templtest.dependency import DependencyIndex, TemplateDependencies
+
+
+class TestTemplateDependencies:
+    def test_without_dependencies(self, resources):
+        templates_path = Path(resources, "roles", "with_defaults", "templates")
+
+        actual = TemplateDependencies(templates_path).get(Path("foo.j2"))
+        expect = {Path("foo.j2")}
+        assert expect == actual
+
+    def test_include(self, resources):
+        templates_path = Path(resources, "roles", "with_include", "templates")
+
+        actual = TemplateDependencies(templates_path).get(Path("foo.j2"))
+        expect = {Path("foo.j2"), Path("bar.j2")}
+        assert expect == actual
+
+    def test_transitive(self, tmp_path):
+        Path(tmp_path, "foo.j2").write_text('{% extends "base.j2" %}', encoding="utf-8")
+        Path(tmp_path, "base.j2").write_text(
+            '{% import "macros.j2" as macros %}', encoding="utf-8"
+        )
+        Path(tmp_path, "macros.j2").write_text("", encoding="utf-8")
+        Path(tmp_path, "unused.j2").write_text("", encoding="utf-8")
+
+        actual = TemplateDependencies(tmp_path).get(Path("foo.j2"))
+        expect = {Path("foo.j2"), Path("base.j2"), Path("macros.j2")}
+        assert expect == actual
+
+    def test_dynamic_include(self, tmp_path):
+        Path(tmp_path, "foo.j2").write_text("{% include name %}", encoding="utf-8")
+        Path(tmp_path, "bar.j2").write_text("", encoding="utf-8")
+
+        actual = TemplateDependencies(tmp_path).get(Path("foo.j2"))
+        expect = {Path("foo.j2"), Path("bar.j2")}
+        assert expect == actual
+
+    def test_jinja2_override_header(self, resources):
+        templates_path = Path(resources, "roles", "jinja2_override", "templates")
+        Path(templates_path, "bar.j2").write_text("", encoding="utf-8")
+
+        actual = TemplateDependencies(templates_path).get(Path("foo.j2"))
+        expect = {Path("foo.j2"), Path("bar.j2")}
+        assert expect == actual
+
+
+class TestDependencyIndex:
+    def test_get(self, resources, create_test):
+        role_path = Path(resources, "roles", "with_include")
+
+        actual = DependencyIndex(role_path).get(
+            create_test(
+                role_path=role_path,
+                src_path="subdir/test.yml",
+                inventory="inventory.yml",
+            )
+        )
+        expect = [
+            Path("templates", "bar.j2"),
+            Path("templates", "foo.j2"),
+            Path("defaults", "main.yml"),
+            Path("defaults", "main.yaml"),
+            Path("defaults", "main"),
+            Path("defaults", "main.json"),
+            Path("vars", "main.yml"),
+            Path("vars", "main.yaml"),
+            Path("vars", "main"),
+            Path("vars", "main.json"),
+            Path("templates_tests", "subdir", "foo"),
+            Path("templates_tests", "subdir", "inventory.yml"),
+        ]
+        assert expect == actual
+
+    def test_is_affected(self, resources, create_test):
+        role_path = Path(resources, "roles", "with_include")
+        index = DependencyIndex(role_path)
+        test = create_test(
+            role_path=role_path, src_path="subdir/test.yml", inventory="inventory.yml"
+        )
+
+        assert index.is_affected(test, {Path("templates", "bar.j2")})
+        assert index.is_affected(test, {Path("templates_tests", "subdir", "test.yml")})
+        assert not index.is_affected(test, {Path("templates", "baz.j2")})
+        assert not index.is_affected(test, set())
+
+    def test_is_affected_by_directory(self, resources, create_test):
+        role_path = Path(resources, "roles", "with_include")
+        index = DependencyIndex(role_path)
+        test = create_test(
+            role_path=role_path, src_path="subdir/test.yml", inventory="inventory.yml"
+        )
+
+        assert index.is_affected(test, {Path("templates")})
+        assert index.is_affected(test, {Path("templates_tests", "subdir")})
+        assert not index.is_affected(test, {Path("tasks")})
+
+    def test_relative(self, resources):
+        role_path = Path(resources, "roles", "with_include")
+
+        actual = DependencyIndex(role_path).relative(
+            Path(role_path, "templates", "foo.j2")
+        )
+        expect = Path("templates", "foo.j2")
+        assert expect == actual
@@ -0,0 +1,102 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from difflib import unified_diff as difflib_unified_diff
+
+from pytest import mark
+
+from templtest.diff import DiffOptions, iter_hunks, patience_opcodes, unified_diff
+
+
+def _apply(old, opcodes):
+    new = []
+    for tag, old_start, old_stop, new_start, new_stop in opcodes:
+        if tag == "equal":
+            new.extend(old[old_start:old_stop])
+        else:
+            new.extend(["?"] * (new_stop - new_start))
+    return new
+
+
+class TestUnifiedDiff:
+    @mark.parametrize("context", [0, 1, 3])
+    def test_difflib_format(self, context):
+        old = ["a", "b", "c", "d", "e", "f", "g", "h", "i"]
+        new = ["a", "x", "c", "d", "e", "f", "g", "y", "i", "j"]
+        options = DiffOptions(context=context, algorithm="difflib")
+
+        expect = "\n".join(
+            difflib_unified_diff(old, new, "foo", "bar", lineterm="", n=context)
+        )
+        actual = unified_diff(old, new, ("foo", "bar"), options)
+        assert expect == actual
+
+    def test_equal(self):
+        assert "" == unified_diff(["a"], ["a"], ("foo", "bar"))
+
+    def test_max_lines(self):
+        old = [str(idx) for idx in range(10)]
+        new = [f"{idx}!" for idx in range(10)]
+        options = DiffOptions(max_lines=5)
+
+        actual = unified_diff(old, new, ("foo", "bar"), options).splitlines()
+        assert ["--- foo", "+++ bar", "@@ -1,10 +1,10 @@"] == actual[:3]
+        assert "[diff truncated: 16 more lines]" == actual[-1]
+        assert 8 == len(actual)
+
+    def test_max_hunks(self):
+        old = [str(idx) for idx in range(100)]
+        new = [f"{idx}!" if idx % 10 == 0 else str(idx) for idx in range(100)]
+        options = DiffOptions(context=1, max_hunks=2)
+
+        actual = unified_diff(old, new, ("foo", "bar"), options).splitlines()
+        assert 2 == sum(line.startswith("@@") for line in actual)
+        assert "[diff truncated: 40 more lines in 8 more hunks]" == actual[-1]
+
+
+class TestPatience:
+    def test_moved_block(self):
+        old = ["a", "b", "c", "x", "y", "z"]
+        new = ["x", "y", "z", "a", "b", "c"]
+
+        opcodes = patience_opcodes(old, new)
+        assert len(new) == len(_apply(old, opcodes))
+        assert any(tag == "equal" for tag, *_ in opcodes)
+
+    def test_unique_lines_anchor(self):
+        old = ["{", "foo", "}", "{", "bar", "}"]
+        new = ["{", "foo", "}", "{", "baz", "}", "{", "bar", "}"]
+
+        actual = patience_opcodes(old, new)
+        expect = [
+            ("equal", 0, 4, 0, 4),
+            ("insert", 4, 4, 4, 7),
+            ("equal", 4, 6, 7, 9),
+        ]
+        assert expect == actual
+
+    def test_large_auto(self):
+        old = [f"line {idx}" for idx in range(3000)]
+        new = list(old)
+        new[1500] = "changed"
+
+        actual = unified_diff(old, new, ("foo", "bar"))
+        assert "@@ -1498,7 +1498,7 @@" == actual.splitlines()[2]
+
+
+def test_iter_hunks_offset():
+    hunks = list(iter_hunks(["a", "b"], ["a", "c"], DiffOptions(), offset=10))
+    assert [["@@ -11,2 +11,2 @@", " a", "-b", "+c"]] == hunks
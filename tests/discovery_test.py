@@ -14,7 +14,10 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from os import utime
 from pathlib import Path
+from textwrap import dedent
+from time import time_ns
 
 # Mypy doesn't understand `from sys import version_info` variant.
 # See: https://github.com/python/mypy/issues/6189
@@ -27,9 +30,12 @@ from templtest.discovery import (
     _create_path,
     _iter_testdefs,
     discover_tests,
+    DiscoveryIndex,
+    INDEX_VERSION,
     Meta,
     TestDefinition,
     Variables,
+    Walker,
 )
 from templtest.exception import TestDefinitionError
 
@@ -669,3 +675,197 @@ class TestDiscoverTests:
         actual = excinfo.value.args[0]
         expect = "unsupported testing speification version"
         assert expect == actual
+
+    def test_error_handler(self, resources):
+        tests_path = Path(resources, "roles", "keep_going", "templates_tests")
+        errors = []
+
+        discovered = list(discover_tests(tests_path, errors.append))
+
+        actual = [testdef.name for testdef, _ in discovered]
+        expect = ["this test fails", "this test passes"]
+        assert expect == actual
+
+        actual = [exc.args[0] for exc in errors]
+        expect = ["invalid definition file 'test-invalid.yml'"]
+        assert expect == actual
+
+    def test_select_file(self, resources):
+        tests_path = Path(
+            resources,
+            "roles",
+            "multiple_files_with_test_definitions",
+            "templates_tests",
+        )
+
+        discovered = list(
+            discover_tests(tests_path, select_file=lambda path: path.parent.name)
+        )
+
+        actual = {self.get_path(item) for item in discovered}
+        expect = {Path("subdir", "test.yml"), Path("subdir", "test-baz.yml")}
+        assert expect == actual
+
+
+# An hour ago.
+_PAST_NS = time_ns() - 3600 * 10**9
+
+
+def _write_tests(tests_path, count, mtime_ns=_PAST_NS):
+    tests_path.mkdir()
+    Path(tests_path, "meta.yml").write_text('version: "0.1"\n', encoding="utf-8")
+    for idx in range(count):
+        path = Path(tests_path, f"test-{idx:02}.yml")
+        path.write_text(
+            dedent(
+                f"""\
+                tests:
+                  - name: test {idx}
+                    template: foo.j2
+                    variables:
+                      inventory: inventory.yml
+                    expected_result: foo
+                """
+            ),
+            encoding="utf-8",
+        )
+        if mtime_ns is not None:
+            utime(path, ns=(mtime_ns, mtime_ns))
+
+
+class TestDiscoveryIndex:
+    def test_unchanged_files_are_not_parsed(self, tmp_path):
+        tests_path = Path(tmp_path, "templates_tests")
+        _write_tests(tests_path, 2)
+        index = DiscoveryIndex()
+
+        expect = list(discover_tests(tests_path, index=index))
+        assert index.modified
+        assert expect == list(discover_tests(tests_path, index=DiscoveryIndex()))
+
+        index = DiscoveryIndex(index.document)
+        index.files["test-01.yml"]["tests"][0]["name"] = "from index"
+        actual = {
+            testdef.name for testdef, _ in discover_tests(tests_path, index=index)
+        }
+        assert {"test 0", "from index"} == actual
+        assert not index.modified
+
+    def test_changed_files_are_parsed(self, tmp_path):
+        tests_path = Path(tmp_path, "templates_tests")
+        _write_tests(tests_path, 2)
+        index = DiscoveryIndex()
+        list(discover_tests(tests_path, index=index))
+
+        Path(tests_path, "test-01.yml").write_text(
+            "tests:\n  - {name: changed, template: foo.j2, expected_result: foo}\n",
+            encoding="utf-8",
+        )
+        Path(tests_path, "test-00.yml").unlink()
+        actual = [
+            testdef.name for testdef, _ in discover_tests(tests_path, index=index)
+        ]
+        assert ["changed"] == actual
+        assert ["test-01.yml"] == list(index.files)
+
+    def test_racy_modification_time(self, tmp_path):
+        # The file is changed right after indexing without changing its size
+        # and modification time.
+        tests_path = Path(tmp_path, "templates_tests")
+        _write_tests(tests_path, 1, mtime_ns=None)
+        path = Path(tests_path, "test-00.yml")
+        mtime_ns = path.stat().st_mtime_ns
+        index = DiscoveryIndex()
+        list(discover_tests(tests_path, index=index))
+
+        content = path.read_text(encoding="utf-8").replace("test 0", "test X")
+        path.write_text(content, encoding="utf-8")
+        utime(path, ns=(mtime_ns, mtime_ns))
+        actual = [
+            testdef.name for testdef, _ in discover_tests(tests_path, index=index)
+        ]
+        assert ["test X"] == actual
+
+    def test_version(self):
+        index = DiscoveryIndex({"version": INDEX_VERSION + 1, "files": {"a": {}}})
+        assert {} == index.files
+
+    def test_parallel(self, tmp_path):
+        tests_path = Path(tmp_path, "templates_tests")
+        _write_tests(tests_path, 20)
+        Path(tests_path, "test-05.yml").write_text("tests: {}\n", encoding="utf-8")
+        errors = []
+
+        actual = list(discover_tests(tests_path, errors.append, jobs=2))
+
+        assert 19 == len(actual)
+        assert {testdef.name for testdef, _ in actual} == {
+            f"test {idx}" for idx in range(20) if idx != 5
+        }
+        assert ["invalid definition file 'test-05.yml'"] == [
+            exc.args[0] for exc in errors
+        ]
+        assert "test definitions are not list" == errors[0].__cause__.args[0]
+
+
+class TestWalker:
+    @staticmethod
+    def create_tree(base_path):
+        for path in [
+            "test.yml",
+            "foo",
+            "b/test-b.yml",
+            "a/test.yml",
+            "a/fixtures/test.yml",
+            "a/c/test.yml",
+            "fixtures/test.yml",
+        ]:
+            Path(base_path, path).parent.mkdir(parents=True, exist_ok=True)
+            Path(base_path, path).touch()
+
+    def test_find(self, tmp_path):
+        self.create_tree(tmp_path)
+
+        actual = list(Walker().find(tmp_path))
+        expect = [
+            Path("test.yml"),
+            Path("a", "test.yml"),
+            Path("a", "c", "test.yml"),
+            Path("a", "fixtures", "test.yml"),
+            Path("b", "test-b.yml"),
+            Path("fixtures", "test.yml"),
+        ]
+        assert expect == actual
+
+    def test_symlinked_directory(self, tmp_path):
+        self.create_tree(tmp_path)
+        Path(tmp_path, "a", "loop").symlink_to(tmp_path, target_is_directory=True)
+
+        actual = list(Walker().find(tmp_path))
+        assert len(set(actual)) == len(actual) == 6
+
+    def test_exclude(self, tmp_path):
+        self.create_tree(tmp_path)
+        walker = Walker(exclude=("fixtures", "a/c", "test-*.yml"))
+
+        actual = list(walker.find(tmp_path))
+        expect = [Path("test.yml"), Path("a", "test.yml")]
+        assert expect == actual
+        assert all(walker.matches(path) for path in expect)
+        assert not walker.matches(Path("a", "fixtures", "test.yml"))
+        assert not walker.matches(Path("a", "c", "test.yml"))
+        assert not walker.matches(Path("a", "foo"))
+
+    def test_max_depth(self, tmp_path):
+        self.create_tree(tmp_path)
+        walker = Walker(max_depth=1)
+
+        actual = list(walker.find(tmp_path))
+        expect = [
+            Path("test.yml"),
+            Path("a", "test.yml"),
+            Path("b", "test-b.yml"),
+            Path("fixtures", "test.yml"),
+        ]
+        assert expect == actual
+        assert not walker.matches(Path("a", "c", "test.yml"))
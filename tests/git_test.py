@@ -0,0 +1,72 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+from subprocess import run
+
+from pytest import raises
+
+from templtest.exception import GitError
+from templtest.git import changed_files
+
+
+def git(*args, cwd):
+    run(
+        [
+            "git",
+            "-c",
+            "user.name=templtest",
+            "-c",
+            "user.email=templtest@example.com",
+            *args,
+        ],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+    )
+
+
+def init_repository(path):
+    git("init", cwd=path)
+    git("add", ".", cwd=path)
+    git("commit", "-m", "initial", cwd=path)
+
+
+class TestChangedFiles:
+    def test_changed(self, resources):
+        role_path = Path(resources, "roles", "with_include")
+        init_repository(resources)
+
+        assert set() == changed_files("HEAD", role_path)
+
+        Path(role_path, "templates", "bar.j2").write_text("bar", encoding="utf-8")
+        Path(role_path, "templates", "new.j2").write_text("new", encoding="utf-8")
+        Path(role_path, "templates_tests", "baz").unlink()
+        Path(resources, "roles", "with_defaults", "templates", "foo.j2").unlink()
+
+        actual = changed_files("HEAD", role_path)
+        expect = {
+            Path("templates", "bar.j2"),
+            Path("templates", "new.j2"),
+            Path("templates_tests", "baz"),
+        }
+        assert expect == actual
+
+    def test_invalid_ref(self, resources):
+        init_repository(resources)
+
+        with raises(GitError):
+            changed_files("no-such-ref", resources)
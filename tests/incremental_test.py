@@ -0,0 +1,110 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+
+from templtest.incremental import Fingerprinter, Incremental
+
+
+class TestFingerprinter:
+    def test_stable(self, resources, create_test):
+        role_path = Path(resources, "roles", "with_include")
+        test = create_test(role_path=role_path, inventory="inventory.yml")
+
+        expect = Fingerprinter(role_path).fingerprint(test)
+        actual = Fingerprinter(role_path).fingerprint(test)
+        assert expect == actual
+
+    def test_role_path_independent(self, resources, tmp_path, create_test):
+        role_path = Path(resources, "roles", "with_include")
+        expect = Fingerprinter(role_path).fingerprint(
+            create_test(role_path=role_path, inventory="inventory.yml")
+        )
+
+        role_path = role_path.rename(Path(tmp_path, "role"))
+        actual = Fingerprinter(role_path).fingerprint(
+            create_test(role_path=role_path, inventory="inventory.yml")
+        )
+        assert expect == actual
+
+    def test_changed_inputs(self, resources, create_test):
+        role_path = Path(resources, "roles", "with_include")
+        fingerprints = {
+            Fingerprinter(role_path).fingerprint(
+                create_test(role_path=role_path, inventory="inventory.yml")
+            )
+        }
+
+        for path, text in [
+            (Path(role_path, "defaults", "main.yml"), "foo: defaults\n"),
+            (Path(role_path, "templates_tests", "inventory.yml"), "foo: inventory\n"),
+            (Path(role_path, "templates", "bar.j2"), "changed"),
+            (Path(role_path, "templates_tests", "foo"), "changed"),
+        ]:
+            path.write_text(text, encoding="utf-8")
+            # Role variables are kept by the renderer of the test.
+            fingerprints.add(
+                Fingerprinter(role_path).fingerprint(
+                    create_test(role_path=role_path, inventory="inventory.yml")
+                )
+            )
+
+        assert 5 == len(fingerprints)
+
+    def test_unused_variables(self, resources, create_test):
+        role_path = Path(resources, "roles", "with_include")
+        expect = Fingerprinter(role_path).fingerprint(
+            create_test(role_path=role_path, inventory="inventory.yml")
+        )
+
+        Path(role_path, "defaults", "main.yml").write_text(
+            "foo: bar\nunused: changed\n", encoding="utf-8"
+        )
+        actual = Fingerprinter(role_path).fingerprint(
+            create_test(role_path=role_path, inventory="inventory.yml")
+        )
+        assert expect == actual
+
+    def test_unknown_variables(self, resources, create_test):
+        role_path = Path(resources, "roles", "with_include")
+        Path(role_path, "templates", "bar.j2").write_text(
+            "{{ vars['foo'] }}", encoding="utf-8"
+        )
+        expect = Fingerprinter(role_path).fingerprint(
+            create_test(role_path=role_path, inventory="inventory.yml")
+        )
+
+        Path(role_path, "defaults", "main.yml").write_text(
+            "foo: bar\nunused: changed\n", encoding="utf-8"
+        )
+        actual = Fingerprinter(role_path).fingerprint(
+            create_test(role_path=role_path, inventory="inventory.yml")
+        )
+        assert expect != actual
+
+
+class TestIncremental:
+    def test_record(self, resources, create_test):
+        role_path = Path(resources, "roles", "with_include")
+        test = create_test(role_path=role_path, inventory="inventory.yml")
+        incremental = Incremental(role_path, None)
+
+        assert not incremental.is_unchanged(test)
+        incremental.record(test, passed=True)
+        assert incremental.is_unchanged(test)
+        incremental.record(test, passed=False)
+        assert {} == incremental.fingerprints
+        assert not incremental.is_unchanged(test)
@@ -0,0 +1,48 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+
+from templtest.lastfailed import LastFailed
+
+
+class TestLastFailed:
+    def test_record(self, create_test):
+        last_failed = LastFailed()
+        first = create_test("foo", src_path="subdir/test.yml")
+        second = create_test("bar", src_path="subdir/test.yml")
+
+        last_failed.record(first, False)
+        last_failed.record(second, False)
+        assert {"subdir/test.yml": ["bar", "foo"]} == last_failed.failed
+        assert last_failed.has_file(Path("subdir", "test.yml"))
+        assert not last_failed.has_file(Path("test.yml"))
+        assert last_failed.is_failed(first)
+
+        last_failed.record(first, True)
+        assert not last_failed.is_failed(first)
+        last_failed.record(second, True)
+        assert {} == last_failed.failed
+
+    def test_select(self, create_test):
+        tests = [create_test(name) for name in ["foo", "bar", "baz"]]
+        last_failed = LastFailed({"test.yml": ["baz", "bar"]})
+
+        actual = [test.name for test in last_failed.select(tests)]
+        assert ["bar", "baz"] == actual
+
+        actual = [test.name for test in last_failed.failed_first(tests)]
+        assert ["bar", "baz", "foo"] == actual
@@ -0,0 +1,100 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from importlib import reload
+from importlib.util import find_spec
+from pathlib import Path
+from textwrap import dedent
+
+import yaml
+from pytest import raises
+
+from templtest import loader
+
+DOCUMENT = dedent(
+    """\
+    ---
+    string: foo
+    quoted: "1.0"
+    integer: 42
+    octal: 0o17
+    float: 1.5e3
+    booleans: [yes, no, true, False, on]
+    "null": ~
+    date: 2023-01-31
+    timestamp: 2023-01-31T12:00:00Z
+    anchor: &anchor
+      nested: {a: 1, b: [1, 2]}
+    alias: *anchor
+    merge:
+      <<: *anchor
+      extra: bar
+    literal: |
+      line 1
+      line 2
+    folded: >
+      folded
+      text
+    unicode: "\\u00e9t\\u00e9"
+    """
+)
+
+
+def test_same_document():
+    assert yaml.load(DOCUMENT, Loader=yaml.SafeLoader) == loader.safe_load(DOCUMENT)
+
+
+def test_error():
+    with raises(yaml.YAMLError):
+        loader.safe_load("foo: [bar")
+
+
+def test_fallback(monkeypatch):
+    monkeypatch.delattr(yaml, "CSafeLoader", raising=False)
+    try:
+        reload(loader)
+        assert not loader.LIBYAML
+        assert loader.SafeLoader is yaml.SafeLoader
+        assert yaml.load(DOCUMENT, Loader=yaml.SafeLoader) == loader.safe_load(DOCUMENT)
+    finally:
+        monkeypatch.undo()
+        reload(loader)
+
+
+class TestLoadFile:
+    def test_json(self, tmp_path):
+        path = Path(tmp_path, "vars.json")
+        path.write_text('{"foo": ["bar", 1, null]}', encoding="utf-8")
+
+        assert {"foo": ["bar", 1, None]} == loader.load_file(path)
+
+    def test_yaml(self, tmp_path):
+        for name in ["vars.yml", "vars.yaml", "vars"]:
+            path = Path(tmp_path, name)
+            path.write_text("foo: [bar, 1, ~]\n", encoding="utf-8")
+
+            assert {"foo": ["bar", 1, None]} == loader.load_file(path)
+
+    def test_msgpack(self, tmp_path):
+        path = Path(tmp_path, "vars.msgpack")
+        # {"foo": ["bar", 1, None]}
+        path.write_bytes(bytes.fromhex("81a3666f6f93a362617201c0"))
+
+        if find_spec("msgpack") is None:
+            with raises(ModuleNotFoundError):
+                loader.load_file(path)
+        else:
+            assert {"foo": ["bar", 1, None]} == loader.load_file(path)
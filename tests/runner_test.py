@@ -0,0 +1,131 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+
+from pytest import raises
+
+from templtest.exception import AssertError, TestDefinitionError
+from templtest.runner import run_tests, schedule
+from templtest.template import AnsibleTemplateRenderer
+
+
+def _create_tests(create_test, role_path, expected_results, renderer=None):
+    return [
+        create_test(
+            f"test #{idx}",
+            role_path=role_path,
+            expected_result=expected_result,
+            renderer=renderer,
+        )
+        for idx, expected_result in enumerate(expected_results)
+    ]
+
+
+class TestRunTests:
+    def test_serial(self, resources, create_test):
+        role_path = Path(resources, "roles", "with_defaults")
+        tests = _create_tests(
+            create_test, role_path, ["test_defaults/foo", "test_inventory/foo"]
+        )
+
+        results = list(run_tests(tests))
+
+        actual = [(result.test.name, result.error is None) for result in results]
+        expect = [("test #0", True), ("test #1", False)]
+        assert expect == actual
+        assert isinstance(results[1].error, AssertError)
+        assert "render" in results[1].durations
+
+    def test_deduplicated(self, resources, create_test):
+        role_path = Path(resources, "roles", "with_defaults")
+        renderer = AnsibleTemplateRenderer(role_path)
+        expected_results = ["test_defaults/foo", "test_inventory/foo"]
+        tests = _create_tests(create_test, role_path, expected_results, renderer)
+
+        results = list(run_tests(tests))
+
+        actual = [(result.error is None, result.deduplicated) for result in results]
+        assert [(True, False), (False, True)] == actual
+        assert "render" not in results[1].durations
+
+    def test_parallel_order(self, resources, create_test):
+        role_path = Path(resources, "roles", "with_defaults")
+        expected_results = ["test_defaults/foo", "test_inventory/foo"] * 5
+        tests = _create_tests(create_test, role_path, expected_results)
+
+        results = list(run_tests(tests, jobs=3))
+
+        actual = [(result.test.name, result.error is None) for result in results]
+        expect = [(f"test #{idx}", idx % 2 == 0) for idx in range(10)]
+        assert expect == actual
+        # Workers share renderers, so repeated renderings are reused.
+        assert all(
+            "render" in result.durations or result.deduplicated for result in results
+        )
+
+    def test_parallel_definition_error(self, resources, create_test):
+        role_path = Path(resources, "roles", "with_defaults")
+
+        def tests():
+            yield from _create_tests(create_test, role_path, ["test_defaults/foo"])
+            raise TestDefinitionError("invalid definition")
+
+        results = run_tests(tests(), jobs=2)
+
+        assert "test #0" == next(results).test.name
+        with raises(TestDefinitionError):
+            next(results)
+
+    def test_parallel_close(self, resources, create_test):
+        role_path = Path(resources, "roles", "with_defaults")
+        tests = _create_tests(create_test, role_path, ["test_defaults/foo"] * 20)
+
+        results = run_tests(tests, jobs=2)
+        next(results)
+        results.close()
+
+    def test_scheduled(self, resources, create_test):
+        role_path = Path(resources, "roles", "with_defaults")
+        expected_results = ["test_defaults/foo", "test_inventory/foo"] * 3
+        tests = list(_create_tests(create_test, role_path, expected_results))
+        durations = {tests[4].key: 2.0, tests[1].key: 1.0}
+
+        results = list(run_tests(tests, jobs=2, durations=durations))
+
+        actual = [(result.test.name, result.error is None) for result in results]
+        expect = [(f"test #{idx}", idx % 2 == 0) for idx in range(6)]
+        assert expect == actual
+
+    def test_scheduled_definition_error(self, resources, create_test):
+        role_path = Path(resources, "roles", "with_defaults")
+
+        def tests():
+            yield from _create_tests(create_test, role_path, ["test_defaults/foo"])
+            raise TestDefinitionError("invalid definition")
+
+        results = run_tests(tests(), jobs=2, durations={"test.yml::test #0": 1.0})
+
+        assert "test #0" == next(results).test.name
+        with raises(TestDefinitionError):
+            next(results)
+
+
+def test_schedule(create_test):
+    tests = list(_create_tests(create_test, Path("role"), ["foo"] * 5))
+    durations = {tests[3].key: 1.0, tests[1].key: 2.0, "unknown": 3.0}
+
+    assert [1, 3, 0, 2, 4] == schedule(tests, durations)
@@ -0,0 +1,84 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+
+from pytest import mark, raises
+
+from templtest.exception import SelectionError
+from templtest.selection import Expression, PathFilter
+
+
+class TestExpression:
+    @mark.parametrize(
+        "text, expect",
+        [
+            ("nginx", True),
+            ("NGINX", True),
+            ("ssl", False),
+            ("conf.j2", True),
+            ("subdir/test", True),
+            ("not ssl", True),
+            ("nginx and ssl", False),
+            ("ssl or http", True),
+            ("not (ssl or http)", False),
+            ("nginx and not ssl or ssl", True),
+            ("not not nginx", True),
+        ],
+    )
+    def test_matches(self, text, expect, create_test):
+        test = create_test(
+            "nginx http", src_path="subdir/test.yml", template="nginx.conf.j2"
+        )
+
+        assert expect == Expression(text).matches(test)
+
+    @mark.parametrize(
+        "text", ["", "and", "nginx and", "(nginx", "nginx)", "nginx ssl", "not"]
+    )
+    def test_invalid(self, text):
+        with raises(SelectionError):
+            Expression(text)
+
+
+class TestPathFilter:
+    def test_definition_paths(self, create_test):
+        path_filter = PathFilter(
+            [Path("templates_tests", "subdir"), Path("templates_tests", "test.yml")]
+        )
+
+        assert path_filter.select_file(Path("test.yml"))
+        assert path_filter.select_file(Path("subdir", "test-foo.yml"))
+        assert not path_filter.select_file(Path("test-foo.yml"))
+        assert path_filter.matches(create_test("foo", src_path="subdir/test.yml"))
+        assert not path_filter.matches(create_test("foo", src_path="test-foo.yml"))
+
+    def test_template_paths(self, create_test):
+        path_filter = PathFilter([Path("templates", "nginx")])
+
+        assert path_filter.select_file(Path("test.yml"))
+        assert path_filter.matches(create_test("foo", template="nginx/foo.j2"))
+        assert not path_filter.matches(create_test("foo"))
+
+    def test_role_path(self, create_test):
+        path_filter = PathFilter([Path(".")])
+
+        assert path_filter.select_file(Path("test.yml"))
+        assert path_filter.matches(create_test("foo"))
+
+    def test_invalid_path(self):
+        with raises(SelectionError):
+            PathFilter([Path("defaults", "main.yml")])
@@ -0,0 +1,71 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pytest import raises
+
+from templtest.shard import balance_shards, hash_shard, select_shard, Shard
+
+
+class TestShard:
+    def test_parse(self):
+        assert Shard(1, 3) == Shard.parse("1/3")
+        assert Shard(3, 3) == Shard.parse("3/3")
+
+    def test_parse_invalid(self):
+        for value in ["0/3", "4/3", "3", "1/a"]:
+            with raises(ValueError):
+                Shard.parse(value)
+
+
+def test_hash_shard(create_test):
+    tests = [create_test(f"test #{idx}") for idx in range(100)]
+
+    shards = [hash_shard(test, 4) for test in tests]
+    assert {1, 2, 3, 4} == set(shards)
+    assert shards == [hash_shard(test, 4) for test in reversed(tests)][::-1]
+    assert 3 == hash_shard(tests[0], 4)
+
+
+class TestBalanceShards:
+    def test_durations(self, create_test):
+        tests = [create_test(f"test #{idx}") for idx in range(6)]
+        durations = dict(zip((test.key for test in tests), [5, 1, 4, 2, 3, 3]))
+
+        shards = balance_shards(tests, 2, durations)
+
+        actual = [sum(durations[test.key] for test in shard) for shard in shards]
+        assert [9, 9] == actual
+        for shard in shards:
+            assert shard == [test for test in tests if test in shard]
+
+    def test_unknown_durations(self, create_test):
+        tests = [create_test(f"test #{idx}") for idx in range(7)]
+
+        shards = balance_shards(tests, 3, {})
+
+        assert [3, 2, 2] == [len(shard) for shard in shards]
+        assert sorted(tests, key=id) == sorted(sum(shards, []), key=id)
+
+
+def test_select_shard(create_test):
+    tests = [create_test(f"test #{idx}") for idx in range(20)]
+
+    for durations in [None, {tests[0].key: 10.0}]:
+        selected = [
+            list(select_shard(tests, Shard(index, 3), durations)) for index in [1, 2, 3]
+        ]
+        assert 20 == len({id(test) for shard in selected for test in shard})
+        assert 20 == sum(len(shard) for shard in selected)
@@ -0,0 +1,79 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from templtest.exception import AssertError, TestDefinitionError
+from templtest.runner import Result
+from templtest.summary import format_error, Summary
+
+
+def test_format_error():
+    exc = TestDefinitionError("foo")
+    exc.__cause__ = TestDefinitionError("bar")
+
+    actual = format_error(exc)
+    assert "TestDefinitionError: foo: bar" == actual
+
+
+def test_format_os_error():
+    exc = TestDefinitionError("foo")
+    exc.__cause__ = FileNotFoundError(2, "No such file or directory")
+
+    actual = format_error(exc)
+    assert "TestDefinitionError: foo: [Errno 2] No such file or directory" == actual
+
+
+class TestSummary:
+    def test_counts(self, create_test):
+        summary = Summary()
+        summary.add_result(Result(create_test("foo"), None))
+        summary.add_result(Result(create_test("bar"), None, cached=True))
+        summary.add_result(Result(create_test("baz"), AssertError("diff")))
+        summary.add_error(TestDefinitionError("invalid"))
+        summary.add_error(TestDefinitionError("invalid"))
+
+        assert not summary.success
+        assert not summary.exhausted
+        lines = summary.format()
+        assert [
+            "FAILED [test.yml] baz",
+            "ERROR TestDefinitionError: invalid",
+            "ERROR TestDefinitionError: invalid",
+        ] == lines[:-1]
+        assert lines[-1].startswith("1 failed, 1 passed, 1 cached, 2 errors in ")
+
+    def test_deduplicated(self, create_test):
+        summary = Summary()
+        summary.add_result(Result(create_test("foo"), None))
+        summary.add_result(Result(create_test("bar"), None, deduplicated=True))
+        summary.add_result(
+            Result(create_test("baz"), AssertError("diff"), deduplicated=True)
+        )
+
+        assert "2 renders saved by deduplication" == summary.format()[-1]
+
+    def test_empty(self):
+        summary = Summary()
+
+        assert summary.success
+        assert summary.format()[0].startswith("no tests ran in ")
+
+    def test_maxfail(self, create_test):
+        summary = Summary(maxfail=2)
+        summary.add_result(Result(create_test("foo"), AssertError("diff")))
+        assert not summary.exhausted
+
+        summary.add_error(TestDefinitionError("invalid"))
+        assert summary.exhausted
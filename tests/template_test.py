@@ -15,8 +15,44 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from pathlib import Path
+from pickle import dumps, loads
 
-from templtest.template import AnsibleTemplateRenderer, Jinja2TemplateRenderer
+from templtest.cache import Cache
+from templtest.template import (
+    AnsibleTemplateRenderer,
+    BaseTemplateRenderer,
+    Jinja2TemplateRenderer,
+)
+from templtest.timing import Timer
+
+
+class TestBaseTemplateRenderer:
+    def test_load_variables_precedence(self, resources):
+        role_path = Path(resources, "roles", "with_defaults_and_vars")
+        test_path = Path(role_path, "templates_tests", "test_extra")
+        renderer = BaseTemplateRenderer(role=role_path)
+
+        variables = renderer.load_variables(inventory=None, extra=None)
+        assert "vars" == variables["foo"]
+
+        variables = renderer.load_variables(
+            inventory=Path(test_path, "inventory.yml"),
+            extra=Path(test_path, "extra.yml"),
+        )
+        assert "extra" == variables["foo"]
+
+    def test_load_variables_snapshot(self, resources):
+        role_path = Path(resources, "roles", "with_defaults")
+        renderer = BaseTemplateRenderer(role=role_path)
+
+        variables = renderer.load_variables(inventory=None, extra=None)
+        variables["foo"] = "changed"
+        Path(role_path, "defaults", "main.yml").write_text(
+            "foo: modified\n", encoding="utf-8"
+        )
+
+        variables = renderer.load_variables(inventory=None, extra=None)
+        assert "defaults" == variables["foo"]
 
 
 class TestJinja2TemplateRenderer:
@@ -63,6 +99,22 @@ class TestJinja2TemplateRenderer:
         expect = Path(test_path, "foo").read_text(encoding="utf-8")
         assert expect == actual
 
+    def test_json_variable_definition(self, resources):
+        role_path = Path(resources, "roles", "with_json_variables")
+        test_path = Path(role_path, "templates_tests")
+        renderer = Jinja2TemplateRenderer(role=role_path)
+
+        actual = renderer.render(template=Path("foo.j2"))
+        expect = Path(test_path, "test_defaults", "foo").read_text(encoding="utf-8")
+        assert expect == actual
+
+        actual = renderer.render(
+            template=Path("foo.j2"),
+            inventory=Path(test_path, "test_inventory", "inventory.json"),
+        )
+        expect = Path(test_path, "test_inventory", "foo").read_text(encoding="utf-8")
+        assert expect == actual
+
     def test_vars_variable_definition(self, resources):
         role_path = Path(resources, "roles", "with_defaults_and_vars")
         test_path = Path(role_path, "templates_tests", "test_vars")
@@ -106,6 +158,18 @@ class TestJinja2TemplateRenderer:
         expect = Path(test_path, "foo").read_text(encoding="utf-8")
         assert expect == actual
 
+    def test_bytecode_cache(self, resources, tmp_path, parsed_templates):
+        role_path = Path(resources, "roles", "with_include")
+        cache = Cache(Path(tmp_path, "cache"))
+
+        expect = Jinja2TemplateRenderer(role_path, cache).render(Path("foo.j2"))
+        assert ["foo.j2", "bar.j2"] == parsed_templates
+
+        parsed_templates.clear()
+        actual = Jinja2TemplateRenderer(role_path, cache).render(Path("foo.j2"))
+        assert expect == actual
+        assert [] == parsed_templates
+
 
 class TestAnsibleTemplateRenderer:
     def test_without_variable_definition(self, resources):
@@ -150,6 +214,22 @@ class TestAnsibleTemplateRenderer:
         expect = Path(test_path, "foo").read_text(encoding="utf-8")
         assert expect == actual
 
+    def test_json_variable_definition(self, resources):
+        role_path = Path(resources, "roles", "with_json_variables")
+        test_path = Path(role_path, "templates_tests")
+        renderer = AnsibleTemplateRenderer(role=role_path)
+
+        actual = renderer.render(template=Path("foo.j2"))
+        expect = Path(test_path, "test_defaults", "foo").read_text(encoding="utf-8")
+        assert expect == actual
+
+        actual = renderer.render(
+            template=Path("foo.j2"),
+            inventory=Path(test_path, "test_inventory", "inventory.json"),
+        )
+        expect = Path(test_path, "test_inventory", "foo").read_text(encoding="utf-8")
+        assert expect == actual
+
     def test_vars_variable_definition(self, resources):
         role_path = Path(resources, "roles", "with_defaults_and_vars")
         test_path = Path(role_path, "templates_tests", "test_vars")
@@ -209,3 +289,196 @@ class TestAnsibleTemplateRenderer:
         )
         expect = Path(test_path, "foo.json").read_text(encoding="utf-8")
         assert expect == actual
+
+    def test_reuse(self, resources):
+        role_path = Path(resources, "roles", "with_defaults")
+        test_path = Path(role_path, "templates_tests")
+        renderer = AnsibleTemplateRenderer(role=role_path)
+
+        actual = renderer.render(
+            template=Path("foo.j2"),
+            inventory=Path(test_path, "test_inventory", "inventory.yml"),
+        )
+        expect = Path(test_path, "test_inventory", "foo").read_text(encoding="utf-8")
+        assert expect == actual
+
+        actual = renderer.render(template=Path("foo.j2"))
+        expect = Path(test_path, "test_defaults", "foo").read_text(encoding="utf-8")
+        assert expect == actual
+
+    def test_pickle_shares_renderer(self, resources):
+        role_path = Path(resources, "roles", "with_defaults")
+        renderer = AnsibleTemplateRenderer(role=role_path)
+
+        actual = loads(dumps(renderer))
+        assert actual is not renderer
+        assert actual is loads(dumps(renderer))
+
+    def test_included_template(self, resources):
+        role_path = Path(resources, "roles", "with_include")
+        test_path = Path(role_path, "templates_tests")
+
+        actual = AnsibleTemplateRenderer(role=role_path).render(template=Path("foo.j2"))
+        expect = Path(test_path, "foo").read_text(encoding="utf-8")
+        assert expect == actual
+
+    def test_jinja2_override_header(self, resources):
+        role_path = Path(resources, "roles", "jinja2_override")
+        test_path = Path(role_path, "templates_tests")
+        renderer = AnsibleTemplateRenderer(role=role_path)
+
+        expect = Path(test_path, "foo").read_text(encoding="utf-8")
+        assert expect == renderer.render(template=Path("foo.j2"))
+        assert expect == renderer.render(template=Path("foo.j2"))
+
+    def test_compiled_template_cache(self, resources, parsed_templates):
+        role_path = Path(resources, "roles", "with_include")
+        renderer = AnsibleTemplateRenderer(role=role_path)
+
+        for _ in range(3):
+            renderer.render(template=Path("foo.j2"))
+
+        # Variable usage analysis parses the templates by their paths.
+        assert ["bar.j2", "foo.j2"] == sorted(parsed_templates[:2])
+        assert [None, "bar.j2"] == parsed_templates[2:]
+
+    def test_compiled_template_cache_invalidation(self, resources):
+        role_path = Path(resources, "roles", "with_include")
+        renderer = AnsibleTemplateRenderer(role=role_path)
+
+        assert "foo = bar\n" == renderer.render(template=Path("foo.j2"))
+
+        Path(role_path, "templates", "foo.j2").write_text(
+            'foo is {% include "bar.j2" %}\n', encoding="utf-8"
+        )
+        assert "foo is bar\n" == renderer.render(template=Path("foo.j2"))
+
+    def test_deduplication(self, resources):
+        role_path = Path(resources, "roles", "with_defaults")
+        test_path = Path(role_path, "templates_tests")
+        inventory = Path(test_path, "test_inventory", "inventory.yml")
+        copy = Path(test_path, "inventory.yml")
+        copy.write_bytes(inventory.read_bytes())
+        renderer = AnsibleTemplateRenderer(role=role_path)
+
+        timer = Timer()
+        expect = renderer.render(Path("foo.j2"), inventory=inventory, timer=timer)
+        assert not timer.deduplicated
+
+        timer = Timer()
+        actual = renderer.render(Path("foo.j2"), inventory=copy, timer=timer)
+        assert expect == actual
+        assert timer.deduplicated
+
+        timer = Timer()
+        actual = renderer.render(Path("foo.j2"), extra=copy, timer=timer)
+        assert expect == actual
+        assert timer.deduplicated
+
+        copy.write_text("foo: inventory\nunused: changed\n", encoding="utf-8")
+        timer = Timer()
+        actual = renderer.render(Path("foo.j2"), inventory=copy, timer=timer)
+        assert expect == actual
+        assert timer.deduplicated
+
+        copy.write_text("foo: changed\n", encoding="utf-8")
+        timer = Timer()
+        actual = renderer.render(Path("foo.j2"), inventory=copy, timer=timer)
+        assert "changed" in actual
+        assert not timer.deduplicated
+
+
+class TestAnsibleTemplateRendererBytecodeCache:
+    def test_cache(self, resources, tmp_path, parsed_templates):
+        role_path = Path(resources, "roles", "with_include")
+        test_path = Path(role_path, "templates_tests")
+        cache = Cache(Path(tmp_path, "cache"))
+        expect = Path(test_path, "foo").read_text(encoding="utf-8")
+
+        actual = AnsibleTemplateRenderer(role_path, cache).render(Path("foo.j2"))
+        assert expect == actual
+        assert [None, "bar.j2"] == parsed_templates[2:]
+
+        parsed_templates.clear()
+        actual = AnsibleTemplateRenderer(role_path, cache).render(Path("foo.j2"))
+        assert expect == actual
+        assert ["bar.j2", "foo.j2"] == sorted(parsed_templates)
+
+    def test_jinja2_override(self, tmp_path):
+        role_path = Path(tmp_path, "role")
+        templates_path = Path(role_path, "templates")
+        templates_path.mkdir(parents=True)
+        Path(templates_path, "foo.j2").write_text(
+            '#jinja2: trim_blocks: False\n{% include "baz.j2" %}', encoding="utf-8"
+        )
+        Path(templates_path, "bar.j2").write_text(
+            '{% include "baz.j2" %}', encoding="utf-8"
+        )
+        Path(templates_path, "baz.j2").write_text(
+            "{% if true %}\nbaz\n{% endif %}\n", encoding="utf-8"
+        )
+        cache = Cache(Path(tmp_path, "cache"))
+        renderer = AnsibleTemplateRenderer(role_path, cache)
+
+        assert "\nbaz\n\n" == renderer.render(Path("foo.j2"))
+        assert "baz\n" == renderer.render(Path("bar.j2"))
+        actual = AnsibleTemplateRenderer(role_path, cache).render(Path("bar.j2"))
+        assert "baz\n" == actual
+
+    def test_template_files(self, resources, tmp_path):
+        role_path = Path(resources, "roles", "with_defaults")
+        Path(role_path, "defaults", "main.yml").write_text(
+            "foo: '{{ bar }}'\nbar: baz\n", encoding="utf-8"
+        )
+        cache = Cache(Path(tmp_path, "cache"))
+
+        assert "baz\n" == AnsibleTemplateRenderer(role_path, cache).render(
+            Path("foo.j2")
+        )
+        # Values of variables are compiled, but their bytecode is not stored.
+        assert 1 == len(list(Path(tmp_path, "cache", "bytecode").glob("*/*")))
+
+
+class TestAnsibleTemplateRendererStream:
+    def test_stream(self, resources):
+        role_path = Path(resources, "roles", "with_include")
+        test_path = Path(role_path, "templates_tests")
+        renderer = AnsibleTemplateRenderer(role=role_path)
+        chunks = []
+
+        def write(chunk):
+            chunks.append(chunk)
+            return True
+
+        assert renderer.stream(template=Path("foo.j2"), write=write) is None
+
+        expect = Path(test_path, "foo").read_text(encoding="utf-8")
+        assert expect == "".join(chunks)
+        assert expect == renderer.render(template=Path("foo.j2"))
+
+    def test_stream_stop(self, resources):
+        role_path = Path(resources, "roles", "with_defaults")
+        Path(role_path, "templates", "foo.j2").write_text(
+            "{% for n in range(100000) %}\n{{ n }}\n{% endfor %}\n", encoding="utf-8"
+        )
+        renderer = AnsibleTemplateRenderer(role=role_path)
+        chunks = []
+
+        def write(chunk):
+            chunks.append(chunk)
+            return False
+
+        assert renderer.stream(template=Path("foo.j2"), write=write) is None
+        assert 2 == len(chunks)
+        assert len("".join(chunks)) < len(renderer.render(template=Path("foo.j2")))
+
+    def test_stream_template_source(self, resources):
+        role_path = Path(resources, "roles", "with_defaults")
+        Path(role_path, "templates", "foo.j2").write_text(
+            "{{ undefined.attribute }}\n", encoding="utf-8"
+        )
+        renderer = AnsibleTemplateRenderer(role=role_path)
+
+        actual = renderer.stream(template=Path("foo.j2"), write=lambda _: True)
+        expect = "{{ undefined.attribute }}\n"
+        assert expect == actual
@@ -22,6 +22,7 @@ from pytest import raises
 from templtest.discovery import TestDefinition, Variables
 from templtest.exception import AssertError
 from templtest.test import Test
+from templtest.timing import PHASES, Timer
 
 
 class TestTest:
@@ -246,3 +247,65 @@ class TestTest:
             +bar""",
         )
         assert expect == actual
+
+    def test_timer(self, resources):
+        role_path = Path(resources, "roles", "with_defaults")
+
+        test = Test(
+            role_path=role_path,
+            src_path=Path("test.yml"),
+            testdef=TestDefinition(
+                name="test",
+                template=Path("foo.j2"),
+                variables=None,
+                expected_result=Path("test_defaults", "foo"),
+            ),
+        )
+        timer = Timer()
+        test.run(timer)
+
+        expect = set(PHASES)
+        actual = set(timer.durations)
+        assert expect == actual
+
+    def test_run_streaming(self, resources):
+        role_path = Path(resources, "roles", "with_defaults")
+
+        test = Test(
+            role_path=role_path,
+            src_path=Path("test.yml"),
+            testdef=TestDefinition(
+                name="test",
+                template=Path("foo.j2"),
+                variables=None,
+                expected_result=Path("test_defaults", "foo"),
+            ),
+        )
+        test.run_streaming()
+
+    def test_run_streaming_failure(self, resources):
+        role_path = Path(resources, "roles", "test_failure")
+
+        test = Test(
+            role_path=role_path,
+            src_path=Path("test.yml"),
+            testdef=TestDefinition(
+                name="test",
+                template=Path("foo.j2"),
+                variables=None,
+                expected_result=Path("foo"),
+            ),
+        )
+        with raises(AssertError) as excinfo:
+            test.run_streaming()
+
+        actual = excinfo.value.args[0]
+        expect = dedent(
+            """\
+            --- templates_tests/foo
+            +++ render(templates/foo.j2)
+            @@ -1 +1 @@
+            -baz
+            +bar""",
+        )
+        assert expect == actual
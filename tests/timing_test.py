@@ -0,0 +1,52 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from time import sleep
+
+from templtest.timing import add_durations, format_durations, Timer
+
+
+class TestTimer:
+    def test_measure(self):
+        timer = Timer()
+        with timer.measure("render"):
+            pass
+        with timer.measure("render"):
+            pass
+
+        assert ["render"] == list(timer.durations)
+        assert timer.durations["render"] >= 0
+
+    def test_nested(self):
+        timer = Timer()
+        with timer.measure("render"):
+            with timer.measure("compile"):
+                sleep(0.05)
+
+        assert timer.durations["compile"] >= 0.05
+        assert timer.durations["render"] < 0.05
+
+
+def test_add_durations():
+    expect = {"render": 3.0, "compile": 1.0}
+    actual = add_durations([{"render": 1.0}, {"render": 2.0, "compile": 1.0}])
+    assert expect == actual
+
+
+def test_format_durations():
+    expect = "compile 1.0000s, render 0.5000s, other 2.0000s"
+    actual = format_durations({"other": 2.0, "render": 0.5, "compile": 1.0})
+    assert expect == actual
@@ -0,0 +1,95 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import marshal
+from datetime import date
+from os import utime
+from pathlib import Path
+from time import time_ns
+
+from templtest.cache import Cache
+from templtest.varcache import VariablesCache
+
+# An hour ago.
+_PAST_NS = time_ns() - 3600 * 10**9
+
+
+def _write(path, content, mtime_ns=None):
+    path.write_text(content, encoding="utf-8")
+    if mtime_ns is not None:
+        utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def _fail(*args):
+    raise AssertionError(f"unexpected parsing: {args}")
+
+
+class TestVariablesCache:
+    def test_unchanged(self, tmp_path, monkeypatch):
+        path = Path(tmp_path, "vars.yml")
+        _write(path, "foo: bar\n", _PAST_NS)
+        cache = Cache(Path(tmp_path, "cache"))
+
+        assert {"foo": "bar"} == VariablesCache(cache).load(path)
+        assert 1 == len(list(Path(tmp_path, "cache", "variables").glob("*.marshal")))
+
+        monkeypatch.setattr("templtest.varcache.load_data", _fail)
+        assert {"foo": "bar"} == VariablesCache(cache).load(path)
+
+        # Only the modification time is changed.
+        utime(path, ns=(_PAST_NS + 1, _PAST_NS + 1))
+        assert {"foo": "bar"} == VariablesCache(cache).load(path)
+
+    def test_changed(self, tmp_path):
+        path = Path(tmp_path, "vars.yml")
+        _write(path, "foo: bar\n", _PAST_NS)
+        variables_cache = VariablesCache(Cache(Path(tmp_path, "cache")))
+        variables_cache.load(path)
+
+        _write(path, "foo: changed\n", _PAST_NS)
+        assert {"foo": "changed"} == variables_cache.load(path)
+
+    def test_racy_modification_time(self, tmp_path):
+        # The file is changed right after caching without changing its size
+        # and modification time.
+        path = Path(tmp_path, "vars.yml")
+        _write(path, "foo: bar\n")
+        mtime_ns = path.stat().st_mtime_ns
+        variables_cache = VariablesCache(Cache(Path(tmp_path, "cache")))
+        variables_cache.load(path)
+
+        _write(path, "foo: baz\n", mtime_ns)
+        assert {"foo": "baz"} == variables_cache.load(path)
+
+    def test_broken_entry(self, tmp_path):
+        path = Path(tmp_path, "vars.json")
+        _write(path, '{"foo": "bar"}', _PAST_NS)
+        cache = Cache(Path(tmp_path, "cache"))
+        VariablesCache(cache).load(path)
+
+        entry_paths = list(Path(tmp_path, "cache", "variables").glob("*.marshal"))
+        for data in [b"broken", b"", marshal.dumps({"format": 2}), marshal.dumps([])]:
+            for entry_path in entry_paths:
+                entry_path.write_bytes(data)
+            assert {"foo": "bar"} == VariablesCache(cache).load(path)
+
+    def test_unsupported_document(self, tmp_path):
+        path = Path(tmp_path, "vars.yml")
+        _write(path, "foo: 2023-01-01\n", _PAST_NS)
+        cache = Cache(Path(tmp_path, "cache"))
+
+        assert {"foo": date(2023, 1, 1)} == VariablesCache(cache).load(path)
+        assert not Path(tmp_path, "cache", "variables").exists()
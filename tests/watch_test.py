@@ -0,0 +1,122 @@
+# templtest -- a tool for testing Ansible role templates
+# Copyright (C) 2021-2023  Alexey Busygin
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+from pathlib import Path
+
+from pytest import mark, param, raises
+
+from templtest.exception import AssertError, TestDefinitionError
+from templtest.template import AnsibleTemplateRenderer
+from templtest.watch import InotifyWatcher, PollingWatcher, WatchedTests
+
+
+@mark.parametrize(
+    "watcher_class",
+    [
+        param(
+            InotifyWatcher,
+            marks=mark.skipif(sys.platform != "linux", reason="requires inotify"),
+        ),
+        PollingWatcher,
+    ],
+)
+class TestWatcher:
+    def test_modified(self, watcher_class, tmp_path):
+        path = Path(tmp_path, "foo")
+        path.write_text("foo", encoding="utf-8")
+        watcher = watcher_class([tmp_path])
+        try:
+            path.write_text("bar bar", encoding="utf-8")
+            actual = watcher.wait(timeout=5)
+        finally:
+            watcher.close()
+        assert path in actual
+
+    def test_created_in_new_directory(self, watcher_class, tmp_path):
+        path = Path(tmp_path, "subdir", "foo")
+        watcher = watcher_class([tmp_path])
+        try:
+            path.parent.mkdir()
+            path.write_text("foo", encoding="utf-8")
+            actual = watcher.wait(timeout=5)
+        finally:
+            watcher.close()
+        assert path in actual or path.parent in actual
+
+    def test_timeout(self, watcher_class, tmp_path):
+        watcher = watcher_class([tmp_path])
+        try:
+            actual = watcher.wait(timeout=0)
+        finally:
+            watcher.close()
+        assert set() == actual
+
+
+class TestWatchedTests:
+    @staticmethod
+    def create(role_path):
+        return WatchedTests(role_path, AnsibleTemplateRenderer(role_path))
+
+    def test_load(self, resources):
+        role_path = Path(resources, "roles", "with_include")
+
+        actual = [test.name for test in self.create(role_path).load()]
+        expect = ["test included template", "test template without includes"]
+        assert expect == actual
+
+    def test_update_template(self, resources):
+        role_path = Path(resources, "roles", "with_include")
+        watched = self.create(role_path)
+        watched.load()
+
+        changed = {Path(role_path, "templates", "bar.j2")}
+        actual = [test.name for test in watched.update(changed)]
+        expect = ["test included template"]
+        assert expect == actual
+
+    def test_update_role_variables(self, resources):
+        role_path = Path(resources, "roles", "with_include")
+        watched = self.create(role_path)
+        watched.load()[0].run()
+
+        defaults_path = Path(role_path, "defaults", "main.yml")
+        defaults_path.write_text("foo: changed\n", encoding="utf-8")
+        tests = watched.update({defaults_path})
+        assert 2 == len(tests)
+        with raises(AssertError):
+            tests[0].run()
+
+    def test_update_test_definitions(self, resources):
+        role_path = Path(resources, "roles", "with_include")
+        watched = self.create(role_path)
+        watched.load()
+
+        testdefs_path = Path(role_path, "templates_tests", "test-new.yml")
+        testdefs_path.write_text(
+            "tests:\n  - name: new\n    template: baz.j2\n    expected_result: baz\n",
+            encoding="utf-8",
+        )
+        actual = [test.name for test in watched.update({testdefs_path})]
+        assert ["new"] == actual
+
+        testdefs_path.write_text("tests: {}\n", encoding="utf-8")
+        with raises(TestDefinitionError):
+            watched.update({testdefs_path})
+        assert 2 == len(watched.tests)
+
+        testdefs_path.unlink()
+        assert [] == watched.update({testdefs_path})